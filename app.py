@@ -1,11 +1,21 @@
 import os
 import json
 import logging
+import pathlib
 import sqlite3
-
+import threading
+import time
+from collections import OrderedDict
+
+import bet_views
+import bet_columns
+import db_updater
+import notifications
+import profiling
+import quottery_rpc_wrapper
 from flask_cors import CORS
 from datetime import datetime, timezone
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, g, abort, request, jsonify, make_response, send_file, send_from_directory
 
 log_format = '[%(name)s][%(asctime)s] %(message)s'
 # Configure the logging module to use the custom format
@@ -22,43 +32,44 @@ NODE_IP = None
 NODE_PORT = None
 DATABASE_PATH = "."
 DATABASE_FILE = 'database.db'
-PAGINATION_THRESHOLD = 100
-
-PAGINATIONS_FILTER = [
-    "bet_id",
-    "open_date",
-    "open_time",
-    "close_date",
-    "close_time",
-    "end_date",
-    "end_time",
-    "creator",
-    "max_slot_per_option",
-    "amount_per_bet_slot",
-    "no_ops",
-    "no_options",
-    "option_desc",
-    "result",
-    "status",
-    "oracle_id",
-    "bet_desc",
-    "oracle_vote"
-]
-
-# This filter apply for containing check
-CONTAINING_FILTER = [
-    "open_date",
-    "open_time",
-    "close_date",
-    "close_time",
-    "end_date",
-    "end_time",
-    "creator",
-    "option_desc",
-    "oracle_id",
-    "bet_desc",
-    "oracle_vote"
-]
+PAGINATION_THRESHOLD = bet_views.PAGINATION_THRESHOLD
+# Maximum number of entries returned by /changes
+CHANGES_LIMIT = 1000
+# (epoch, from tick, to tick) of the archived bets requested without restricting them to some epochs or ticks
+ALL_EPOCHS = (None, None, None)
+# Pointer file written by the updater when it publishes snapshots. It contains the name of the current generation
+SNAPSHOT_POINTER_SUFFIX = '.current'
+# Directory of the responses pre-rendered by the updater, next to the database file. Disabled if empty
+ARTIFACTS_DIR = bet_views.ARTIFACTS_DIR
+PAGINATIONS_FILTER = bet_views.PAGINATIONS_FILTER
+
+# (stat of the manifest file, parsed manifest) of the last manifest read
+artifacts_manifest_cache = None
+
+# Directory of the socket notified by the updater of each committed cycle. It must be writable, unlike the database
+# folder. Only the version file written by the updater is checked if empty
+NOTIFY_DIR = ''
+commit_subscriber = None
+# Reads of the database, kept until the updater announces a new cycle
+db_cache = {}
+db_cache_version = None
+db_cache_lock = threading.Lock()
+
+# Run the updater in a background thread of the app, on an in-memory database snapshotted into DATABASE_FILE.
+# The reads never open a file, and see each cycle as soon as it is committed
+EMBEDDED_MODE = False
+
+# Lookups on the node of the bets of the creators missing from the database. Disabled if NODE_IP is not set
+QUOTTERY_LIBS = db_updater.QUOTTERY_LIBS
+CREATOR_CACHE_TTL = 300  # seconds a lookup is served before the node is asked again
+CREATOR_CACHE_SIZE = 1024  # number of creators kept
+CREATOR_REFRESH_INTERVAL = 1.0  # seconds between two lookups, for all the creators
+CREATOR_REFRESH_MAX_BETS = 64  # bet infos fetched by a single lookup
+qt = None
+# identity: (lookup time, bets), least recently used first
+creator_lookups = OrderedDict()
+creator_lookup_lock = threading.Lock()
+last_creator_refresh = 0.0
 
 BET_EXTERNAL_ASSET_DIR = "/bet_external_asset"
 ALLOWED_EXTENSIONS = {'txt', 'json'}
@@ -68,198 +79,392 @@ if not os.path.exists(BET_EXTERNAL_ASSET_DIR):
     os.makedirs(BET_EXTERNAL_ASSET_DIR)
 
 
+def resolve_database_file():
+    """ Get the database file to read, and whether it is an immutable snapshot published by the updater """
+    try:
+        with open(DATABASE_FILE + SNAPSHOT_POINTER_SUFFIX) as f:
+            snapshot_name = f.read().strip()
+    except FileNotFoundError:
+        return DATABASE_FILE, False
+
+    if not snapshot_name:
+        return DATABASE_FILE, False
+    return os.path.join(os.path.dirname(DATABASE_FILE), snapshot_name), True
+
+
+def database_available():
+    if EMBEDDED_MODE:
+        return db_updater.published_memory_database is not None
+    return os.path.isfile(DATABASE_FILE)
+
+
+def connect_db():
+    """ Open a read-only connection to the last complete cycle written by the updater """
+    if EMBEDDED_MODE:
+        conn = db_updater.connect_published_memory_database(factory=profiling.connection_factory())
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    database_file, immutable = resolve_database_file()
+    uri = pathlib.Path(os.path.abspath(database_file)).as_uri() + '?mode=ro'
+    if immutable:
+        # Snapshots are never written again. No locking is needed to read them
+        uri += '&immutable=1'
+    conn = sqlite3.connect(uri, uri=True, factory=profiling.connection_factory())
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def pagination_filter(bets_list):
-    filtered_bets = bets_list
-    for pagin in PAGINATIONS_FILTER:
-        pagin_filter = request.args.get(pagin)
-        if pagin_filter:
-            # This only checks for containing
-            if pagin in CONTAINING_FILTER:
-                filtered_bets = list(filter(lambda p: pagin_filter in p[pagin], filtered_bets))
-            else:  # Check for match all
-                filtered_bets = list(filter(lambda p: str(p[pagin]) == pagin_filter, filtered_bets))
+# Get the data with pargination for the http request
+def apply_pagination(bets_list):
+    return bet_views.apply_pagination(bets_list, request.args, PAGINATION_THRESHOLD)
 
-    return filtered_bets
 
+def load_artifacts_manifest():
+    """ Manifest of the responses pre-rendered by the updater. It is parsed again only when the updater replaces it """
+    global artifacts_manifest_cache
+    manifest_file = os.path.join(ARTIFACTS_DIR, bet_views.ARTIFACTS_MANIFEST)
+    try:
+        stat = os.stat(manifest_file)
+    except OSError:
+        return None
+
+    stat_key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    cached = artifacts_manifest_cache
+    if cached and cached[0] == stat_key:
+        return cached[1]
+    try:
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Artifacts manifest is not readable: {e}")
+        return None
+    artifacts_manifest_cache = (stat_key, manifest)
+    return manifest
+
+
+def send_artifact(key):
+    """ Reply with the file pre-rendered by the updater for a request without params. None if there is none """
+    if not ARTIFACTS_DIR or request.args or app.debug:
+        return None
+    manifest = load_artifacts_manifest()
+    if not manifest or manifest.get('page_size') != PAGINATION_THRESHOLD:
+        return None
+    artifact = manifest['artifacts'].get(key)
+    if not artifact:
+        return None
+    # A bet changed of view since the file was rendered
+    if artifact['valid_until'] is not None and time.time() >= artifact['valid_until']:
+        return None
+
+    gzipped = request.accept_encodings['gzip'] > 0
+    artifact_file = os.path.abspath(os.path.join(ARTIFACTS_DIR, artifact['gzip' if gzipped else 'file']))
+    try:
+        # The file is streamed by the server, with sendfile when it supports it
+        response = send_file(artifact_file, mimetype='application/json')
+    except OSError:
+        # Removed by the updater since the manifest was read
+        return None
+    if gzipped:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def start_request_profile():
+    g.profiler = profiling.start_profile(profiling.PROFILE_SAMPLE_RATE)
+    g.request_start = time.perf_counter()
+
+
+def stop_request_profile(exception):
+    profiler = g.pop('profiler', None)
+    if profiler:
+        profiling.stop_profile(profiler, 'request', request.endpoint or 'unknown',
+                               time.perf_counter() - g.request_start, profiling.PROFILE_SLOW_REQUEST)
+
+
+def drop_db_cache(version, tick_number):
+    global db_cache_version
+    with db_cache_lock:
+        db_cache.clear()
+        db_cache_version = version
+
+
+def cached_read(key, read):
+    """ Result of read() for the last cycle committed by the updater. It is only read again after the next one """
+    global db_cache_version
+    version = commit_subscriber.current_version() if commit_subscriber else None
+    if version is None:
+        return read()
+    with db_cache_lock:
+        if db_cache_version != version:
+            db_cache.clear()
+            db_cache_version = version
+        elif key in db_cache:
+            return db_cache[key]
+    value = read()
+    with db_cache_lock:
+        # Not kept if a new cycle was announced meanwhile
+        if db_cache_version == version:
+            db_cache[key] = value
+    return value
+
+
+# Settled bets are moved into the cold tables by the updater. They are only read when requested
+def include_archived_requested():
+    return request.args.get('include_archived', '').lower() in ('1', 'true', 'yes')
+
+
+def archive_range_requested():
+    """ (epoch, from tick, to tick) the archived bets are restricted to. Each is None if not requested """
+    values = []
+    for name in ('epoch', 'from_tick', 'to_tick'):
+        value = request.args.get(name)
+        try:
+            values.append(int(value) if value is not None else None)
+        except ValueError:
+            abort(make_response(jsonify({"error": f"{name} must be an integer."}), 400))
+    return tuple(values)
+
+
+def select_epoch_shards(cursor, archive_range):
+    """
+    Route an archive range to the epoch shards registered by the updater.
+
+    :return: The shard files, most recent epoch first, and whether the cold tables of the database (the bets archived
+             during the current epoch) are in the range.
+    """
+    epoch, from_tick, to_tick = archive_range
+    query = 'SELECT file_name FROM epoch_shards WHERE 1'
+    params = []
+    if epoch is not None:
+        query += ' AND epoch = ?'
+        params.append(epoch)
+    if from_tick is not None:
+        query += ' AND last_tick >= ?'
+        params.append(from_tick)
+    if to_tick is not None:
+        query += ' AND first_tick <= ?'
+        params.append(to_tick)
+    database_dir = os.path.dirname(os.path.abspath(DATABASE_FILE))
+    try:
+        cursor.execute(query + ' ORDER BY epoch DESC', params)
+        shard_files = [os.path.join(database_dir, row[0]) for row in cursor.fetchall()]
+    except sqlite3.OperationalError:
+        # Not migrated to the version 3.1 by the updater yet. There is no shard
+        shard_files = []
+
+    current_epoch, initial_tick = cursor.execute('SELECT epoch, initial_tick FROM tick_info').fetchone()
+    include_current = (epoch is None or epoch == current_epoch) and (to_tick is None or to_tick >= initial_tick)
+    return shard_files, include_current
 
-def pagination_page(bets_list, page, page_size):
-    filtered_bets = bets_list
 
-    # Pagination
-    start = (page - 1) * page_size
-    end = start + page_size
-    paginated_bets = filtered_bets[start:end]
+def read_epoch_shard(conn, shard_file, query, params=()):
+    """ Rows of a query on the schema shard, attached to the shard file. Empty if the shard can not be opened """
+    uri = pathlib.Path(shard_file).as_uri() + '?mode=ro&immutable=1'
+    try:
+        conn.execute('ATTACH DATABASE ? AS shard', (uri,))
+    except sqlite3.OperationalError as e:
+        logger.warning(f"Epoch shard {shard_file} is not readable: {e}")
+        return []
+    try:
+        return conn.execute(query, params).fetchall()
+    finally:
+        conn.execute('DETACH DATABASE shard')
 
-    return paginated_bets
 
+def read_archived(conn, rows, archive_range, query, params=(), order_by=('bet_id',)):
+    """
+    Add the archived bets of a range to the rows read from the hot tables, in the read transaction opened on conn.
+    The transaction is closed, as the shards can not be attached within it. They are never written again, so they
+    stay consistent with what was read.
 
-# Get the data with pargination for the http request
-def apply_pagination(bets_list):
-    # Get pagination parameters
-    page = int(request.args.get('page', 1))
-    page_size = int(request.args.get('page_size', PAGINATION_THRESHOLD))
-
-    # Filter
-    filtered_bets = pagination_filter(bets_list)
-
-    # Get the result with pagination
-    if len(filtered_bets) > page_size:
-        total_records = len(filtered_bets)
-        paginated_bets = pagination_page(filtered_bets, page, page_size)
-        ret = {
-            'bet_list': paginated_bets,
-            'page': {
-                "current_records": len(paginated_bets),
-                "total_records": total_records,
-                "current_page": page,
-                "page_size": page_size,
-                "total_pages": (total_records + page_size - 1) // page_size  # Calculate total pages
-            }
-        }
-    else:
-        ret = {
-            'bet_list': filtered_bets,
-            'page': {
-                "current_records": len(filtered_bets),
-                "total_records": len(filtered_bets),
-                "current_page": 1,
-                "page_size": len(filtered_bets),
-                "total_pages": 1
-            }
-        }
-    return ret
+    :param query: Query on the cold tables, with {schema} in place of the schema name.
+    :return: The rows sorted by the order_by columns. A bet is only kept from the most recent source holding it.
+    """
+    cursor = conn.cursor()
+    shard_files, include_current = select_epoch_shards(cursor, archive_range)
+    sources = [rows]
+    if include_current:
+        sources.append(cursor.execute(query.format(schema='main'), params).fetchall())
+    conn.commit()
+    for shard_file in shard_files:
+        sources.append(read_epoch_shard(conn, shard_file, query.format(schema='shard'), params))
+
+    merged = []
+    seen_bet_ids = set()
+    for source in sources:
+        merged.extend(row for row in source if row['bet_id'] not in seen_bet_ids)
+        seen_bet_ids.update(row['bet_id'] for row in source)
+    merged.sort(key=lambda row: tuple(row[column] for column in order_by))
+    return merged
 
 
 def get_bets_base():
-    if not os.path.isfile(DATABASE_FILE):
+    if not database_available():
         logger.warning(f"No database found at {DATABASE_FILE}. Please wait...")
         return jsonify({'bet_list': [], 'node_info': []})
 
-    conn = sqlite3.connect(DATABASE_FILE)
-    conn.row_factory = sqlite3.Row
+    include_archived = include_archived_requested()
+    archive_range = archive_range_requested() if include_archived else None
+    return cached_read(('bets', include_archived, archive_range), lambda: read_bets(include_archived, archive_range))
+
+
+def read_bets(include_archived, archive_range=ALL_EPOCHS):
+    conn = connect_db()
     cursor = conn.cursor()
+    # Read the bets and the node info from the same committed cycle
+    cursor.execute('BEGIN')
     cursor.execute('SELECT * FROM quottery_info')
     rows = cursor.fetchall()
-    conn.close()
 
-    # Convert rows to a list of dictionaries
-    bets_list = [dict(row) for row in rows]
-
-    conn = sqlite3.connect(DATABASE_FILE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
     cursor.execute('SELECT * FROM node_basic_info')
     node_basic_info_rows = cursor.fetchall()
+    if include_archived:
+        rows = read_archived(conn, rows, archive_range, 'SELECT * FROM {schema}.quottery_info_archive')
     conn.close()
 
+    # Convert rows to a list of dictionaries, with the packed columns as JSON texts
+    bets_list = [bet_columns.decode_bet(dict(row)) for row in rows]
+
     node_info = [dict(row) for row in node_basic_info_rows]
 
     return bets_list, node_info
 
 
-def fetch_tick_info():
-    if not os.path.isfile(DATABASE_FILE):
-        logger.warning(f"No database found at {DATABASE_FILE}. Please wait...")
-        return {}
+def is_identity(identity):
+    return len(identity) == quottery_rpc_wrapper.IDENTITY_LENGTH and identity.isascii() and identity.isalpha() \
+        and identity.isupper()
 
-    conn = sqlite3.connect(DATABASE_FILE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM tick_info')
-    row = cursor.fetchone()
-    conn.close()
 
-    if not row:
-        logger.warning(f"DB Tick info is empty. Please wait...")
-        return {}
+def fetch_creator_bets(identity):
+    """
+    Get the bets of a creator through the creator index.
 
-    # Convert rows to a list of dictionaries
-    return dict(row)
+    :return: The bets, the node info, and whether the creator has any bet in the database, archived ones included.
+    """
+    include_archived = include_archived_requested()
+    archive_range = archive_range_requested() if include_archived else None
+    return cached_read(('creator', identity, include_archived, archive_range),
+                       lambda: read_creator_bets(identity, include_archived, archive_range))
 
 
-def filter_active_bets(bets_list):
-    # Active bet is the bet that doesn't have the result
-    filtered_bets = list(filter(lambda p: p['result'] < 0, bets_list))
+def read_creator_bets(identity, include_archived, archive_range=ALL_EPOCHS):
+    conn = connect_db()
+    cursor = conn.cursor()
+    cursor.execute('BEGIN')
+    cursor.execute('SELECT * FROM quottery_info WHERE creator = ? ORDER BY bet_id', (identity,))
+    rows = cursor.fetchall()
 
-    # Check the closed date and close time
-    current_utc_date = datetime.now(timezone.utc)
-    active_bets = []
-    for bet in filtered_bets:
-        active_flag = False
-        # Combine the date and time strings and parse them into a datetime object
-        closed_datetime_str = bet['close_date'] + ' ' + bet['close_time']
-        try:
-            closed_datetime = datetime.strptime(closed_datetime_str, '%y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-            active_flag = current_utc_date < closed_datetime
-        except Exception as e:
-            logger.warning(f"Date time format is not correct. Will not use for filtering active/inactive: {e}")
+    cursor.execute('SELECT * FROM node_basic_info')
+    node_basic_info_rows = cursor.fetchall()
+    if include_archived:
+        rows = read_archived(conn, rows, archive_range,
+                             'SELECT * FROM {schema}.quottery_info_archive WHERE creator = ?', (identity,))
+    known = bool(rows)
+    if not known:
+        # Archived in any epoch
+        known = bool(read_archived(conn, [], ALL_EPOCHS,
+                                   'SELECT * FROM {schema}.quottery_info_archive WHERE creator = ? LIMIT 1',
+                                   (identity,)))
+    conn.close()
 
-        if active_flag:
-            active_bets.append(bet)
+    return [bet_columns.decode_bet(dict(row)) for row in rows], [dict(row) for row in node_basic_info_rows], known
 
-    return active_bets
 
+def lookup_creator_bets(identity):
+    """
+    Get the bets of a creator from the node. The lookups are cached for CREATOR_CACHE_TTL, and the node is asked
+    at most once every CREATOR_REFRESH_INTERVAL.
 
-def filter_locked_bets(bets_list):
-    # Check the closed/end date and close/end time
-    current_utc_date = datetime.now(timezone.utc)
-    locked_bets = []
-    for bet in bets_list:
-        locked_flag = False
-        closed_datetime_str = bet['close_date'] + ' ' + bet['close_time']
-        end_datetime_str = bet['end_date'] + ' ' + bet['end_time']
+    :return: The bets, formatted as the rows of quottery_info. None if the lookup is rate limited or failed.
+    """
+    global last_creator_refresh
+    with creator_lookup_lock:
+        now = time.monotonic()
+        cached = creator_lookups.get(identity)
+        if cached and now - cached[0] < CREATOR_CACHE_TTL:
+            creator_lookups.move_to_end(identity)
+            return cached[1]
+        if now - last_creator_refresh < CREATOR_REFRESH_INTERVAL:
+            return None
+        last_creator_refresh = now
 
-        try:
-            closed_datetime = datetime.strptime(closed_datetime_str, '%y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-            end_datetime = datetime.strptime(end_datetime_str, '%y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-            locked_flag = closed_datetime <= current_utc_date < end_datetime
-        except Exception as e:
-            logger.warning(f"Date time format is not correct. Will not use for filtering active/inactive: {e}")
+    bets = []
+    try:
+        sts, bet_ids = qt.get_bets_by_creator(identity)
+        if sts:
+            return None
+        for bet_id in bet_ids[:CREATOR_REFRESH_MAX_BETS]:
+            sts, bet_info = qt.get_bet_info(bet_id)
+            if sts:
+                return None
+            qt.decide_bet_result(bet_info)
+            bet = bet_columns.decode_bet(
+                dict(zip(db_updater.QUOTTERY_INFO_COLUMNS, db_updater.make_quottery_info_row(bet_info))))
+            # Converted as by the TEXT column of the database
+            bet['current_total_qus'] = str(bet['current_total_qus'])
+            bets.append(bet)
+    except Exception as e:
+        logger.warning(f"Error looking up the bets of creator {identity}: {e}")
+        return None
+
+    with creator_lookup_lock:
+        creator_lookups[identity] = (time.monotonic(), bets)
+        creator_lookups.move_to_end(identity)
+        while len(creator_lookups) > CREATOR_CACHE_SIZE:
+            creator_lookups.popitem(last=False)
+    return bets
 
-        if locked_flag:
-            locked_bets.append(bet)
 
-    return locked_bets
+def fetch_tick_info():
+    if not database_available():
+        logger.warning(f"No database found at {DATABASE_FILE}. Please wait...")
+        return {}
 
+    return cached_read(('tick_info',), read_tick_info)
 
-def filter_inactive_bets(bets_list):
-    current_utc_date = datetime.now(timezone.utc)
-    inactive_bets = []
-    for bet in bets_list:
-        inactive_flag = False
 
-        # Inactive bet is a bet that has result
-        if bet['result'] >= 0:
-            inactive_flag = True
-        else:  # Check the end date and close time
-            end_datetime_str = bet['end_date'] + ' ' + bet['end_time']
-            try:
-                end_datetime = datetime.strptime(end_datetime_str, '%y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-                inactive_flag = end_datetime <= current_utc_date
-            except Exception as e:
-                logger.warning(f"Date time format is not correct. Will not use for filtering active/inactive: {e}")
+def read_tick_info():
+    conn = connect_db()
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM tick_info')
+    row = cursor.fetchone()
+    conn.close()
 
-        if inactive_flag:
-            inactive_bets.append(bet)
+    if not row:
+        logger.warning(f"DB Tick info is empty. Please wait...")
+        return {}
 
-    return inactive_bets
+    # Convert rows to a list of dictionaries
+    return dict(row)
 
 
 def get_bet_options_detail():
-    if not os.path.isfile(DATABASE_FILE):
+    if not database_available():
         logger.warning(f"No database find ${DATABASE_FILE}. Please wait...")
         return jsonify({'bets_options_detail': []})
 
-    conn = sqlite3.connect(DATABASE_FILE)
-    conn.row_factory = sqlite3.Row
+    include_archived = include_archived_requested()
+    archive_range = archive_range_requested() if include_archived else None
+    return cached_read(('options', include_archived, archive_range),
+                       lambda: read_bet_options_detail(include_archived, archive_range))
+
+
+def read_bet_options_detail(include_archived, archive_range=ALL_EPOCHS):
+    conn = connect_db()
     cursor = conn.cursor()
+    cursor.execute('BEGIN')
     cursor.execute('SELECT * FROM bet_options_detail')
     rows = cursor.fetchall()
+    if include_archived:
+        rows = read_archived(conn, rows, archive_range, 'SELECT * FROM {schema}.bet_options_detail_archive',
+                             order_by=('bet_id', 'option_id'))
     conn.close()
 
     # Convert rows to a list of dictionaries
@@ -270,6 +475,10 @@ def get_bet_options_detail():
 
 @app.route('/get_all_bets', methods=['GET'])
 def get_all_bets():
+    artifact = send_artifact('get_all_bets')
+    if artifact:
+        return artifact
+
     bets_list, node_info = get_bets_base()
 
     # Apply pagination
@@ -284,9 +493,13 @@ def get_all_bets():
 
 @app.route('/get_active_bets', methods=['GET'])
 def get_active_bets():
+    artifact = send_artifact('get_active_bets')
+    if artifact:
+        return artifact
+
     bets_list, node_info = get_bets_base()
 
-    active_bets = filter_active_bets(bets_list=bets_list)
+    active_bets = bet_views.filter_active_bets(bets_list=bets_list)
 
     # Apply pagination
     ret = apply_pagination(active_bets)
@@ -300,9 +513,13 @@ def get_active_bets():
 
 @app.route('/get_locked_bets', methods=['GET'])
 def get_locked_bets():
+    artifact = send_artifact('get_locked_bets')
+    if artifact:
+        return artifact
+
     bets_list, node_info = get_bets_base()
 
-    locked_bets = filter_locked_bets(bets_list=bets_list)
+    locked_bets = bet_views.filter_locked_bets(bets_list=bets_list)
 
     # Apply pagination
     ret = apply_pagination(locked_bets)
@@ -316,9 +533,13 @@ def get_locked_bets():
 
 @app.route('/get_inactive_bets', methods=['GET'])
 def get_inactive_bets():
+    artifact = send_artifact('get_inactive_bets')
+    if artifact:
+        return artifact
+
     bets_list, node_info = get_bets_base()
 
-    inactive_bets = filter_inactive_bets(bets_list=bets_list)
+    inactive_bets = bet_views.filter_inactive_bets(bets_list=bets_list)
 
     # Apply pagination
     ret = apply_pagination(inactive_bets)
@@ -330,6 +551,30 @@ def get_inactive_bets():
     return jsonify(ret)
 
 
+@app.route('/get_bets_by_creator/<identity>', methods=['GET'])
+def get_bets_by_creator(identity):
+    if not is_identity(identity):
+        return jsonify({"error": "Invalid identity."}), 400
+    if not database_available():
+        logger.warning(f"No database found at {DATABASE_FILE}. Please wait...")
+        return jsonify({'bet_list': [], 'node_info': []})
+
+    bets_list, node_info, known = fetch_creator_bets(identity)
+
+    # The creators not seen by the updater yet are looked up on the node
+    if not known and qt is not None:
+        bets_list = lookup_creator_bets(identity) or []
+
+    # Apply pagination
+    ret = apply_pagination(bets_list)
+
+    # Add the node info
+    ret['node_info'] = node_info
+
+    # Reply with json
+    return jsonify(ret)
+
+
 @app.route('/get_available_filters', methods=['GET'])
 def get_filter():
     # Add the node info
@@ -353,6 +598,10 @@ def get_bet_options():
 
 @app.route('/get_tick_info', methods=['GET'])
 def get_tick_info():
+    artifact = send_artifact('get_tick_info')
+    if artifact:
+        return artifact
+
     tick_info = fetch_tick_info()
     # Add the node info
     ret = {'tick_info': tick_info}
@@ -361,6 +610,58 @@ def get_tick_info():
     return jsonify(ret)
 
 
+def fetch_changes(since, since_tick, limit):
+    conn = connect_db()
+    cursor = conn.cursor()
+    # Read the entries and the last sequence from the same committed cycle
+    cursor.execute('BEGIN')
+    cursor.execute('''
+        SELECT seq, tick_number, bet_id, option_id, change_type, payload
+        FROM bet_changes
+        WHERE seq > ? AND tick_number > ?
+        ORDER BY seq
+        LIMIT ?''', (since, since_tick, limit + 1))
+    rows = cursor.fetchall()
+    cursor.execute('SELECT MAX(seq) FROM bet_changes')
+    latest_sequence = cursor.fetchone()[0] or 0
+    conn.close()
+
+    changes = []
+    for row in rows[:limit]:
+        change = dict(row)
+        change['payload'] = json.loads(change['payload'])
+        changes.append(change)
+    return changes, len(rows) > limit, latest_sequence
+
+
+@app.route('/changes', methods=['GET'])
+def get_changes():
+    if not database_available():
+        logger.warning(f"No database found at {DATABASE_FILE}. Please wait...")
+        return jsonify({'changes': [], 'last_sequence': 0, 'latest_sequence': 0, 'has_more': False})
+
+    try:
+        since = int(request.args.get('since', 0))
+        since_tick = int(request.args.get('since_tick', -1))
+        limit = min(int(request.args.get('limit', CHANGES_LIMIT)), CHANGES_LIMIT)
+    except ValueError:
+        return jsonify({"error": "since, since_tick and limit must be integers."}), 400
+    if limit <= 0:
+        return jsonify({"error": "limit must be positive."}), 400
+
+    changes, has_more, latest_sequence = fetch_changes(since, since_tick, limit)
+    ret = {
+        'changes': changes,
+        # Sequence to pass as since in the next request
+        'last_sequence': changes[-1]['seq'] if changes else max(since, 0),
+        'latest_sequence': latest_sequence,
+        'has_more': has_more
+    }
+
+    # Reply with json
+    return jsonify(ret)
+
+
 @app.route("/upload", methods=["POST"])
 def upload_asset():
     data = request.get_json()
@@ -409,16 +710,51 @@ if __name__ == '__main__':
         DATABASE_PATH = os.getenv('DATABASE_PATH')
 
     DATABASE_FILE = os.path.join(DATABASE_PATH, DATABASE_FILE)
+    ARTIFACTS_DIR = os.getenv('ARTIFACTS_DIR', ARTIFACTS_DIR)
+    if ARTIFACTS_DIR:
+        ARTIFACTS_DIR = os.path.join(DATABASE_PATH, ARTIFACTS_DIR)
 
     PAGINATION_THRESHOLD = int(os.getenv('PAGINATION_THRESHOLD',
                                          PAGINATION_THRESHOLD))  # Default threshold for pagination
+    CHANGES_LIMIT = int(os.getenv('CHANGES_LIMIT', CHANGES_LIMIT))
+    NOTIFY_DIR = os.getenv('NOTIFY_DIR', NOTIFY_DIR)
+
+    NODE_IP = os.getenv('NODE_IP', NODE_IP)
+    QUOTTERY_LIBS = os.getenv('QUOTTERY_LIBS', QUOTTERY_LIBS)
+    CREATOR_CACHE_TTL = float(os.getenv('CREATOR_CACHE_TTL', CREATOR_CACHE_TTL))
+    CREATOR_CACHE_SIZE = int(os.getenv('CREATOR_CACHE_SIZE', CREATOR_CACHE_SIZE))
+    CREATOR_REFRESH_INTERVAL = float(os.getenv('CREATOR_REFRESH_INTERVAL', CREATOR_REFRESH_INTERVAL))
+    CREATOR_REFRESH_MAX_BETS = int(os.getenv('CREATOR_REFRESH_MAX_BETS', CREATOR_REFRESH_MAX_BETS))
+    if NODE_IP and os.path.isfile(QUOTTERY_LIBS):
+        qt = quottery_rpc_wrapper.QuotteryRpcWrapper(NODE_IP, QUOTTERY_LIBS, 'FLASK_RPC')
+
+    EMBEDDED_MODE = os.getenv('EMBEDDED_MODE', '').lower() in ('1', 'true', 'yes')
+    if EMBEDDED_MODE:
+        # The updater of the process reads the same environment variables as db_updater.py
+        ARTIFACTS_DIR = ''
+        commit_subscriber = notifications.Subscriber(on_change=drop_db_cache)
+        # The debug reloader runs this block in its watcher process too. Only the serving one updates
+        if not DEBUG_MODE or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            db_updater.start_embedded([commit_subscriber])
+    else:
+        # The reads of the database are cached until the updater announces a new cycle
+        commit_subscriber = notifications.Subscriber(DATABASE_FILE, NOTIFY_DIR, drop_db_cache)
+
+    # The requests are only profiled when enabled, to not slow them down otherwise
+    if profiling.configure():
+        app.before_request(start_request_profile)
+        app.teardown_request(stop_request_profile)
 
     # Print the configuration to verify
     logger.info("Launch the flask app with configurations")
     logger.info(f"- App port: {APP_PORT}")
-    logger.info(f"- Database read location: {DATABASE_FILE}")
+    logger.info(f"- Database read location: {'memory, snapshots into ' if EMBEDDED_MODE else ''}{DATABASE_FILE}")
     logger.info(f"- Debug mode: {DEBUG_MODE}")
     logger.info(f"- Pagination threshold: {PAGINATION_THRESHOLD}")
+    logger.info(f"- Pre-rendered responses: {ARTIFACTS_DIR or 'disabled'}")
+    logger.info(f"- Cycle notifications: "
+                f"{commit_subscriber.socket_file or commit_subscriber.version_file or 'embedded updater'}")
+    logger.info(f"- Creator lookups: {NODE_IP if qt is not None else 'disabled'}")
 
     # Insert the ssl crt and key here
     ssl_context = (os.getenv('CERT_PATH'), os.getenv('CERT_KEY_PATH'))
@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import base64
+import timeit
+import logging
+import argparse
+import itertools
+import tracemalloc
+
+import qtry_utils
+import mock_rpc_node
+import quottery_rpc_wrapper
+from quottery_rpc_wrapper import API_PATH, QTRY_GET_BASIC_INFO, QTRY_GET_BET_INFO, QTRY_GET_BET_OPTION_DETAIL
+
+log_format = '[%(name)s][%(asctime)s] %(message)s'
+# Configure the logging module to use the custom format
+logging.basicConfig(level=logging.INFO, format=log_format)
+logger = logging.getLogger('BENCH_DECODERS')
+
+# Init default parameters
+QUOTTERY_LIBS = 'libs/quottery_cpp/lib/libquottery_cpp.so'
+NUMBER_OF_BETS = 64  # bet infos decoded in a batch
+NUMBER_OF_OPTIONS = 8
+NUMBER_OF_BETTORS = 1024  # full option payloads
+NUMBER_OF_USERS = 2048
+REPEAT = 5  # measures of each case. The best one is kept
+TOLERANCE = 0.2  # relative slowdown or allocation growth accepted against the baseline
+
+
+def synthetic_fixtures():
+    """ Responses of the contract functions generated by the mock node, keyed by (input type, request data) """
+    quottery = mock_rpc_node.SyntheticQuottery(numberOfBets=NUMBER_OF_BETS, numberOfOptions=NUMBER_OF_OPTIONS,
+                                               numberOfBettors=NUMBER_OF_BETTORS, numberOfUsers=NUMBER_OF_USERS,
+                                               ticksPerSecond=0)
+    fixtures = {(QTRY_GET_BASIC_INFO, b''): quottery.basic_info_output()}
+    for bet_id, bet in quottery.bets.items():
+        fixtures[(QTRY_GET_BET_INFO, bet_id.to_bytes(4, byteorder='little'))] = quottery.bet_info_output(bet_id)
+        for option_id in range(len(bet['bettors'])):
+            request_data = bet_id.to_bytes(4, byteorder='little') + option_id.to_bytes(4, byteorder='little')
+            fixtures[(QTRY_GET_BET_OPTION_DETAIL, request_data)] = quottery.bet_option_detail_output(bet_id, option_id)
+    return fixtures
+
+
+def recorded_fixtures(captureFile):
+    """ Responses of the contract functions recorded by mock_rpc_node.py -upstream, keyed by (input type, request data) """
+    fixtures = {}
+    with open(captureFile) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            capture = json.loads(line)
+            request = capture.get('request')
+            if capture['path'] != API_PATH or not request or 'responseData' not in capture['response']:
+                continue
+            key = (request['inputType'], base64.b64decode(request.get('requestData') or ''))
+            fixtures[key] = base64.b64decode(capture['response']['responseData'])
+    return fixtures
+
+
+def make_cases(qt, fixtures):
+    """
+    Decoding cases of the wrapper, fed with the fixtures instead of the node.
+
+    :return: List of (name, function, items decoded per call).
+    """
+    qt.query_contract = lambda inputType, requestData=b'': fixtures.get((inputType, bytes(requestData)))
+
+    bet_infos = sorted((int.from_bytes(request_data, byteorder='little'), payload)
+                       for (input_type, request_data), payload in fixtures.items() if input_type == QTRY_GET_BET_INFO)
+    bet_ids = [bet_id for bet_id, _ in bet_infos]
+    payloads = [payload for _, payload in bet_infos]
+    # The option payload with the most bettors
+    option_request, option_payload = max(
+        ((request_data, payload) for (input_type, request_data), payload in fixtures.items()
+         if input_type == QTRY_GET_BET_OPTION_DETAIL),
+        key=lambda item: sum(qtry_utils.count_public_keys(item[1])[1]))
+    option_bet_id = int.from_bytes(option_request[:4], byteorder='little')
+    option_id = int.from_bytes(option_request[4:8], byteorder='little')
+    public_keys, _ = qtry_utils.count_public_keys(option_payload)
+    close_dates = qtry_utils.decode_bet_infos(payloads)['dateTimes'][:, 1]
+    close_date = int(close_dates[0])
+    next_bet = itertools.count()
+
+    return [
+        ('get_qtry_basic_info', qt.get_qtry_basic_info, 1),
+        ('get_bet_info', lambda: qt.get_bet_info(bet_ids[next(next_bet) % len(bet_ids)]), 1),
+        (f'decode_bet_infos[{len(bet_ids)}]', lambda: qt.decode_bet_infos(bet_ids, payloads), len(bet_ids)),
+        (f'get_bet_option_detail[{len(public_keys)}]', lambda: qt.get_bet_option_detail(option_bet_id, option_id), 1),
+        ('count_public_keys', lambda: qtry_utils.count_public_keys(option_payload), 1),
+        # The identity cache is bypassed to measure the library calls
+        (f'compute_identities[{len(public_keys)}]', lambda: qt.compute_identities(public_keys), len(public_keys)),
+        ('unpack_date', lambda: qtry_utils.unpack_date(close_date), 1),
+        (f'unpack_dates[{len(close_dates)}]', lambda: qtry_utils.unpack_dates(close_dates), len(close_dates)),
+    ]
+
+
+def measure(func, repeat):
+    """
+    Measure a decoding function.
+
+    :return: Calls per second (best of repeat), and the peak bytes allocated by a single call.
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number))
+
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return number / best, peak - base
+
+
+def run_benchmark(qt, fixtures, repeat=REPEAT):
+    measures = {}
+    for name, func, items in make_cases(qt, fixtures):
+        ops_per_second, alloc_bytes = measure(func, repeat)
+        measures[name] = {
+            'ops_per_second': ops_per_second,
+            'items_per_second': ops_per_second * items,
+            'alloc_bytes': alloc_bytes,
+        }
+    return measures
+
+
+def compare_with_baseline(measures, baseline, tolerance=TOLERANCE):
+    """ Get the regressions of the measures against a baseline, as messages """
+    regressions = []
+    for name, measure in measures.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        if measure['ops_per_second'] < reference['ops_per_second'] * (1 - tolerance):
+            regressions.append(f"{name}: {measure['ops_per_second']:.0f} ops/s, "
+                               f"baseline {reference['ops_per_second']:.0f} ops/s")
+        # Small allocations vary with the interpreter state
+        if measure['alloc_bytes'] > reference['alloc_bytes'] * (1 + tolerance) + 1024:
+            regressions.append(f"{name}: {measure['alloc_bytes']} bytes allocated, "
+                               f"baseline {reference['alloc_bytes']} bytes")
+    return regressions
+
+
+def print_report(measures, baseline=None):
+    print(f"{'decoder':<28} {'ops/s':>12} {'items/s':>12} {'alloc(B)':>10} {'vs base':>8}")
+    for name, measure in measures.items():
+        reference = (baseline or {}).get(name)
+        ratio = f"{measure['ops_per_second'] / reference['ops_per_second']:>7.2f}x" if reference else f"{'-':>8}"
+        print(f"{name:<28} {measure['ops_per_second']:>12.0f} {measure['items_per_second']:>12.0f} "
+              f"{measure['alloc_bytes']:>10} {ratio}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Micro-benchmark of the qtry RPC decoders, without any node.')
+    parser.add_argument('-libs', type=str, default=QUOTTERY_LIBS, help='Path to the quottery_cpp library')
+    parser.add_argument('-fixtures', type=str, help='Decode the responses recorded by mock_rpc_node.py -upstream '
+                                                    'instead of synthetic ones')
+    parser.add_argument('-repeat', type=int, default=REPEAT, help='Measures of each decoder, the best one is kept')
+    parser.add_argument('-baseline', type=str, help='Fail if a decoder is slower than in this json file')
+    parser.add_argument('-tolerance', type=float, default=TOLERANCE,
+                        help='Relative slowdown or allocation growth accepted against the baseline')
+    parser.add_argument('-json', type=str, help='Also write the measures into this json file, usable as a baseline')
+
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.libs):
+        logger.info(f"quottery_cpp_wrapper path NOT FOUND: {args.libs}. Exiting.")
+        sys.exit(1)
+
+    fixtures = synthetic_fixtures()
+    if args.fixtures:
+        # The synthetic responses are only kept for the functions that were not recorded
+        recorded = recorded_fixtures(args.fixtures)
+        recorded_types = {input_type for input_type, _ in recorded}
+        fixtures = {key: payload for key, payload in fixtures.items() if key[0] not in recorded_types}
+        fixtures.update(recorded)
+    # The node is never requested
+    qt = quottery_rpc_wrapper.QuotteryRpcWrapper('http://127.0.0.1:0', args.libs, 'BENCH_DECODERS')
+    measures = run_benchmark(qt, fixtures, args.repeat)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(measures, baseline)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(measures, f, indent=2)
+
+    if baseline is not None:
+        regressions = compare_with_baseline(measures, baseline, args.tolerance)
+        for regression in regressions:
+            logger.warning(f"Regression {regression}")
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,137 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+
+import db_updater
+import mock_rpc_node
+import quottery_rpc_wrapper
+
+log_format = '[%(name)s][%(asctime)s] %(message)s'
+# Configure the logging module to use the custom format
+logging.basicConfig(level=logging.INFO, format=log_format)
+logger = logging.getLogger('BENCH_UPDATER')
+
+# Init default parameters
+QUOTTERY_LIBS = db_updater.QUOTTERY_LIBS
+NUMBER_OF_CYCLES = 5
+
+
+def run_benchmark(node, libs, cycles, cold, database_file, fetchers=db_updater.PIPELINE_FETCHERS):
+    """
+    Run updater cycles against the mock node and measure them.
+
+    :param node: The running MockRpcNode.
+    :param libs: Path to the quottery_cpp library.
+    :param cycles: Number of cycles to run.
+    :param cold: Forget the state of the updater before each cycle, so every cycle refreshes everything.
+    :param database_file: SQLite file written by the updater.
+    :param fetchers: Fetcher threads of the pipelined cycle. 0 runs the stages one after another.
+    :return: List of the measures of each cycle.
+    """
+    db_updater.DATABASE_FILE = database_file
+    db_updater.NODE_IP = node.address
+    db_updater.CYCLE_TIME_BUDGET = 3600
+    db_updater.CYCLE_RPC_BUDGET = 1 << 30
+    db_updater.PIPELINE_FETCHERS = fetchers
+    db_updater.qt = quottery_rpc_wrapper.QuotteryRpcWrapper(node.address, libs, 'BENCH_UPDATER')
+    db_updater.init_db()
+
+    # Measure the database writes of the cycle. Both the sequential and the pipelined cycles write with CycleWriter
+    write_measure = {}
+    writer_methods = {name: getattr(db_updater.CycleWriter, name) for name in ('write_bets', 'write_options', 'finish')}
+
+    def timed(name, method):
+        def timed_method(self, *args):
+            start = time.perf_counter()
+            result = method(self, *args)
+            write_measure['duration'] = write_measure.get('duration', 0.0) + time.perf_counter() - start
+            if name != 'finish':
+                write_measure['rows'] = write_measure.get('rows', 0) + len(args[0])
+            return result
+        return timed_method
+
+    for name, method in writer_methods.items():
+        setattr(db_updater.CycleWriter, name, timed(name, method))
+
+    measures = []
+    try:
+        for cycle in range(cycles):
+            if cold:
+                db_updater.bet_schedule.clear()
+                db_updater.option_slot_states.clear()
+            node.get_stats(reset=True)
+            write_measure.clear()
+
+            start = time.perf_counter()
+            db_updater.run_update_cycle(node.quottery.current_tick(), full_reconcile=cold or cycle == 0)
+            duration = time.perf_counter() - start
+
+            stats = node.get_stats(reset=True)
+            write_duration = write_measure.get('duration', 0.0)
+            write_rows = write_measure.get('rows', 0)
+            measures.append({
+                'cycle': cycle,
+                'duration': duration,
+                'rpc_count': sum(stats['requests'].values()),
+                'rpc_requests': stats['requests'],
+                'bytes_received': stats['bytes'],
+                'write_duration': write_duration,
+                'write_rows': write_rows,
+                'write_rows_per_second': write_rows / write_duration if write_duration else 0.0,
+            })
+    finally:
+        for name, method in writer_methods.items():
+            setattr(db_updater.CycleWriter, name, method)
+        db_updater.close_db_connection()
+
+    return measures
+
+
+def print_report(measures):
+    print(f"{'cycle':>5} {'duration(s)':>12} {'rpc':>6} {'bytes':>10} {'write(s)':>9} {'rows':>7} {'rows/s':>10}")
+    for measure in measures:
+        print(f"{measure['cycle']:>5} {measure['duration']:>12.3f} {measure['rpc_count']:>6} "
+              f"{measure['bytes_received']:>10} {measure['write_duration']:>9.4f} {measure['write_rows']:>7} "
+              f"{measure['write_rows_per_second']:>10.0f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the qtry updater cycle against a local mock node.')
+    parser.add_argument('-libs', type=str, default=QUOTTERY_LIBS, help='Path to the quottery_cpp library')
+    parser.add_argument('-cycles', type=int, default=NUMBER_OF_CYCLES, help='Number of cycles to run')
+    parser.add_argument('-cold', action='store_true', help='Refresh all the bets and options in every cycle')
+    parser.add_argument('-bets', type=int, default=mock_rpc_node.NUMBER_OF_BETS, help='Number of active bets')
+    parser.add_argument('-options', type=int, default=mock_rpc_node.NUMBER_OF_OPTIONS, help='Options per bet')
+    parser.add_argument('-bettors', type=int, default=mock_rpc_node.NUMBER_OF_BETTORS, help='Slots per option')
+    parser.add_argument('-latency', type=float, default=mock_rpc_node.LATENCY, help='Seconds added to responses')
+    parser.add_argument('-errors', type=float, default=mock_rpc_node.ERROR_RATE, help='Server error probability')
+    parser.add_argument('-replay', type=str, help='Replay recorded responses instead of synthetic data')
+    parser.add_argument('-fetchers', type=int, default=db_updater.PIPELINE_FETCHERS,
+                        help='Fetcher threads of the pipelined cycle. 0 runs the stages one after another')
+    parser.add_argument('-json', type=str, help='Also write the measures into this json file')
+
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.libs):
+        logger.info(f"quottery_cpp_wrapper path NOT FOUND: {args.libs}. Exiting.")
+        sys.exit(1)
+
+    quottery = mock_rpc_node.SyntheticQuottery(numberOfBets=args.bets, numberOfOptions=args.options,
+                                               numberOfBettors=args.bettors)
+    node = mock_rpc_node.MockRpcNode(quottery=quottery, latency=args.latency, errorRate=args.errors,
+                                     captureFile=args.replay).start()
+    try:
+        with tempfile.TemporaryDirectory() as database_dir:
+            measures = run_benchmark(node, args.libs, args.cycles, args.cold,
+                                     os.path.join(database_dir, 'database.db'), args.fetchers)
+    finally:
+        node.stop()
+
+    print_report(measures)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(measures, f, indent=2)
@@ -0,0 +1,117 @@
+import struct
+from functools import lru_cache
+
+# Storage of the array columns of quottery_info since the version 3.0 of the database. The fixed-width arrays are
+# packed little-endian BLOBs instead of JSON texts. decode_bet converts them back into the JSON texts stored by the
+# older versions, which the API keeps serving byte for byte
+
+IDENTITY_LENGTH = 60
+DECODE_CACHE_SIZE = 4096  # distinct values of each column kept decoded. Most bets share a few states
+
+
+def pack_uint32s(values):
+    return struct.pack(f'<{len(values)}I', *values)
+
+
+def pack_int32s(values):
+    return struct.pack(f'<{len(values)}i', *values)
+
+
+def pack_float64s(values):
+    return struct.pack(f'<{len(values)}d', *values)
+
+
+def pack_identities(identities):
+    """ Identities are fixed-width uppercase ASCII. They are concatenated """
+    return ''.join(identities).encode('ascii')
+
+
+def unpack_uint32s(blob):
+    return struct.unpack(f'<{len(blob) // 4}I', blob)
+
+
+def unpack_int32s(blob):
+    return struct.unpack(f'<{len(blob) // 4}i', blob)
+
+
+def unpack_float64s(blob):
+    return struct.unpack(f'<{len(blob) // 8}d', blob)
+
+
+def compute_betting_odds(current_bet_state):
+    """ Betting odds of each option: the pool divided by the selections of the option """
+    total_selections = sum(current_bet_state)
+    if total_selections == 0:
+        return [1] * len(current_bet_state)
+    return [total_selections / selection if selection > 0 else total_selections for selection in current_bet_state]
+
+
+# The texts are built as json.dumps does for these lists, without its generic encoder
+
+@lru_cache(maxsize=DECODE_CACHE_SIZE)
+def uint32s_text(blob):
+    return '[' + ', '.join(map(str, unpack_uint32s(blob))) + ']'
+
+
+@lru_cache(maxsize=DECODE_CACHE_SIZE)
+def int32s_text(blob):
+    return '[' + ', '.join(map(str, unpack_int32s(blob))) + ']'
+
+
+@lru_cache(maxsize=DECODE_CACHE_SIZE)
+def float64s_text(blob):
+    return '[' + ', '.join(map(repr, unpack_float64s(blob))) + ']'
+
+
+@lru_cache(maxsize=DECODE_CACHE_SIZE)
+def identities_text(blob):
+    text = blob.decode('ascii')
+    return '[' + ', '.join(f'"{text[i:i + IDENTITY_LENGTH]}"' for i in range(0, len(text), IDENTITY_LENGTH)) + ']'
+
+
+@lru_cache(maxsize=DECODE_CACHE_SIZE)
+def betting_odds_text(current_bet_state_blob):
+    """ The odds were stored as a list of quoted numbers. An option without selection has the integer pool as odds """
+    odds = compute_betting_odds(unpack_uint32s(current_bet_state_blob))
+    return '[' + ','.join(f'"{e}"' for e in odds) + ']'
+
+
+def encode_bet_row_values(current_bet_state, oracle_id, oracle_fee, oracle_vote):
+    """
+    Pack the array columns of a bet fetched from node.
+
+    :return: (current_bet_state, oracle_id, oracle_fee, oracle_vote, current_num_selection, betting_odds) BLOBs.
+    """
+    packed_state = pack_uint32s(current_bet_state)
+    return (
+        packed_state,
+        pack_identities(oracle_id),
+        pack_float64s(oracle_fee),
+        pack_int32s(oracle_vote),
+        packed_state,
+        pack_float64s(compute_betting_odds(current_bet_state)),
+    )
+
+
+def decode_bet(bet):
+    """
+    Convert the packed columns of a quottery_info row into the JSON texts served by the API, in place.
+    The betting odds are formatted from the bet state, which tells the integer odds from the float ones.
+
+    :param bet: quottery_info row as a dictionary.
+    :return: The same dictionary.
+    """
+    current_bet_state = bet.get('current_bet_state')
+    if isinstance(current_bet_state, bytes):
+        bet['current_bet_state'] = uint32s_text(current_bet_state)
+        if isinstance(bet.get('betting_odds'), bytes):
+            bet['betting_odds'] = betting_odds_text(current_bet_state)
+    if isinstance(bet.get('current_num_selection'), bytes):
+        bet['current_num_selection'] = uint32s_text(bet['current_num_selection'])
+    if isinstance(bet.get('oracle_id'), bytes):
+        bet['oracle_id'] = identities_text(bet['oracle_id'])
+    if isinstance(bet.get('oracle_fee'), bytes):
+        bet['oracle_fee'] = float64s_text(bet['oracle_fee'])
+    if isinstance(bet.get('oracle_vote'), bytes):
+        bet['oracle_vote'] = int32s_text(bet['oracle_vote'])
+    return bet
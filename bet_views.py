@@ -0,0 +1,228 @@
+import json
+import logging
+from datetime import datetime, timezone
+
+logger = logging.getLogger('BET_VIEWS')
+
+# Views of the bet list shared by the Flask app and by the updater, which pre-renders the most requested ones
+
+PAGINATION_THRESHOLD = 100
+
+PAGINATIONS_FILTER = [
+    "bet_id",
+    "open_date",
+    "open_time",
+    "close_date",
+    "close_time",
+    "end_date",
+    "end_time",
+    "creator",
+    "max_slot_per_option",
+    "amount_per_bet_slot",
+    "no_ops",
+    "no_options",
+    "option_desc",
+    "result",
+    "status",
+    "oracle_id",
+    "bet_desc",
+    "oracle_vote"
+]
+
+# This filter apply for containing check
+CONTAINING_FILTER = [
+    "open_date",
+    "open_time",
+    "close_date",
+    "close_time",
+    "end_date",
+    "end_time",
+    "creator",
+    "option_desc",
+    "oracle_id",
+    "bet_desc",
+    "oracle_vote"
+]
+
+# Responses pre-rendered by the updater, named after their endpoint
+ARTIFACT_KEYS = ('get_all_bets', 'get_active_bets', 'get_locked_bets', 'get_inactive_bets', 'get_tick_info')
+ARTIFACTS_DIR = 'artifacts'  # next to the database file
+ARTIFACTS_MANIFEST = 'manifest.json'
+
+
+def parse_bet_datetime(date_str, time_str):
+    return datetime.strptime(date_str + ' ' + time_str, '%y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+
+
+def filter_active_bets(bets_list, now=None):
+    # Active bet is the bet that doesn't have the result
+    filtered_bets = list(filter(lambda p: p['result'] < 0, bets_list))
+
+    # Check the closed date and close time
+    current_utc_date = now or datetime.now(timezone.utc)
+    active_bets = []
+    for bet in filtered_bets:
+        active_flag = False
+        try:
+            closed_datetime = parse_bet_datetime(bet['close_date'], bet['close_time'])
+            active_flag = current_utc_date < closed_datetime
+        except Exception as e:
+            logger.warning(f"Date time format is not correct. Will not use for filtering active/inactive: {e}")
+
+        if active_flag:
+            active_bets.append(bet)
+
+    return active_bets
+
+
+def filter_locked_bets(bets_list, now=None):
+    # Check the closed/end date and close/end time
+    current_utc_date = now or datetime.now(timezone.utc)
+    locked_bets = []
+    for bet in bets_list:
+        locked_flag = False
+        try:
+            closed_datetime = parse_bet_datetime(bet['close_date'], bet['close_time'])
+            end_datetime = parse_bet_datetime(bet['end_date'], bet['end_time'])
+            locked_flag = closed_datetime <= current_utc_date < end_datetime
+        except Exception as e:
+            logger.warning(f"Date time format is not correct. Will not use for filtering active/inactive: {e}")
+
+        if locked_flag:
+            locked_bets.append(bet)
+
+    return locked_bets
+
+
+def filter_inactive_bets(bets_list, now=None):
+    current_utc_date = now or datetime.now(timezone.utc)
+    inactive_bets = []
+    for bet in bets_list:
+        inactive_flag = False
+
+        # Inactive bet is a bet that has result
+        if bet['result'] >= 0:
+            inactive_flag = True
+        else:  # Check the end date and close time
+            try:
+                end_datetime = parse_bet_datetime(bet['end_date'], bet['end_time'])
+                inactive_flag = end_datetime <= current_utc_date
+            except Exception as e:
+                logger.warning(f"Date time format is not correct. Will not use for filtering active/inactive: {e}")
+
+        if inactive_flag:
+            inactive_bets.append(bet)
+
+    return inactive_bets
+
+
+def next_view_change(bets_list, now):
+    """ Time at which a bet moves between the active, locked and inactive views. None if no bet will move """
+    next_change = None
+    for bet in bets_list:
+        for date_key, time_key in (('close_date', 'close_time'), ('end_date', 'end_time')):
+            try:
+                change_time = parse_bet_datetime(bet[date_key], bet[time_key])
+            except Exception:
+                continue
+            if change_time > now and (next_change is None or change_time < next_change):
+                next_change = change_time
+    return next_change
+
+
+def pagination_filter(bets_list, args):
+    filtered_bets = bets_list
+    for pagin in PAGINATIONS_FILTER:
+        pagin_filter = args.get(pagin)
+        if pagin_filter:
+            # This only checks for containing
+            if pagin in CONTAINING_FILTER:
+                filtered_bets = list(filter(lambda p: pagin_filter in p[pagin], filtered_bets))
+            else:  # Check for match all
+                filtered_bets = list(filter(lambda p: str(p[pagin]) == pagin_filter, filtered_bets))
+
+    return filtered_bets
+
+
+def pagination_page(bets_list, page, page_size):
+    filtered_bets = bets_list
+
+    # Pagination
+    start = (page - 1) * page_size
+    end = start + page_size
+    paginated_bets = filtered_bets[start:end]
+
+    return paginated_bets
+
+
+def apply_pagination(bets_list, args, default_page_size=PAGINATION_THRESHOLD):
+    """ Filter and paginate a list with the params of a request """
+    # Get pagination parameters
+    page = int(args.get('page', 1))
+    page_size = int(args.get('page_size', default_page_size))
+
+    # Filter
+    filtered_bets = pagination_filter(bets_list, args)
+
+    # Get the result with pagination
+    if len(filtered_bets) > page_size:
+        total_records = len(filtered_bets)
+        paginated_bets = pagination_page(filtered_bets, page, page_size)
+        ret = {
+            'bet_list': paginated_bets,
+            'page': {
+                "current_records": len(paginated_bets),
+                "total_records": total_records,
+                "current_page": page,
+                "page_size": page_size,
+                "total_pages": (total_records + page_size - 1) // page_size  # Calculate total pages
+            }
+        }
+    else:
+        ret = {
+            'bet_list': filtered_bets,
+            'page': {
+                "current_records": len(filtered_bets),
+                "total_records": len(filtered_bets),
+                "current_page": 1,
+                "page_size": len(filtered_bets),
+                "total_pages": 1
+            }
+        }
+    return ret
+
+
+def render_json(data):
+    """ Serialize a response body exactly as Flask's jsonify does outside of the debug mode """
+    return json.dumps(data, ensure_ascii=True, sort_keys=True, separators=(',', ':')) + '\n'
+
+
+def render_artifacts(bets_list, node_info, tick_info, page_size=PAGINATION_THRESHOLD, now=None):
+    """
+    Render the responses of the requests without params.
+
+    :param bets_list: Rows of quottery_info, as dictionaries.
+    :param node_info: Rows of node_basic_info, as dictionaries.
+    :param tick_info: Row of tick_info as a dictionary, empty if there is none.
+    :param page_size: Default page size of the app.
+    :param now: Current UTC datetime.
+    :return: Dictionary of key: (body, valid_until). valid_until is the UNIX time at which the body becomes outdated
+             because a bet changes of view. None if the body does not depend on the time.
+    """
+    now = now or datetime.now(timezone.utc)
+    next_change = next_view_change(bets_list, now)
+    valid_until = next_change.timestamp() if next_change else None
+
+    views = {
+        'get_all_bets': (bets_list, None),
+        'get_active_bets': (filter_active_bets(bets_list, now), valid_until),
+        'get_locked_bets': (filter_locked_bets(bets_list, now), valid_until),
+        'get_inactive_bets': (filter_inactive_bets(bets_list, now), valid_until),
+    }
+    artifacts = {}
+    for key, (view, view_valid_until) in views.items():
+        ret = apply_pagination(view, {}, page_size)
+        ret['node_info'] = node_info
+        artifacts[key] = (render_json(ret), view_valid_until)
+    artifacts['get_tick_info'] = (render_json({'tick_info': tick_info}), None)
+    return artifacts
@@ -1,14 +1,22 @@
 import os
 import sys
+import atexit
 import sqlite3
 import json
 import quottery_rpc_wrapper
-from threading import Thread
+import updater_metrics
+import bet_views
+import bet_columns
+import rpc_cache
+import profiling
+import notifications
+import gzip
+from threading import Thread, Lock, Event
+import queue
 import time
 from datetime import datetime, timezone
 import argparse
 from packaging.version import parse as parse_version
-import shutil
 import logging
 
 log_format = '[%(name)s][%(asctime)s] %(message)s'
@@ -20,13 +28,16 @@ logger = logging.getLogger('DB_UPDATER')
 
 # Init default parameters
 # DB version
-DB_VERSION = "2.1"
+DB_VERSION = "3.1"
 # Mainnet
 # HTTP_ENPOINT = 'https://rpc.qubic.org'
 # Testnet
 # HTTP_ENPOINT = 'https://91.210.226.146'
+# Several RPC endpoints can be given, comma separated. Calls go to the healthiest one
 NODE_IP = 'https://rpc.qubic.org'
-NODE_PORT = 21841
+NODE_PORT = quottery_rpc_wrapper.NODE_PORT
+# http: JSON RPC endpoints. native: TCP protocol of the node NODE_IP:NODE_PORT, through the quottery_cpp library
+RPC_TRANSPORT = quottery_rpc_wrapper.TRANSPORT_HTTP
 DATABASE_PATH = "."
 
 QUOTTERY_LIBS = 'libs/quottery_cpp/lib/libquottery_cpp.so'
@@ -34,12 +45,117 @@ qt = None
 
 DATABASE_FILE = 'database.db'
 UPDATE_INTERVAL = 3  # seconds
+# RPC timeouts and retries
+RPC_CONNECT_TIMEOUT = quottery_rpc_wrapper.RPC_CONNECT_TIMEOUT  # seconds
+RPC_READ_TIMEOUT = quottery_rpc_wrapper.RPC_READ_TIMEOUT  # seconds
+RPC_MAX_RETRIES = quottery_rpc_wrapper.RPC_MAX_RETRIES
+# Cache of the identities computed from the public keys of creators, oracles and bettors
+IDENTITY_CACHE_SIZE = quottery_rpc_wrapper.IDENTITY_CACHE_SIZE
+IDENTITY_CACHE_FILE = ''  # persist the cache between runs into this file. Disabled if empty
+RPC_CACHE_FILE = ''  # persist the node responses between runs into this file. Disabled if empty
+# Number of cycles between two full refreshes of all the bet option details
+OPTION_DETAIL_RECONCILE_INTERVAL = 100
+# Scheduler. A cycle starts when the tick of the node advances
+TICK_POLL_INTERVAL = 1  # seconds
+MAX_IDLE_INTERVAL = 60  # seconds. Run a cycle even if the tick has not advanced
+CYCLE_TIME_BUDGET = 10  # seconds
+CYCLE_RPC_BUDGET = 500  # number of node requests
+# Pipelined cycle: node requests, decoding and database writes overlap, connected by bounded queues.
+# With 0 fetchers, the stages run one after another
+PIPELINE_FETCHERS = 4  # threads requesting the node
+PIPELINE_QUEUE_SIZE = 64  # items waiting between two stages. A slow stage blocks the previous ones
+PIPELINE_BATCH_SIZE = 32  # bet infos decoded, or rows written, at once
+OPTION_QUERY_CHUNK = 400  # previous option details read at once, 2 SQL variables each
+URGENT_WINDOW = 600  # seconds before close/end time where a bet is refreshed every cycle
+RECENT_ACTIVITY_WINDOW = 300  # seconds after a change where a bet is refreshed every cycle
+DORMANT_REFRESH_INTERVAL = 60  # seconds between two refreshes of a bet without activity
+# Archival of the settled bets into the cold tables
+ARCHIVE_INTERVAL = 600  # seconds between two archival stages
+ARCHIVE_GRACE_PERIOD = 86400  # seconds after the end time before a settled bet is archived
+# Epoch shards. When the epoch of the node advances, the bets archived during the previous epoch are moved from the
+# cold tables into an immutable file of this directory, relative to the database file. Disabled if empty
+SHARD_DIR = ''
+# Change log. Older entries are compacted with the archival stage, keeping the last change of each kind per bet
+CHANGE_LOG_KEEP = 100000  # number of most recent entries never compacted
+# Backups, taken with the SQLite online backup API before the migrations and periodically
+BACKUP_DIR = ''  # directory of the backups. Next to the database file if empty
+BACKUP_INTERVAL = 0  # seconds between two periodic backups. Disabled if 0
+BACKUP_KEEP = 7  # number of periodic backups kept
+BACKUP_PAGES_PER_STEP = 1024  # pages copied by each step of a backup
+BACKUP_STEP_SLEEP = 0.01  # seconds between two steps of a backup
+# Publishing of the committed cycles to the readers
+# - wal: readers read the live database. Checkpoints are run by the updater between cycles
+# - snapshot: each cycle is copied into a generation file, then exposed by renaming the pointer file
+# - memory: embedded mode of the app (start_embedded). The loop writes into a shared in-memory database, each cycle
+#   is copied into an in-memory generation, and the database file is only a periodic snapshot
+PUBLISH_MODE = 'wal'
+WAL_TRUNCATE_SIZE = 64 * 1024 * 1024  # bytes. Above this size, the WAL file is truncated after a checkpoint
+SNAPSHOT_KEEP = 3  # number of generation files kept for the readers still using them
+SNAPSHOT_POINTER_SUFFIX = '.current'
+MEMORY_DATABASE = 'quottery'  # name of the shared in-memory database of the memory mode
+MEMORY_SNAPSHOT_INTERVAL = 60  # seconds between two snapshots of the in-memory database into the database file
+# Instrumentation of the cycles
+# Pre-rendered responses of the Flask app, next to the database file. Disabled if empty
+ARTIFACTS_DIR = bet_views.ARTIFACTS_DIR
+PAGINATION_THRESHOLD = bet_views.PAGINATION_THRESHOLD  # must match the page size of the app
+ARTIFACTS_GZIP_LEVEL = 6
+# Directory of the sockets of the app processes notified of each committed cycle. Only the version file next to the
+# database is written if empty
+NOTIFY_DIR = ''
+
+METRICS_PORT = 0  # local port serving /metrics and /metrics.json. 0 disables the server
+METRICS_HISTORY = 1000  # number of cycles kept in the updater_stats table
+
+# Last seen slot count of each (bet_id, option_id). Option details are only
+# refetched when the matching currentBetState slot count changes
+option_slot_states = {}
+# (bet_id, option_id) of the options left to refetch by the full reconcile, regardless of their slot count.
+# Carried over the cycles until each of them has been refetched
+reconcile_pending = set()
+
+# Long-lived connection used by the update loop
+db_conn = None
+
+# Refresh state of each active bet, used to prioritize the bets within the cycle budget
+bet_schedule = {}
+# Bet info payloads fetched in the current cycle. They are kept in bet_schedule once the cycle is written
+fetched_bet_payloads = {}
+# Node responses persisted between runs, when RPC_CACHE_FILE is set
+rpc_payload_cache = None
+# (epoch, initial tick) of the node at the last tick poll. Epoch 0 if unknown, as with the native transport
+node_epoch = (0, 0)
+# Monotonic time of the last archival stage
+last_archive_time = None
+# Monotonic time of the last periodic backup
+last_backup_time = None
+# Version of the artifacts listed in the current manifest
+artifacts_version = None
+# Announces the committed cycles to the app processes
+commit_publisher = None
+# Memory mode. Connection keeping the written in-memory database alive, and the connections keeping the last
+# SNAPSHOT_KEEP generations alive, the last one being published
+memory_keeper = None
+memory_generations = []
+published_memory_database = None
+memory_lock = Lock()
+# Monotonic time of the last snapshot of the in-memory database
+last_memory_snapshot_time = None
+# Set to stop update_database_with_bets after the current cycle
+updater_stop = Event()
+# Recent cycles and cumulative counters exposed on the metrics port
+metrics_registry = updater_metrics.MetricsRegistry()
 
 def init_tick_info():
     # Connect to your SQLite database
     conn = sqlite3.connect(DATABASE_FILE)
     cursor = conn.cursor()
 
+    reset_tick_info(cursor)
+
+    conn.commit()
+    conn.close()
+
+def reset_tick_info(cursor):
     # Update the bet detail option table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS tick_info (
@@ -70,9 +186,6 @@ def init_tick_info():
         cursor.execute(f'''UPDATE tick_info SET number_of_misaligned_votes = 0''')
         cursor.execute(f'''UPDATE tick_info SET initial_tick = 0''')
 
-    conn.commit()
-    conn.close()
-
 def init_node_basic_info():
     # Connect to your SQLite database
     conn = sqlite3.connect(DATABASE_FILE)
@@ -108,10 +221,119 @@ def init_node_basic_info():
     conn.commit()
     conn.close()
 
+def init_updater_stats():
+    # Connect to your SQLite database
+    conn = sqlite3.connect(DATABASE_FILE)
+    cursor = conn.cursor()
+
+    # Rolling measures of the last cycles. Not part of the served data, so it is not versioned
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS updater_stats (
+            cycle_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cycle_time REAL,
+            tick_number INTEGER,
+            chain_tick INTEGER,
+            tick_lag INTEGER,
+            duration REAL,
+            phases TEXT,
+            rpc_count INTEGER,
+            rpc_errors INTEGER,
+            bytes_received INTEGER,
+            rows_inserted INTEGER,
+            rows_updated INTEGER,
+            rows_skipped INTEGER,
+            rpc_stats TEXT
+        )
+    ''')
+
+    conn.commit()
+    conn.close()
+
+# Create the cold tables holding the settled bets. They mirror quottery_info and bet_options_detail
+def create_archive_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS quottery_info_archive (
+            bet_id INTEGER PRIMARY KEY,
+            no_options INTEGER NOT NULL,
+            creator TEXT NOT NULL,
+            bet_desc TEXT NOT NULL,
+            option_desc TEXT NOT NULL,
+            current_bet_state BLOB,
+            max_slot_per_option INTEGER NOT NULL,
+            amount_per_bet_slot REAL NOT NULL,
+            open_date TEXT,
+            close_date TEXT,
+            end_date TEXT,
+            open_time TEXT,
+            close_time TEXT,
+            end_time TEXT,
+            result INTEGER,
+            no_ops INTEGER,
+            oracle_id BLOB,
+            oracle_fee BLOB,
+            oracle_vote BLOB,
+            status INTEGER,
+            current_num_selection BLOB,
+            current_total_qus TEXT,
+            betting_odds BLOB
+        )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS bet_options_detail_archive (
+            bet_id INTEGER,
+            option_id INTEGER,
+            user_slots TEXT,
+            PRIMARY KEY (bet_id, option_id)
+            )''')
+
+# Create the log of the changes of the bets, read by the consumers syncing incrementally
+def create_change_log_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS bet_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tick_number INTEGER NOT NULL,
+            bet_id INTEGER NOT NULL,
+            option_id INTEGER,
+            change_type TEXT NOT NULL,
+            payload TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS bet_changes_tick ON bet_changes (tick_number)')
+    # Used by the compaction to find the later changes of the same kind
+    cursor.execute('CREATE INDEX IF NOT EXISTS bet_changes_key ON bet_changes (bet_id, change_type, option_id, seq)')
+
+# Create the registry of the epoch shards, the immutable files holding the bets archived during the past epochs,
+# and the tick each bet of the cold tables was archived at, which gives the tick range of the next shard.
+# The file names are relative to the database file
+def create_epoch_shards_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS epoch_shards (
+            epoch INTEGER PRIMARY KEY,
+            first_tick INTEGER NOT NULL,
+            last_tick INTEGER NOT NULL,
+            file_name TEXT NOT NULL,
+            bet_count INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archive_ticks (
+            bet_id INTEGER PRIMARY KEY,
+            tick_number INTEGER NOT NULL
+        )
+    ''')
+
+# Index the bets by creator, for the creator profile pages
+def create_creator_indexes(cursor):
+    cursor.execute('CREATE INDEX IF NOT EXISTS quottery_info_creator ON quottery_info (creator)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS quottery_info_archive_creator ON quottery_info_archive (creator)')
+
 # Create db file
 def create_db_file():
     conn = sqlite3.connect(DATABASE_FILE)
     cursor = conn.cursor()
+    # Free pages are given back to the file system by the archival stage. Must be set before any table
+    cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS version (
             version_info TEXT PRIMARY KEY)'''
@@ -128,7 +350,7 @@ def create_db_file():
             creator TEXT NOT NULL,
             bet_desc TEXT NOT NULL,
             option_desc TEXT NOT NULL,
-            current_bet_state TEXT,
+            current_bet_state BLOB,
             max_slot_per_option INTEGER NOT NULL,
             amount_per_bet_slot REAL NOT NULL,
             open_date TEXT,
@@ -139,13 +361,13 @@ def create_db_file():
             end_time TEXT,
             result INTEGER,
             no_ops INTEGER,
-            oracle_id TEXT,
-            oracle_fee REAL,
-            oracle_vote TEXT,
+            oracle_id BLOB,
+            oracle_fee BLOB,
+            oracle_vote BLOB,
             status INTEGER,
-            current_num_selection TEXT,
+            current_num_selection BLOB,
             current_total_qus TEXT,
-            betting_odds TEXT
+            betting_odds BLOB
         )
     ''')
 
@@ -170,19 +392,20 @@ def create_db_file():
             PRIMARY KEY (bet_id, option_id)
             )''')
 
+    create_archive_tables(cursor)
+    create_change_log_table(cursor)
+    create_creator_indexes(cursor)
+    create_epoch_shards_table(cursor)
+
     conn.commit()
     conn.close()
 
     init_tick_info()
 
 # Update from unversion to 1.0
-def update_db_unversion_to_1_0():
+def update_db_unversion_to_1_0(cursor):
     update_version = "1.0"
 
-    # Connect to your SQLite database
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
-
     # Create a table for versioning if it doesn't exist
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS version (
@@ -200,17 +423,10 @@ def update_db_unversion_to_1_0():
         UPDATE node_basic_info SET fee_per_slot_per_hour = 0;
     ''')
 
-    conn.commit()
-    conn.close()
-
 # Update from 1.0 to 2.0
-def update_db_1_0_to_2_0():
+def update_db_1_0_to_2_0(cursor):
     update_version = "2.0"
 
-    # Connect to your SQLite database
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
-
     # Insert or update the version information
     cursor.execute('''
     UPDATE version SET version_info = ?;
@@ -225,35 +441,166 @@ def update_db_1_0_to_2_0():
             PRIMARY KEY (bet_id, option_id)
             )''')
 
-    conn.commit()
-    conn.close()
-
 # Update from 2.0 to 2.1
-def update_db_2_0_to_2_1():
+def update_db_2_0_to_2_1(cursor):
     update_version = "2.1"
 
-    # Connect to your SQLite database
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
+    # Insert or update the version information
+    cursor.execute('''
+    UPDATE version SET version_info = ?;
+    ''', (update_version,))
+
+    reset_tick_info(cursor)
+
+# Update from 2.1 to 2.2
+def update_db_2_1_to_2_2(cursor):
+    update_version = "2.2"
 
     # Insert or update the version information
     cursor.execute('''
     UPDATE version SET version_info = ?;
     ''', (update_version,))
 
-    conn.commit()
-    conn.close()
+    # Cold tables for the settled bets
+    create_archive_tables(cursor)
+
+    # Switch to incremental auto vacuum. It only takes effect after the full vacuum run by vacuum_if_pending
+    cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+
+# Update from 2.2 to 2.3
+def update_db_2_2_to_2_3(cursor):
+    update_version = "2.3"
+
+    # Insert or update the version information
+    cursor.execute('''
+    UPDATE version SET version_info = ?;
+    ''', (update_version,))
+
+    # Log of the changes of the bets. It starts empty, consumers sync the full list first
+    create_change_log_table(cursor)
+
+# Update from 2.3 to 2.4
+def update_db_2_3_to_2_4(cursor):
+    update_version = "2.4"
+
+    # Insert or update the version information
+    cursor.execute('''
+    UPDATE version SET version_info = ?;
+    ''', (update_version,))
+
+    create_creator_indexes(cursor)
+
+# Pack the array columns of a table, stored as JSON texts until 2.4
+def pack_array_columns(cursor, table_name):
+    cursor.execute(f'''
+        SELECT bet_id, current_bet_state, oracle_id, oracle_fee, oracle_vote FROM {table_name}''')
+    rows = cursor.fetchall()
+
+    def load(text):
+        return json.loads(text) if isinstance(text, str) else []
+
+    # The betting odds and the number of selections were computed from the bet state
+    cursor.executemany(f'''
+        UPDATE {table_name} SET current_bet_state = ?, oracle_id = ?, oracle_fee = ?, oracle_vote = ?,
+            current_num_selection = ?, betting_odds = ?
+        WHERE bet_id = ?''',
+        [bet_columns.encode_bet_row_values(load(current_bet_state), load(oracle_id), load(oracle_fee),
+                                           load(oracle_vote)) + (bet_id,)
+         for bet_id, current_bet_state, oracle_id, oracle_fee, oracle_vote in rows])
+
+# Update from 2.4 to 3.0
+def update_db_2_4_to_3_0(cursor):
+    update_version = "3.0"
+
+    # Insert or update the version information
+    cursor.execute('''
+    UPDATE version SET version_info = ?;
+    ''', (update_version,))
+
+    # Fixed-width arrays are stored as packed little-endian BLOBs. The declared types of the existing columns
+    # stay, they do not convert BLOB values
+    pack_array_columns(cursor, 'quottery_info')
+    pack_array_columns(cursor, 'quottery_info_archive')
+
+# Update from 3.0 to 3.1
+def update_db_3_0_to_3_1(cursor):
+    update_version = "3.1"
+
+    # Insert or update the version information
+    cursor.execute('''
+    UPDATE version SET version_info = ?;
+    ''', (update_version,))
+
+    # The archived bets stay in the cold tables until the epoch advances
+    create_epoch_shards_table(cursor)
+
+def backup_database(source_conn, backup_file):
+    """
+    Copy a consistent image of the database into backup_file with the SQLite online backup API.
+    The copy runs in steps of BACKUP_PAGES_PER_STEP pages, so the readers are never blocked.
+
+    :param source_conn: Connection to the database to back up.
+    :param backup_file: Path of the backup. It only appears once complete.
+    """
+    tmp_file = backup_file + '.tmp'
+    backup_conn = sqlite3.connect(tmp_file)
+    try:
+        source_conn.backup(backup_conn, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP)
+        # The backup is a standalone file, without WAL
+        backup_conn.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        backup_conn.close()
+    os.replace(tmp_file, backup_file)
+
+
+def backup_file_prefix():
+    """ Path prefix of the backups of the database file, in BACKUP_DIR or next to the database """
+    database_name = os.path.splitext(os.path.basename(DATABASE_FILE))[0]
+    return os.path.join(BACKUP_DIR or os.path.dirname(DATABASE_FILE), database_name)
 
-    init_tick_info()
 
 def backup_db(version):
     # Back up the database file
     timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
     # New file name with the timestamp
-    backupfile = f"{DATABASE_FILE.split('.')[0]}_v{version}_bk_{timestamp}.db"
-    # Copy the original file to the new file
+    backupfile = f"{backup_file_prefix()}_v{version}_bk_{timestamp}.db"
     logger.info(f"Backing up db file into {backupfile}")
-    shutil.copyfile(DATABASE_FILE, backupfile)
+    conn = sqlite3.connect(DATABASE_FILE)
+    try:
+        backup_database(conn, backupfile)
+    finally:
+        conn.close()
+
+
+def backup_periodically(conn):
+    """
+    Back up the database every BACKUP_INTERVAL seconds and keep the last BACKUP_KEEP backups.
+
+    :param conn: The long-lived SQLite connection.
+    :return: Path of the new backup, None if it is not time yet.
+    """
+    global last_backup_time
+    if not BACKUP_INTERVAL:
+        return None
+    if last_backup_time is not None and time.monotonic() - last_backup_time < BACKUP_INTERVAL:
+        return None
+    last_backup_time = time.monotonic()
+
+    prefix = backup_file_prefix()
+    backup_file = f"{prefix}_bk_{datetime.now().strftime('%Y%m%d%H%M%S')}.db"
+    backup_database(conn, backup_file)
+
+    # Rotate. The timestamps sort in time order
+    backup_dir = os.path.dirname(prefix) or '.'
+    backup_name = os.path.basename(prefix) + '_bk_'
+    backups = sorted(name for name in os.listdir(backup_dir)
+                     if name.startswith(backup_name) and name.endswith('.db'))
+    for name in backups[:-BACKUP_KEEP]:
+        try:
+            os.remove(os.path.join(backup_dir, name))
+        except OSError as e:
+            logger.warning(f"Error removing old backup {name}: {e}")
+    return backup_file
 
 # Function that check if we need to convert the old version to new version of table
 # Only have ability update version gradually. Can not jump from a very old version
@@ -291,47 +638,103 @@ def update_db():
     if need_update:
         logger.info(f"Version is mismatched current: %s vs supported: %s", version_info, DB_VERSION)
 
-        # Update from unversion to 1.0
-        if not field_exists:
-            logger.info(f"Updating db from unversion to 1.0 ...")
+        # Back up the database file
+        backup_db("00" if not field_exists else version_info.replace('.', ''))
 
-            # Back up the database file
-            backup_db("00")
-
-            # Update the file
-            update_db_unversion_to_1_0()
-            version_info = "1.0"
-
-            logger.info(f"Updated db version to %s", version_info)
-
-        # Update from other version happend sequential here if neccessary
-        if parse_version(version_info) < parse_version("2.0"):
-            logger.info(f"Updating db from {version_info}  to 2.0 ...")
-            # Back up the database file
-            backup_db("10")
-
-            # Update the file
-            update_db_1_0_to_2_0()
-            version_info = "2.0"
-            logger.info(f"Finished update db version to %s", version_info)
-
-        if parse_version(version_info) < parse_version("2.1"):
-            logger.info(f"Updating db from {version_info} to 2.1 ...")
+        # All the updates run in one transaction. Readers keep reading the old version until it is committed
+        conn = sqlite3.connect(DATABASE_FILE, isolation_level=None)
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+
+            # Update from unversion to 1.0
+            if not field_exists:
+                logger.info(f"Updating db from unversion to 1.0 ...")
+                update_db_unversion_to_1_0(cursor)
+                version_info = "1.0"
+                logger.info(f"Updated db version to %s", version_info)
+
+            # Update from other version happend sequential here if neccessary
+            if parse_version(version_info) < parse_version("2.0"):
+                logger.info(f"Updating db from {version_info}  to 2.0 ...")
+                update_db_1_0_to_2_0(cursor)
+                version_info = "2.0"
+                logger.info(f"Finished update db version to %s", version_info)
+
+            if parse_version(version_info) < parse_version("2.1"):
+                logger.info(f"Updating db from {version_info} to 2.1 ...")
+                update_db_2_0_to_2_1(cursor)
+                version_info = "2.1"
+                logger.info(f"Finished update db version to %s", version_info)
+
+            if parse_version(version_info) < parse_version("2.2"):
+                logger.info(f"Updating db from {version_info} to 2.2 ...")
+                update_db_2_1_to_2_2(cursor)
+                version_info = "2.2"
+                logger.info(f"Finished update db version to %s", version_info)
+
+            if parse_version(version_info) < parse_version("2.3"):
+                logger.info(f"Updating db from {version_info} to 2.3 ...")
+                update_db_2_2_to_2_3(cursor)
+                version_info = "2.3"
+                logger.info(f"Finished update db version to %s", version_info)
+
+            if parse_version(version_info) < parse_version("2.4"):
+                logger.info(f"Updating db from {version_info} to 2.4 ...")
+                update_db_2_3_to_2_4(cursor)
+                version_info = "2.4"
+                logger.info(f"Finished update db version to %s", version_info)
+
+            if parse_version(version_info) < parse_version("3.0"):
+                logger.info(f"Updating db from {version_info} to 3.0 ...")
+                update_db_2_4_to_3_0(cursor)
+                version_info = "3.0"
+                logger.info(f"Finished update db version to %s", version_info)
+
+            if parse_version(version_info) < parse_version("3.1"):
+                logger.info(f"Updating db from {version_info} to 3.1 ...")
+                update_db_3_0_to_3_1(cursor)
+                version_info = "3.1"
+                logger.info(f"Finished update db version to %s", version_info)
+
+            if parse_version(version_info) != parse_version(DB_VERSION):
+                logger.error(f"Can not update from db from %s to %s", version_info, DB_VERSION)
+                cursor.execute('ROLLBACK')
+                conn.close()
+                sys.exit(1)
 
-            # Back up the database file
-            backup_db("20")
-            update_db_2_0_to_2_1()
-            version_info = "2.1"
-            logger.info(f"Finished update db version to %s", version_info)
+            cursor.execute('COMMIT')
+        except sqlite3.Error:
+            cursor.execute('ROLLBACK')
+            conn.close()
+            raise
 
-        if parse_version(version_info) != parse_version(DB_VERSION):
-            logger.error(f"Can not update from db from %s to %s", version_info, DB_VERSION)
-            sys.exit(1)
+        conn.close()
 
         logger.info(f"Update db version successfully. Current version {DB_VERSION}")
     else:
         logger.info(f"Version is matched. Skip the update.")
 
+    # Vacuum can not run inside a transaction. It runs after the switch to the new version
+    vacuum_if_pending()
+
+def vacuum_if_pending():
+    """
+    Run the full vacuum switching the database to incremental auto vacuum, needed once since the version 2.2.
+    Until it completes, the file keeps auto_vacuum = NONE, so a vacuum that failed is retried on the next start.
+    """
+    conn = sqlite3.connect(DATABASE_FILE, isolation_level=None)
+    try:
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 0:
+            return
+        logger.info("Vacuuming the database ...")
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+    except sqlite3.Error as e:
+        # The database stays usable, its free pages are only kept in the file
+        logger.warning(f"Full vacuum skipped, retrying on the next start: {e}")
+    finally:
+        conn.close()
 
 def init_db():
     if os.path.exists(DATABASE_FILE):
@@ -344,6 +747,9 @@ def init_db():
     # Node basic information will depend on the node it connect to
     # So it is better to clean it up to not mess up when we change the node
     init_node_basic_info()
+    init_updater_stats()
+    # The artifacts of the previous run show the old node info. The app reads the database until the first cycle
+    remove_artifacts_manifest()
 
 def get_qtry_basic_info_from_node():
     # Connect to the node and get current basic info of qtry
@@ -354,14 +760,24 @@ def get_qtry_basic_info_from_node():
         logger.warning(f"Error get active basic info of qtry from node: {e}")
         return 1, {}
 
-def fetch_bets_from_node():
-    # Connect to the node and get all bets
+def get_active_bets_from_node():
+    try:
+        sts, active_bets = qt.get_active_bets()
+        return (sts, active_bets)
+    except Exception as e:
+        logger.warning(f"Error fetching active bets from node: {e}")
+        return 1, []
+
+def get_tick_number_from_node():
+    global node_epoch
     try:
-        sts, all_bets, tick_number = qt.get_all_bets()
-        return (sts, all_bets, tick_number)
+        sts, tick_info = qt.get_tick_info()
+        if not sts:
+            node_epoch = (tick_info.get('epoch', 0), tick_info.get('initial_tick', 0))
+        return (sts, tick_info.get('tick', 0))
     except Exception as e:
-        logger.warning(f"Error fetching all bets from node: {e}")
-        return (1, {}, 0)
+        logger.warning(f"Error fetching tick info from node: {e}")
+        return 1, 0
 
 def get_bet_info_from_node(betId):
     try:
@@ -371,6 +787,14 @@ def get_bet_info_from_node(betId):
         logger.warning(f"Error fetching bet info from node: {e}")
         return 1, {}
 
+def get_bet_info_payload_from_node(betId):
+    try:
+        sts, payload = qt.get_bet_info_payload(betId)
+        return (sts, payload)
+    except Exception as e:
+        logger.warning(f"Error fetching bet info from node: {e}")
+        return 1, b''
+
 def check_primary_key_exists(cursor, table_name, primary_key_column, primary_key_value):
     """
     Check if a primary key exists in the table.
@@ -386,249 +810,1599 @@ def check_primary_key_exists(cursor, table_name, primary_key_column, primary_key
     return cursor.fetchone() is not None
 
 
-def update_current_total_qus(conn, bet_id):
-    """ Update total of qus betting into database """
+def memory_database_uri(name):
+    return f"file:{name}?mode=memory&cache=shared"
+
+
+def get_db_connection():
+    """ Get the long-lived connection of the updater. Open it in WAL mode if it is not opened yet """
+    global db_conn
+    if db_conn is None:
+        if PUBLISH_MODE == 'memory':
+            # WAL does not apply to in-memory databases. The readers read the published generations instead
+            db_conn = sqlite3.connect(memory_database_uri(MEMORY_DATABASE), uri=True,
+                                      factory=profiling.connection_factory())
+            return db_conn
+        db_conn = sqlite3.connect(DATABASE_FILE, factory=profiling.connection_factory())
+        # In WAL mode, readers keep reading the last committed cycle while the next one is written
+        db_conn.execute('PRAGMA journal_mode=WAL')
+        db_conn.execute('PRAGMA synchronous=NORMAL')
+        # Checkpoints are run between cycles by publish_database
+        db_conn.execute('PRAGMA wal_autocheckpoint=0')
+    return db_conn
+
+
+def close_db_connection():
+    """ Close the long-lived connection of the updater. It will be reopened on the next cycle """
+    global db_conn
+    if db_conn is not None:
+        try:
+            db_conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Error closing database connection: {e}")
+        db_conn = None
+
+
+def compute_current_total_qus(current_bet_state, amount_per_bet_slot):
+    """ Compute the total of qus betting into a bet """
+    total_selections = sum(current_bet_state)
+    return total_selections * float(amount_per_bet_slot)
+
+
+def make_quottery_info_row(active_bet):
+    """ Convert a bet fetched from node into a quottery_info row, with its odds and total computed.
+    The array columns are packed by bet_columns """
+    # Check the bet from node is inactive
+    ## Result checking
+    bet_status = 1
+    if active_bet['result'] >= 0:
+        bet_status = 0
+
+    current_bet_state, oracle_id, oracle_fee, oracle_vote, current_num_selection, betting_odds = \
+        bet_columns.encode_bet_row_values(active_bet['current_bet_state'], active_bet['oracle_id'],
+                                          active_bet['oracle_fee'], active_bet['oracle_vote'])
+    return (
+        active_bet['bet_id'],
+        active_bet['no_options'],
+        active_bet['creator'],
+        active_bet['bet_desc'],
+        json.dumps(active_bet['option_desc']),  # This should be a separate table
+        current_bet_state,
+        active_bet['max_slot_per_option'],
+        active_bet['amount_per_bet_slot'],
+        active_bet['open_date'],
+        active_bet['close_date'],
+        active_bet['end_date'],
+        active_bet['open_time'],
+        active_bet['close_time'],
+        active_bet['end_time'],
+        active_bet['result'],
+        active_bet['no_ops'],
+        oracle_id,
+        oracle_fee,
+        oracle_vote,
+        bet_status,
+        current_num_selection,
+        compute_current_total_qus(active_bet['current_bet_state'], active_bet['amount_per_bet_slot']),
+        betting_odds,
+    )
 
-    cursor = conn.cursor()
 
-    # Fetch current_bet_state and amount_per_bet_slot
-    cursor.execute('''
-        SELECT current_bet_state, amount_per_bet_slot
-        FROM quottery_info
-        WHERE bet_id = ?
-    ''', (bet_id,))
-    row = cursor.fetchone()
-
-    if row:
-        current_bet_state = json.loads(row[0])
-        amount_per_bet_slot = row[1]
-        total_selections = sum(current_bet_state)
-        current_total_qus = total_selections * amount_per_bet_slot
-
-        # Update current_total_qus in the database
-        cursor.execute('''
-            UPDATE quottery_info
-            SET current_total_qus = ?
-            WHERE bet_id = ?
-        ''', (current_total_qus, bet_id))
+# Columns of a quottery_info row, in the order of make_quottery_info_row
+QUOTTERY_INFO_COLUMNS = (
+    'bet_id', 'no_options', 'creator', 'bet_desc', 'option_desc', 'current_bet_state', 'max_slot_per_option',
+    'amount_per_bet_slot', 'open_date', 'close_date', 'end_date', 'open_time', 'close_time', 'end_time', 'result',
+    'no_ops', 'oracle_id', 'oracle_fee', 'oracle_vote', 'status', 'current_num_selection', 'current_total_qus',
+    'betting_odds')
 
-    conn.commit()
+# Kinds of entries of the bet_changes log
+CHANGE_NEW_BET = 'new_bet'
+CHANGE_BET_STATE = 'bet_state'
+CHANGE_STATUS = 'status'
+CHANGE_ORACLE_VOTE = 'oracle_vote'
+CHANGE_OPTION_BETTORS = 'option_bettors'
+
+
+def compute_bet_changes(previous_bets, bet_rows, previous_options, option_rows):
+    """
+    Compare the rows of a cycle with the rows already in the database.
+
+    :param previous_bets: Dictionary of bet_id to (current_bet_state, betting_odds, status, result, oracle_vote)
+                          as stored in the database.
+    :param bet_rows: quottery_info rows about to be written.
+    :param previous_options: Dictionary of (bet_id, option_id) to the stored user_slots.
+    :param option_rows: bet_options_detail rows about to be written.
+    :return: List of (bet_id, option_id, change_type, payload) entries for the bet_changes log.
+    """
+    changes = []
+    for row in bet_rows:
+        bet = dict(zip(QUOTTERY_INFO_COLUMNS, row))
+        bet_id = bet['bet_id']
+        previous = previous_bets.get(bet_id)
+        if previous is None:
+            changes.append((bet_id, None, CHANGE_NEW_BET, json.dumps(bet_columns.decode_bet(bet))))
+            continue
+
+        # The packed columns are compared as stored. The payloads hold them as served by the API
+        current_bet_state, betting_odds, status, result, oracle_vote = previous
+        state_changed = current_bet_state != bet['current_bet_state'] or betting_odds != bet['betting_odds']
+        vote_changed = oracle_vote != bet['oracle_vote']
+        if state_changed or vote_changed:
+            bet_columns.decode_bet(bet)
+        if state_changed:
+            changes.append((bet_id, None, CHANGE_BET_STATE, json.dumps({
+                'current_bet_state': bet['current_bet_state'],
+                'betting_odds': bet['betting_odds'],
+                'current_total_qus': bet['current_total_qus']})))
+        if status != bet['status'] or result != bet['result']:
+            changes.append((bet_id, None, CHANGE_STATUS, json.dumps({
+                'status': bet['status'],
+                'result': bet['result']})))
+        if vote_changed:
+            changes.append((bet_id, None, CHANGE_ORACLE_VOTE, json.dumps({'oracle_vote': bet['oracle_vote']})))
+
+    for bet_id, option_id, user_slots in option_rows:
+        if previous_options.get((bet_id, option_id)) != user_slots:
+            changes.append((bet_id, option_id, CHANGE_OPTION_BETTORS, json.dumps({'user_slots': user_slots})))
+
+    return changes
+
+
+class CycleBudget:
+    """ Time and node request budget of an update cycle """
+
+    def __init__(self, time_budget, rpc_budget):
+        self.deadline = time.monotonic() + time_budget
+        self.rpc_left = rpc_budget
+        self.lock = Lock()
+
+    def spend(self, rpc_calls=1):
+        with self.lock:
+            self.rpc_left -= rpc_calls
+
+    def exhausted(self):
+        return self.rpc_left <= 0 or time.monotonic() >= self.deadline
+
+
+def parse_bet_datetime(date_str, time_str):
+    """ Parse the date (YY-MM-DD) and time (HH:MM:SS) of a bet into an UTC datetime. None if invalid """
+    try:
+        return datetime.strptime(date_str + ' ' + time_str, '%y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        return None
+
+
+def bet_refresh_priority(bet_id, now, utc_now):
+    """
+    Get the refresh priority of an active bet.
+
+    :param bet_id: ID of the bet.
+    :param now: Current monotonic time.
+    :param utc_now: Current UTC datetime.
+    :return: The priority, lower is more urgent. None if the bet does not need a refresh in this cycle.
+    """
+    schedule = bet_schedule.get(bet_id)
+    # Never fetched
+    if schedule is None:
+        return 0
+
+    bet_info = schedule['bet_info']
+    close_datetime = parse_bet_datetime(bet_info['close_date'], bet_info['close_time'])
+    end_datetime = parse_bet_datetime(bet_info['end_date'], bet_info['end_time'])
+
+    # Waiting for the votes of the oracle providers
+    if bet_info['result'] < 0 and end_datetime and end_datetime <= utc_now:
+        return 1
+
+    # Close to stop receiving bets or to the result date
+    for bet_datetime in (close_datetime, end_datetime):
+        if bet_datetime and 0 <= (bet_datetime - utc_now).total_seconds() <= URGENT_WINDOW:
+            return 1
+
+    # Recently joined
+    if now - schedule['last_change'] <= RECENT_ACTIVITY_WINDOW:
+        return 2
+
+    # Dormant bet, refreshed less often
+    if now - schedule['last_refresh'] >= DORMANT_REFRESH_INTERVAL:
+        return 3
+
+    return None
+
+
+def schedule_bets(active_bet_ids):
+    """
+    Select the active bets to refresh in this cycle.
 
+    :param active_bet_ids: IDs of the bets that are active on node.
+    :return: IDs of the bets to refresh, the most urgent first.
+    """
+    now = time.monotonic()
+    utc_now = datetime.now(timezone.utc)
+    reconcile_bet_ids = {bet_id for bet_id, _ in reconcile_pending}
+    scheduled = []
+    for bet_id in active_bet_ids:
+        priority = bet_refresh_priority(bet_id, now, utc_now)
+        # The bets with options left to reconcile come last
+        if priority is None and bet_id in reconcile_bet_ids:
+            priority = 4
+        if priority is not None:
+            last_refresh = bet_schedule[bet_id]['last_refresh'] if bet_id in bet_schedule else 0
+            scheduled.append((priority, last_refresh, bet_id))
+    scheduled.sort()
+    return [bet_id for _, _, bet_id in scheduled]
+
+
+def update_bet_schedule(all_bets, active_bet_ids):
+    """
+    Record the refresh of the fetched bets, and forget the bets that are not active anymore.
+
+    :param all_bets: Dictionary of the bets fetched in this cycle.
+    :param active_bet_ids: IDs of the bets that are active on node.
+    """
+    now = time.monotonic()
+    for bet_id, bet_info in all_bets.items():
+        schedule = bet_schedule.get(bet_id)
+        if schedule is None:
+            bet_schedule[bet_id] = {'last_refresh': now, 'last_change': now, 'bet_info': bet_info,
+                                    'payload': fetched_bet_payloads.get(bet_id)}
+            continue
+
+        previous = schedule['bet_info']
+        if previous['current_bet_state'] != bet_info['current_bet_state'] or \
+                previous['oracle_vote'] != bet_info['oracle_vote'] or \
+                previous['result'] != bet_info['result']:
+            schedule['last_change'] = now
+        schedule['last_refresh'] = now
+        schedule['bet_info'] = bet_info
+        schedule['payload'] = fetched_bet_payloads.get(bet_id)
+
+    active_bet_ids = set(active_bet_ids)
+    for bet_id in list(bet_schedule):
+        if bet_id not in active_bet_ids:
+            del bet_schedule[bet_id]
+
+
+def load_rpc_cache():
+    """
+    Resume the refresh schedule of the bets and the slot counts of their option details from the responses
+    cached by the previous run, so a restart does not refetch everything. Entries written after the tick of the
+    database, as after restoring a backup, are ignored.
 
-def update_betting_odds(conn, bet_id):
-    """ Update betting odds into database """
-    # Retrieve current_bet_state for the given bet_id
-    cur = conn.cursor()
-    cur.execute("SELECT current_bet_state FROM quottery_info WHERE bet_id = ?", (bet_id,))
-    row = cur.fetchone()
+    :return: True if bets have been loaded from the cache.
+    """
+    if rpc_payload_cache is None:
+        return False
+    db_tick = get_db_connection().execute('SELECT tick_number FROM tick_info').fetchone()[0]
+
+    entries = rpc_payload_cache.load(quottery_rpc_wrapper.QTRY_GET_BET_INFO, db_tick)
+    bets_info, _ = decode_bet_payloads([entry[1] for entry in entries], [entry[5] for entry in entries])
+    fetch_times = {entry[1]: entry[3] for entry in entries}
+    now = time.monotonic()
+    for bet_info in bets_info:
+        bet_id = bet_info['bet_id']
+        last_refresh = now - max(0.0, time.time() - fetch_times[bet_id])
+        # The last change is unknown. The bet is refreshed as a dormant one
+        bet_schedule[bet_id] = {'last_refresh': last_refresh, 'last_change': last_refresh - RECENT_ACTIVITY_WINDOW,
+                                'bet_info': bet_info, 'payload': fetched_bet_payloads[bet_id]}
+    fetched_bet_payloads.clear()
+
+    # The written option details are up to date with the slot counts they were fetched with
+    for request_data, bet_id, _, _, slot_count, _ in rpc_payload_cache.load(
+            quottery_rpc_wrapper.QTRY_GET_BET_OPTION_DETAIL, db_tick):
+        if bet_id in bet_schedule:
+            option_slot_states[rpc_cache.parse_request_key(request_data)] = slot_count
+    return bool(bet_schedule)
+
+
+def save_rpc_cache(cycle, all_bets, fetched_slot_states, active_bet_ids):
+    """
+    Persist the responses written by the cycle, and forget the bets that are not active anymore.
+    The entries are stamped with the tick of the database after the commit, not the tick of the node: a cycle
+    that ran out of budget does not advance the database tick, and its entries must still be loaded on restart.
+    """
+    if rpc_payload_cache is None:
+        return
+    entries = []
+    for bet_id in all_bets:
+        entries.append((quottery_rpc_wrapper.QTRY_GET_BET_INFO, rpc_cache.request_key(bet_id), bet_id,
+                        cycle.tick_number, cycle.start_time, None, bet_schedule[bet_id]['payload']))
+    # The option details are in the database. Only their change signal is kept
+    for (bet_id, option_id), slot_count in fetched_slot_states.items():
+        entries.append((quottery_rpc_wrapper.QTRY_GET_BET_OPTION_DETAIL, rpc_cache.request_key(bet_id, option_id),
+                        bet_id, cycle.tick_number, cycle.start_time, slot_count, None))
+    rpc_payload_cache.update(entries, active_bet_ids)
+
+
+def fetch_scheduled_bets_from_node(scheduled_bet_ids, budget):
+    """
+    Fetch the scheduled bets from node, most urgent first, until the cycle budget runs out.
 
-    if row:
-        # TODO: verify this
-        current_bet_state = json.loads(row[0])
-        total_selections = sum(current_bet_state)
+    :param scheduled_bet_ids: IDs of the bets to refresh, the most urgent first.
+    :param budget: Budget of the cycle.
+    :return: Dictionary of the fetched bets, and True if all the scheduled bets have been fetched.
+    """
+    fetched_bet_ids = []
+    payloads = []
+    complete = True
+    for index, bet_id in enumerate(scheduled_bet_ids):
+        if budget.exhausted():
+            logger.info(f"Cycle budget exhausted. Defer {len(scheduled_bet_ids) - index} bets")
+            complete = False
+            break
+
+        sts, payload = get_bet_info_payload_from_node(bet_id)
+        budget.spend()
+        # The bet info is failed. Process the next one
+        if sts:
+            complete = False
+            continue
+
+        fetched_bet_ids.append(bet_id)
+        payloads.append(payload)
+
+    # All the fetched bets are decoded at once
+    bets_info, decoded = decode_bet_payloads(fetched_bet_ids, payloads)
+    all_bets = {bet_info['bet_id']: bet_info for bet_info in bets_info}
+    return all_bets, complete and decoded
+
+
+def decode_bet_payloads(bet_ids, payloads):
+    """
+    Decode the bet info payloads of several bets at once, and decide their result.
 
-        # Calculate betting odds
-        if total_selections == 0:
-            betting_odds = [1] * len(current_bet_state)
+    :param bet_ids: IDs of the bets.
+    :param payloads: Their payloads, from get_bet_info_payload_from_node.
+    :return: List of the decoded bets, and False if some of them could not be decoded.
+    """
+    # A bet whose payload did not change since its last written fetch keeps its decoded info
+    reused_bets_info = {}
+    changed_bet_ids = []
+    changed_payloads = []
+    for bet_id, payload in zip(bet_ids, payloads):
+        fetched_bet_payloads[bet_id] = payload
+        schedule = bet_schedule.get(bet_id)
+        if schedule is not None and schedule.get('payload') == payload:
+            reused_bets_info[bet_id] = schedule['bet_info']
         else:
-            betting_odds = [total_selections / selection if selection > 0 else total_selections for selection in
-                            current_bet_state]
+            changed_bet_ids.append(bet_id)
+            changed_payloads.append(payload)
 
-        betting_odds = [f'"{e}"' for e in betting_odds]
-        betting_odds_str = "[" + ','.join(betting_odds) + "]"
+    decoded = True
+    bets_info = []
+    if changed_bet_ids:
+        try:
+            bets_info = qt.decode_bet_infos(changed_bet_ids, changed_payloads)
+        except Exception as e:
+            # Fall back to decoding them one by one to only lose the invalid ones
+            logger.warning(f"Error decoding bet infos: {e}")
+            for bet_id, payload in zip(changed_bet_ids, changed_payloads):
+                try:
+                    bets_info.extend(qt.decode_bet_infos([bet_id], [payload]))
+                except Exception as e:
+                    logger.warning(f"Error decoding info of bet {bet_id}: {e}")
+                    decoded = False
+
+    for bet_info in bets_info:
+        qt.decide_bet_result(bet_info)
+    if not reused_bets_info:
+        return bets_info, decoded
+
+    # Keep the order of the bet IDs
+    bets_info = {bet_info['bet_id']: bet_info for bet_info in bets_info}
+    bets_info.update(reused_bets_info)
+    return [bets_info[bet_id] for bet_id in bet_ids if bet_id in bets_info], decoded
+
+
+def start_option_reconcile(active_bet_ids):
+    """
+    Refetch all the option details of the active bets regardless of their slot count, to catch any drift.
+    The options are refetched over the next cycles, within their budget, until none is left.
 
-        # Update the betting_odds in the database
-        cur.execute("UPDATE quottery_info SET betting_odds = ? WHERE bet_id = ?", (betting_odds_str, bet_id))
+    :param active_bet_ids: IDs of the bets that are active on node. The bets never fetched have no slot count yet,
+                           so their options are fetched anyway.
+    """
+    for bet_id in active_bet_ids:
+        schedule = bet_schedule.get(bet_id)
+        if schedule is not None:
+            reconcile_pending.update((bet_id, op_id) for op_id in range(schedule['bet_info']['no_options']))
+    logger.info(f"Reconciling {len(reconcile_pending)} option details")
 
 
-def update_database_with_bets():
-    """ Fetch all bet data related from node and update the database """
-    while True:
+def option_detail_needs_refresh(bet_id, option_id, slot_count):
+    """
+    Check if the detail of a bet option need to be requested from node.
+
+    :param bet_id: ID of the bet.
+    :param option_id: ID of the option within the bet.
+    :param slot_count: Number of slots filled on this option, from currentBetState.
+    :return: True if the option detail should be fetched, False otherwise.
+    """
+    if (bet_id, option_id) in reconcile_pending:
+        return True
+    return option_slot_states.get((bet_id, option_id)) != slot_count
+
+
+def fetch_bet_options_detail(all_bets, budget):
+    """
+    Fetch from node the option details that changed since the last cycle, or left to reconcile.
+
+    :param all_bets: Dictionary of the bets fetched from node.
+    :param budget: Budget of the cycle. The remaining options are fetched in the next cycles.
+    :return: The bet_options_detail rows to write, the slot counts they are up to date with
+             and the number of options skipped because they did not change.
+    """
+    option_rows = []
+    fetched_slot_states = {}
+    skipped_count = 0
+    for bet_id, active_bet in all_bets.items():
+        if not active_bet:
+            continue
+
+        # Only request the options that have new bettors
+        for op_id in range(0, active_bet['no_options']):
+            slot_count = active_bet['current_bet_state'][op_id]
+            if not option_detail_needs_refresh(bet_id, op_id, slot_count):
+                skipped_count += 1
+                continue
+            if budget.exhausted():
+                return option_rows, fetched_slot_states, skipped_count
+            option_row, up_to_date = fetch_bet_option_detail(bet_id, op_id, slot_count, budget)
+            if up_to_date:
+                fetched_slot_states[(bet_id, op_id)] = slot_count
+            if option_row:
+                option_rows.append(option_row)
+
+    return option_rows, fetched_slot_states, skipped_count
+
+
+def fetch_bet_option_detail(bet_id, op_id, slot_count, budget):
+    """
+    Fetch the detail of one bet option from node.
+
+    :return: The bet_options_detail row, None if there is nothing to write,
+             and True if the option is up to date with slot_count.
+    """
+    sts, bet_option_detail = qt.get_bet_option_detail(bet_id, op_id)
+    budget.spend()
+    # Remember the slot count once the detail is up to date with it.
+    # An option without any slot has nothing to fetch
+    up_to_date = bool(bet_option_detail) or slot_count == 0
+    if not bet_option_detail:
+        return None, up_to_date
+    return (bet_id, op_id, json.dumps(bet_option_detail)), up_to_date
+
+
+# End of the items of a pipeline stage
+PIPELINE_DONE = None
+
+
+def put_or_stop(work_queue, item, stop):
+    """ Put an item into a bounded queue, waiting for room unless the pipeline is stopped """
+    while not stop.is_set():
         try:
-            logger.info("Requesting data from node.")
-            sts, all_bets, tick_number = fetch_bets_from_node()
+            work_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
 
-            # Update the tick table
-            conn = sqlite3.connect(DATABASE_FILE)
-            cursor = conn.cursor()
-            # Fetch current tick in db
-            cursor.execute('''
-                SELECT tick_number
-                FROM tick_info
-            ''')
-            table_tick_number = cursor.fetchone()[0]
-            # Update tick number with the latest
-            tick_number = max(tick_number, table_tick_number)
-            cursor.execute(f'''UPDATE tick_info SET tick_number = {tick_number}''')
-            conn.commit()
-            conn.close()
 
-            # Verify the bets
-            if not all_bets:
-                logger.warning('[WARNING] Bets from node is empty! Using the local database')
+def get_or_stop(work_queue, stop):
+    """ Get an item from a queue. PIPELINE_DONE once the pipeline is stopped """
+    while not stop.is_set():
+        try:
+            return work_queue.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return PIPELINE_DONE
 
-            sts, qt_basic_info = get_qtry_basic_info_from_node()
-            if not qt_basic_info:
-                logger.warning('[WARNING] Basic info from node is empty!')
-            else:
-                # Connect to the database
-                conn = sqlite3.connect(DATABASE_FILE)
-                cursor = conn.cursor()
-                cursor.execute(f'''
-                    INSERT OR REPLACE INTO node_basic_info (
-                        ip,
-                        port,
-                        fee_per_slot_per_hour,
-                        min_amount_per_slot,
-                        game_operator_fee,
-                        shareholders_fee,
-                        burn_fee,
-                        num_issued_bet,
-                        moneyflow,
-                        moneyflow_through_issuebet,
-                        moneyflow_through_joinbet,
-                        moneyflow_through_finalize,
-                        shareholders_earned_amount,
-                        shareholders_paid_amount,
-                        winners_earned_amount,
-                        distributed_amount,
-                        burned_amount,
-                        game_operator_id)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                    NODE_IP,
-                    NODE_PORT,
-                    qt_basic_info['fee_per_slot_per_hour'],
-                    qt_basic_info['min_bet_slot_amount'],
-                    qt_basic_info['game_operator_fee'],
-                    qt_basic_info['share_holder_fee'],
-                    qt_basic_info['burn_fee'],
-                    qt_basic_info['n_issued_bet'],
-                    qt_basic_info['money_flow'],
-                    qt_basic_info['money_flow_through_issue_bet'],
-                    qt_basic_info['money_flow_through_join_bet'],
-                    qt_basic_info['money_flow_through_finalize_bet'],
-                    qt_basic_info['earned_amount_for_share_holder'],
-                    qt_basic_info['paid_amount_for_share_holder'],
-                    qt_basic_info['earned_amount_for_bet_winner'],
-                    qt_basic_info['distributed_amount'],
-                    qt_basic_info['burned_amount'],
-                    qt_basic_info['game_operator']
-                ))
-
-                conn.commit()
-                conn.close()
 
-            # Get the bet ids from db
-            conn = sqlite3.connect(DATABASE_FILE)
-            cursor = conn.cursor()
-            cursor.execute(f"SELECT bet_id FROM quottery_info")
-            db_bet_ids = cursor.fetchall()
-            db_bet_ids = [row[0] for row in db_bet_ids]
-            conn.close()
+def run_pipeline(scheduled_bet_ids, budget, writer):
+    """
+    Fetch the scheduled bets and their option details from node and write them, with all the stages overlapping:
+    PIPELINE_FETCHERS threads request the bet infos, one thread decodes them in batches, PIPELINE_FETCHERS threads
+    request the option details that changed, and the calling thread writes the rows in batches with the writer.
+    The stages are connected by queues of PIPELINE_QUEUE_SIZE items, so a slow stage holds back the previous ones.
+
+    :param scheduled_bet_ids: IDs of the bets to refresh, the most urgent first.
+    :param budget: Budget of the cycle. The bets and options left are fetched in the next cycles.
+    :param writer: CycleWriter of the cycle. It is not finished.
+    :return: Dictionary of the fetched bets, True if all the scheduled bets have been fetched,
+             the slot counts the written option details are up to date with,
+             and the number of options skipped because they did not change.
+    """
+    stop = Event()
+    bet_ids = queue.Queue()
+    for bet_id in scheduled_bet_ids:
+        bet_ids.put(bet_id)
+    payloads = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    options = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    rows = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    state_lock = Lock()
+    state = {'complete': True, 'deferred': 0, 'skipped': 0}
+
+    def fetch_bet_infos():
+        try:
+            while not stop.is_set():
+                try:
+                    bet_id = bet_ids.get_nowait()
+                except queue.Empty:
+                    return
+                if budget.exhausted():
+                    deferred = 1
+                    while True:
+                        try:
+                            bet_ids.get_nowait()
+                            deferred += 1
+                        except queue.Empty:
+                            break
+                    with state_lock:
+                        state['complete'] = False
+                        state['deferred'] += deferred
+                    return
+
+                sts, payload = get_bet_info_payload_from_node(bet_id)
+                budget.spend()
+                # The bet info is failed. Process the next one
+                if sts:
+                    with state_lock:
+                        state['complete'] = False
+                    continue
+                if not put_or_stop(payloads, (bet_id, payload), stop):
+                    return
+        except Exception as e:
+            logger.warning(f"Error fetching bet infos: {e}")
+            with state_lock:
+                state['complete'] = False
+        finally:
+            put_or_stop(payloads, PIPELINE_DONE, stop)
 
-            # Update the database
-            # TODO: Verify the existed one ? Or just update the newest one that is verified from node
-            active_bet_ids = []
-            conn = sqlite3.connect(DATABASE_FILE)
-            cursor = conn.cursor()
-            for key, active_bet in all_bets.items():
-                active_bet_ids.append(key)
-                # Update the database if the bet info is valid
-                if active_bet:
-                    # Check the bet from node is inactive
-                    ## Result checking
-                    bet_status = 1
-                    if active_bet['result'] >= 0:
-                        bet_status = 0
-                    cursor.execute('''
-                        INSERT OR REPLACE INTO quottery_info (
-                                    bet_id,
-                                    no_options,
-                                    creator,
-                                    bet_desc,
-                                    option_desc,
-                                    current_bet_state,
-                                    max_slot_per_option,
-                                    amount_per_bet_slot,
-                                    open_date,
-                                    close_date,
-                                    end_date,
-                                    open_time,
-                                    close_time,
-                                    end_time,
-                                    result,
-                                    no_ops,
-                                    oracle_id,
-                                    oracle_fee,
-                                    oracle_vote,
-                                    status,
-                                    current_num_selection,
-                                    current_total_qus,
-                                    betting_odds)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ''', (
-                        active_bet['bet_id'],
-                        active_bet['no_options'],
-                        active_bet['creator'],
-                        active_bet['bet_desc'],
-                        json.dumps(active_bet['option_desc']),  # This should be a separate table
-                        json.dumps(active_bet['current_bet_state']),
-                        active_bet['max_slot_per_option'],
-                        active_bet['amount_per_bet_slot'],
-                        active_bet['open_date'],
-                        active_bet['close_date'],
-                        active_bet['end_date'],
-                        active_bet['open_time'],
-                        active_bet['close_time'],
-                        active_bet['end_time'],
-                        active_bet['result'],
-                        active_bet['no_ops'],
-                        json.dumps(active_bet['oracle_id']),  # This should be a separate table
-                        json.dumps(active_bet['oracle_fee']),  # This should be a separate table
-                        json.dumps(active_bet['oracle_vote']),  # This should be a separate table
-                        bet_status,
-                        json.dumps(active_bet['current_bet_state']),
-                        '0',
-                        json.dumps(['1'] * active_bet['no_options']),
-                    ))
-                    update_betting_odds(conn, key)
-                    update_current_total_qus(conn, key)
-
-                    # Bet detail options
-                    number_of_options = active_bet['no_options']
-                    for op_id in range(0, number_of_options):
-                        sts, bet_option_detail = qt.get_bet_option_detail(active_bet['bet_id'], op_id)
-                        if bet_option_detail :
-                            #logger.info(f'Bet detail of bet %d options %d', active_bet['bet_id'], op_id)
-                            #logger.info(bet_option_detail)
-                            cursor.execute(f'''
-                                INSERT OR REPLACE INTO bet_options_detail (
-                                    bet_id,
-                                    option_id,
-                                    user_slots)
-                                VALUES (?, ?, ?)
-                                ''', (
-                                active_bet['bet_id'],
-                                op_id,
-                                json.dumps(bet_option_detail)
-                            ))
-
-            inactive_bet_ids = set(db_bet_ids) - set(active_bet_ids)
-            # Mark the old bet status as 0
-            update_statement = 'UPDATE quottery_info SET status = 0 WHERE bet_id IN ({});'.format(
-                ','.join('?' for _ in inactive_bet_ids))
-            cursor.execute(update_statement, list(inactive_bet_ids))
-
-
-            conn.commit()
-            conn.close()
+    def decode_bet_infos():
+        fetchers_left = PIPELINE_FETCHERS
+        try:
+            while fetchers_left:
+                # Decode what is waiting, up to a batch
+                batch = []
+                item = get_or_stop(payloads, stop)
+                while True:
+                    if item is PIPELINE_DONE:
+                        fetchers_left -= 1
+                    else:
+                        batch.append(item)
+                    if not fetchers_left or len(batch) >= PIPELINE_BATCH_SIZE:
+                        break
+                    try:
+                        item = payloads.get_nowait()
+                    except queue.Empty:
+                        break
+                if not batch:
+                    continue
+
+                bets_info, decoded = decode_bet_payloads([bet_id for bet_id, _ in batch],
+                                                         [payload for _, payload in batch])
+                if not decoded:
+                    with state_lock:
+                        state['complete'] = False
+                for bet_info in bets_info:
+                    if not put_or_stop(rows, ('bet', bet_info), stop):
+                        return
+                    # Only request the options that have new bettors
+                    for op_id in range(0, bet_info['no_options']):
+                        slot_count = bet_info['current_bet_state'][op_id]
+                        if not option_detail_needs_refresh(bet_info['bet_id'], op_id, slot_count):
+                            with state_lock:
+                                state['skipped'] += 1
+                            continue
+                        if not put_or_stop(options, (bet_info['bet_id'], op_id, slot_count), stop):
+                            return
         except Exception as e:
-           logger.warning(f"Error updating database: {e}")
+            logger.warning(f"Error decoding bet infos: {e}")
+            with state_lock:
+                state['complete'] = False
         finally:
-            time.sleep(UPDATE_INTERVAL)  # Wait for 3 seconds before the next update
+            for _ in range(PIPELINE_FETCHERS):
+                put_or_stop(options, PIPELINE_DONE, stop)
 
-if __name__ == '__main__':
-    # Init parameters with environment variables
+    def fetch_option_details():
+        try:
+            while True:
+                task = get_or_stop(options, stop)
+                if task is PIPELINE_DONE:
+                    return
+                bet_id, op_id, slot_count = task
+                # The options left are fetched in the next cycles
+                if budget.exhausted():
+                    continue
+                option_row, up_to_date = fetch_bet_option_detail(bet_id, op_id, slot_count, budget)
+                if not put_or_stop(rows, ('option', (bet_id, op_id), slot_count, option_row, up_to_date), stop):
+                    return
+        except Exception as e:
+            logger.warning(f"Error fetching bet option details: {e}")
+        finally:
+            put_or_stop(rows, PIPELINE_DONE, stop)
+
+    threads = [Thread(target=fetch_bet_infos, daemon=True) for _ in range(PIPELINE_FETCHERS)]
+    threads.append(Thread(target=decode_bet_infos, daemon=True))
+    threads.extend(Thread(target=fetch_option_details, daemon=True) for _ in range(PIPELINE_FETCHERS))
+    for thread in threads:
+        thread.start()
+
+    all_bets = {}
+    fetched_slot_states = {}
+    try:
+        # Single writer. Write what is waiting, up to a batch
+        producers_left = PIPELINE_FETCHERS
+        while producers_left:
+            bet_rows = []
+            option_rows = []
+            item = rows.get()
+            while True:
+                if item is PIPELINE_DONE:
+                    producers_left -= 1
+                elif item[0] == 'bet':
+                    bet_info = item[1]
+                    all_bets[bet_info['bet_id']] = bet_info
+                    bet_rows.append(make_quottery_info_row(bet_info))
+                else:
+                    _, state_key, slot_count, option_row, up_to_date = item
+                    if up_to_date:
+                        fetched_slot_states[state_key] = slot_count
+                    if option_row:
+                        option_rows.append(option_row)
+                if not producers_left or len(bet_rows) + len(option_rows) >= PIPELINE_BATCH_SIZE:
+                    break
+                try:
+                    item = rows.get_nowait()
+                except queue.Empty:
+                    break
+            writer.write_bets(bet_rows)
+            writer.write_options(option_rows)
+    finally:
+        # Stop the other stages if the writer failed
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    if state['deferred']:
+        logger.info(f"Cycle budget exhausted. Defer {state['deferred']} bets")
+    return all_bets, state['complete'], fetched_slot_states, state['skipped']
+
+
+def write_cycle_to_database(conn, tick_number, qt_basic_info, bet_rows, option_rows, active_bet_ids,
+                            change_tick=0):
+    """
+    Write everything fetched during a cycle in a single transaction, so readers never see a half-written cycle.
+    The real changes of the bets are appended to the bet_changes log in the same transaction.
+
+    :param conn: The long-lived SQLite connection.
+    :param tick_number: Tick of the fetched bets.
+    :param qt_basic_info: Quottery basic info from node. Skipped if empty.
+    :param bet_rows: quottery_info rows to insert or replace.
+    :param option_rows: bet_options_detail rows to insert or replace.
+    :param active_bet_ids: IDs of the bets that are active on node.
+    :param change_tick: Tick of the node when the changes were seen. The database tick is used if 0.
+    :return: Number of inserted rows, number of replaced rows and the tick number of the database.
+    """
+    writer = CycleWriter(conn, tick_number=tick_number, change_tick=change_tick)
+    try:
+        writer.write_bets(bet_rows)
+        writer.write_options(option_rows)
+        return writer.finish(tick_number, qt_basic_info, active_bet_ids)
+    except Exception:
+        writer.abort()
+        raise
+
+
+class CycleWriter:
+    """
+    Writes the rows of a cycle in batches, as they are fetched, within a single transaction.
+    The transaction begins with the first batch, so the database is not locked while the node is requested.
+    Readers only see the cycle once finish() commits it.
+    """
+
+    def __init__(self, conn, tick_number=0, change_tick=0):
+        """
+        :param conn: The long-lived SQLite connection.
+        :param tick_number: Tick of the fetched bets, if already known.
+        :param change_tick: Tick of the node when the changes were seen. The database tick is used if 0.
+        """
+        self.conn = conn
+        self.cursor = None
+        self.tick_number = tick_number
+        self.change_tick = change_tick
+        self.previous_bets = {}
+        self.written_bet_ids = set()
+        self.rows_inserted = 0
+        self.rows_updated = 0
+
+    def begin(self):
+        """ Begin the transaction of the cycle, if not already done """
+        if self.cursor is not None:
+            return
+        self.cursor = self.conn.cursor()
+        self.cursor.execute('BEGIN IMMEDIATE')
+        # Get the bets from db, to find what changed
+        self.cursor.execute('''
+            SELECT bet_id, current_bet_state, betting_odds, status, result, oracle_vote FROM quottery_info
+        ''')
+        self.previous_bets = {row[0]: row[1:] for row in self.cursor.fetchall()}
+        self.cursor.execute("SELECT tick_number FROM tick_info")
+        self.change_tick = self.change_tick or max(self.cursor.fetchone()[0], self.tick_number)
+
+    def log_changes(self, changes):
+        self.cursor.executemany('''
+            INSERT INTO bet_changes (tick_number, bet_id, option_id, change_type, payload)
+            VALUES (?, ?, ?, ?, ?)
+            ''', [(self.change_tick,) + change for change in changes])
+
+    def write_bets(self, bet_rows):
+        """ Insert or replace quottery_info rows """
+        if not bet_rows:
+            return
+        self.begin()
+        changes = compute_bet_changes(self.previous_bets, bet_rows, {}, [])
+
+        # TODO: Verify the existed one ? Or just update the newest one that is verified from node
+        self.cursor.executemany('''
+            INSERT OR REPLACE INTO quottery_info (
+                        bet_id,
+                        no_options,
+                        creator,
+                        bet_desc,
+                        option_desc,
+                        current_bet_state,
+                        max_slot_per_option,
+                        amount_per_bet_slot,
+                        open_date,
+                        close_date,
+                        end_date,
+                        open_time,
+                        close_time,
+                        end_time,
+                        result,
+                        no_ops,
+                        oracle_id,
+                        oracle_fee,
+                        oracle_vote,
+                        status,
+                        current_num_selection,
+                        current_total_qus,
+                        betting_odds)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ''', bet_rows)
+        self.log_changes(changes)
+
+        updated = sum(1 for row in bet_rows if row[0] in self.previous_bets)
+        self.rows_updated += updated
+        self.rows_inserted += len(bet_rows) - updated
+        self.written_bet_ids.update(row[0] for row in bet_rows)
+
+    def write_options(self, option_rows):
+        """ Insert or replace bet_options_detail rows """
+        if not option_rows:
+            return
+        self.begin()
+        # Read the previous rows in one query per chunk, within the limit of the SQL variables
+        previous_options = {}
+        for start in range(0, len(option_rows), OPTION_QUERY_CHUNK):
+            keys = [key for bet_id, option_id, _ in option_rows[start:start + OPTION_QUERY_CHUNK]
+                    for key in (bet_id, option_id)]
+            self.cursor.execute(f'''
+                SELECT bet_id, option_id, user_slots FROM bet_options_detail
+                WHERE (bet_id, option_id) IN (VALUES {', '.join(['(?, ?)'] * (len(keys) // 2))})
+            ''', keys)
+            previous_options.update(((bet_id, option_id), user_slots)
+                                    for bet_id, option_id, user_slots in self.cursor.fetchall())
+        changes = compute_bet_changes({}, [], previous_options, option_rows)
+
+        self.cursor.executemany(f'''
+            INSERT OR REPLACE INTO bet_options_detail (
+                bet_id,
+                option_id,
+                user_slots)
+            VALUES (?, ?, ?)
+            ''', option_rows)
+        self.log_changes(changes)
+
+        self.rows_updated += len(previous_options)
+        self.rows_inserted += len(option_rows) - len(previous_options)
+
+    def finish(self, tick_number, qt_basic_info, active_bet_ids):
+        """
+        Write the tick and the basic info, mark the bets that are not active anymore and commit.
+
+        :param tick_number: Tick of the fetched bets.
+        :param qt_basic_info: Quottery basic info from node. Skipped if empty.
+        :param active_bet_ids: IDs of the bets that are active on node.
+        :return: Number of inserted rows, number of replaced rows and the tick number of the database.
+        """
+        self.begin()
+        cursor = self.cursor
+        # Update tick number with the latest
+        cursor.execute('''
+            UPDATE tick_info SET tick_number = MAX(tick_number, ?)
+        ''', (tick_number,))
+
+        if qt_basic_info:
+            cursor.execute(f'''
+                INSERT OR REPLACE INTO node_basic_info (
+                    ip,
+                    port,
+                    fee_per_slot_per_hour,
+                    min_amount_per_slot,
+                    game_operator_fee,
+                    shareholders_fee,
+                    burn_fee,
+                    num_issued_bet,
+                    moneyflow,
+                    moneyflow_through_issuebet,
+                    moneyflow_through_joinbet,
+                    moneyflow_through_finalize,
+                    shareholders_earned_amount,
+                    shareholders_paid_amount,
+                    winners_earned_amount,
+                    distributed_amount,
+                    burned_amount,
+                    game_operator_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                NODE_IP,
+                NODE_PORT,
+                qt_basic_info['fee_per_slot_per_hour'],
+                qt_basic_info['min_bet_slot_amount'],
+                qt_basic_info['game_operator_fee'],
+                qt_basic_info['share_holder_fee'],
+                qt_basic_info['burn_fee'],
+                qt_basic_info['n_issued_bet'],
+                qt_basic_info['money_flow'],
+                qt_basic_info['money_flow_through_issue_bet'],
+                qt_basic_info['money_flow_through_join_bet'],
+                qt_basic_info['money_flow_through_finalize_bet'],
+                qt_basic_info['earned_amount_for_share_holder'],
+                qt_basic_info['paid_amount_for_share_holder'],
+                qt_basic_info['earned_amount_for_bet_winner'],
+                qt_basic_info['distributed_amount'],
+                qt_basic_info['burned_amount'],
+                qt_basic_info['game_operator']
+            ))
+
+        # Mark the old bet status as 0
+        inactive_bet_ids = set(self.previous_bets) - set(active_bet_ids)
+        cursor.executemany('UPDATE quottery_info SET status = 0 WHERE bet_id = ?',
+                           [(bet_id,) for bet_id in inactive_bet_ids])
+        changes = []
+        for bet_id in sorted(inactive_bet_ids - self.written_bet_ids):
+            if self.previous_bets[bet_id][2] != 0:
+                changes.append((bet_id, None, CHANGE_STATUS, json.dumps({
+                    'status': 0,
+                    'result': self.previous_bets[bet_id][3]})))
+        self.log_changes(changes)
+
+        cursor.execute("SELECT tick_number FROM tick_info")
+        db_tick_number = cursor.fetchone()[0]
+
+        self.conn.commit()
+        return self.rows_inserted, self.rows_updated, db_tick_number
+
+    def abort(self):
+        if self.cursor is not None:
+            self.conn.rollback()
+
+
+def compact_change_log(conn):
+    """
+    Drop the old entries of the bet_changes log superseded by a later change of the same kind
+    (same bet, type and option). The last CHANGE_LOG_KEEP entries are kept as they are.
+    Consumers reading from an old sequence still get the last value of everything that changed.
+
+    :param conn: The long-lived SQLite connection.
+    :return: Number of removed entries.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('''
+            DELETE FROM bet_changes
+            WHERE seq <= (SELECT MAX(seq) FROM bet_changes) - ?
+              AND change_type != ?
+              AND EXISTS (
+                SELECT 1 FROM bet_changes AS later
+                WHERE later.bet_id = bet_changes.bet_id
+                  AND later.change_type = bet_changes.change_type
+                  AND later.option_id IS bet_changes.option_id
+                  AND later.seq > bet_changes.seq)
+        ''', (CHANGE_LOG_KEEP, CHANGE_NEW_BET))
+        removed_count = cursor.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return removed_count
+
+
+def archive_settled_bets(conn, active_bet_ids):
+    """
+    Move the settled bets from the hot tables into the cold tables, then give the free pages back.
+    A bet is settled when it is not active on node anymore and has a result or an inactive status.
+    It is only archived ARCHIVE_GRACE_PERIOD seconds after its end time.
+
+    :param conn: The long-lived SQLite connection.
+    :param active_bet_ids: IDs of the bets that are active on node.
+    :return: Number of archived bets.
+    """
+    utc_now = datetime.now(timezone.utc)
+    active_bet_ids = set(active_bet_ids)
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('''
+            SELECT bet_id, end_date, end_time
+            FROM quottery_info
+            WHERE result >= 0 OR status = 0
+        ''')
+        archived_bet_ids = []
+        for bet_id, end_date, end_time in cursor.fetchall():
+            if bet_id in active_bet_ids:
+                continue
+            end_datetime = parse_bet_datetime(end_date, end_time)
+            if end_datetime and (utc_now - end_datetime).total_seconds() >= ARCHIVE_GRACE_PERIOD:
+                archived_bet_ids.append((bet_id,))
+
+        cursor.executemany('''
+            INSERT OR REPLACE INTO quottery_info_archive SELECT * FROM quottery_info WHERE bet_id = ?
+        ''', archived_bet_ids)
+        cursor.executemany('''
+            INSERT OR REPLACE INTO bet_options_detail_archive SELECT * FROM bet_options_detail WHERE bet_id = ?
+        ''', archived_bet_ids)
+        cursor.executemany('''
+            INSERT OR REPLACE INTO archive_ticks (bet_id, tick_number) SELECT ?, tick_number FROM tick_info
+        ''', archived_bet_ids)
+        cursor.executemany('DELETE FROM bet_options_detail WHERE bet_id = ?', archived_bet_ids)
+        cursor.executemany('DELETE FROM quottery_info WHERE bet_id = ?', archived_bet_ids)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    # Give the free pages back to the file system so the file does not bloat
+    if archived_bet_ids:
+        cursor.execute('PRAGMA incremental_vacuum')
+        cursor.fetchall()
+    return len(archived_bet_ids)
+
+
+def write_epoch_shard(conn, shard_file):
+    """
+    Copy the cold tables of the database into a new shard file, with the same schema.
+
+    :param conn: The long-lived SQLite connection.
+    :param shard_file: Path of the shard. It only appears once complete.
+    :return: Number of bets copied.
+    """
+    os.makedirs(os.path.dirname(shard_file) or '.', exist_ok=True)
+    tmp_file = shard_file + '.tmp'
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+    shard_conn = sqlite3.connect(tmp_file)
+    try:
+        cursor = shard_conn.cursor()
+        create_archive_tables(cursor)
+        cursor.execute('CREATE INDEX IF NOT EXISTS quottery_info_archive_creator ON quottery_info_archive (creator)')
+        shard_conn.commit()
+    finally:
+        shard_conn.close()
+
+    conn.execute('ATTACH DATABASE ? AS shard', (tmp_file,))
+    try:
+        cursor = conn.cursor()
+        cursor.execute('INSERT INTO shard.quottery_info_archive SELECT * FROM main.quottery_info_archive')
+        bet_count = cursor.rowcount
+        cursor.execute('INSERT INTO shard.bet_options_detail_archive SELECT * FROM main.bet_options_detail_archive')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute('DETACH DATABASE shard')
+    os.replace(tmp_file, shard_file)
+    return bet_count
+
+
+def seal_epoch(conn, epoch, initial_tick):
+    """
+    Follow the epoch of the node in tick_info. When it advances and SHARD_DIR is set, the bets archived during the
+    previous epoch are moved from the cold tables into the shard of that epoch, which is never written again.
+    The tick range of the shard covers the ticks its bets were archived at. The bets archived before the ticks were
+    recorded (before the version 3.1) count as archived at tick 0.
+
+    :param conn: The long-lived SQLite connection.
+    :param epoch: Epoch of the node. 0 if unknown.
+    :param initial_tick: First tick of the epoch on node.
+    :return: Path of the written shard, None if none was written.
+    """
+    db_epoch, db_initial_tick = conn.execute('SELECT epoch, initial_tick FROM tick_info').fetchone()
+    if epoch <= db_epoch:
+        return None
+
+    shard_file = None
+    bet_count = 0
+    file_name = os.path.join(SHARD_DIR, f"epoch_{db_epoch}.db")
+    archived_count = conn.execute('SELECT COUNT(*) FROM quottery_info_archive').fetchone()[0]
+    # An epoch without archived bets has no shard
+    if SHARD_DIR and db_epoch > 0 and archived_count:
+        # Nothing reads the file until it is registered in epoch_shards. If the updater stops before, it is
+        # written again from the same cold tables
+        shard_file = os.path.join(os.path.dirname(DATABASE_FILE), file_name)
+        bet_count = write_epoch_shard(conn, shard_file)
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        if bet_count:
+            first_archive_tick, last_archive_tick = cursor.execute('''
+                SELECT MIN(COALESCE(archive_ticks.tick_number, 0)), MAX(COALESCE(archive_ticks.tick_number, 0))
+                FROM quottery_info_archive LEFT JOIN archive_ticks USING (bet_id)
+            ''').fetchone()
+            first_tick = min(db_initial_tick, first_archive_tick)
+            last_tick = max(first_tick, initial_tick - 1, last_archive_tick)
+            cursor.execute('''
+                INSERT OR REPLACE INTO epoch_shards (epoch, first_tick, last_tick, file_name, bet_count)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (db_epoch, first_tick, last_tick, file_name, bet_count))
+            cursor.execute('DELETE FROM bet_options_detail_archive')
+            cursor.execute('DELETE FROM quottery_info_archive')
+            cursor.execute('DELETE FROM archive_ticks')
+        cursor.execute('UPDATE tick_info SET epoch = ?, initial_tick = ?', (epoch, initial_tick))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    if not bet_count:
+        return None
+    # Give the free pages back to the file system, as the archival stage does
+    cursor.execute('PRAGMA incremental_vacuum')
+    cursor.fetchall()
+    return shard_file
+
+
+def checkpoint_database(conn):
+    """ Copy the committed cycles from the WAL file into the database file without blocking the readers """
+    conn.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchall()
+
+    # Truncate the WAL file when it grows too much. Gives up if a reader is still using it
+    wal_file = DATABASE_FILE + '-wal'
+    if os.path.isfile(wal_file) and os.path.getsize(wal_file) > WAL_TRUNCATE_SIZE:
+        busy, _, _ = conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+        if busy:
+            logger.info("WAL file is still in use by readers. Truncate it later")
+
+
+def publish_snapshot(conn):
+    """
+    Copy the committed database into a new generation file and expose it to the readers
+    by atomically replacing the pointer file. The old generations are removed.
+
+    :param conn: The long-lived SQLite connection.
+    :return: Path of the published generation file.
+    """
+    database_dir = os.path.dirname(DATABASE_FILE)
+    database_name = os.path.basename(DATABASE_FILE)
+    generation = time.time_ns()
+    snapshot_name = f"{database_name}.gen{generation}"
+    snapshot_file = os.path.join(database_dir, snapshot_name)
+
+    snapshot_conn = sqlite3.connect(snapshot_file)
+    try:
+        conn.backup(snapshot_conn)
+        # The generation file is never written again. Readers open it as immutable
+        snapshot_conn.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        snapshot_conn.close()
+
+    # Readers follow the pointer file. Rename is atomic, they see either the old or the new generation
+    pointer_file = DATABASE_FILE + SNAPSHOT_POINTER_SUFFIX
+    pointer_tmp_file = pointer_file + '.tmp'
+    with open(pointer_tmp_file, 'w') as f:
+        f.write(snapshot_name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer_tmp_file, pointer_file)
+
+    # Keep the last generations for the readers that resolved the pointer just before the switch
+    generations = sorted(
+        (int(name[len(database_name) + 4:]), name) for name in os.listdir(database_dir or '.')
+        if name.startswith(database_name + '.gen') and name[len(database_name) + 4:].isdigit())
+    for _, name in generations[:-SNAPSHOT_KEEP]:
+        try:
+            os.remove(os.path.join(database_dir, name))
+        except OSError as e:
+            logger.warning(f"Error removing old snapshot {name}: {e}")
+
+    return snapshot_file
+
+
+def load_memory_database():
+    """ Copy the database file into the shared in-memory database of the memory mode, and publish it """
+    global memory_keeper
+    memory_keeper = sqlite3.connect(memory_database_uri(MEMORY_DATABASE), uri=True)
+    file_conn = sqlite3.connect(DATABASE_FILE)
+    try:
+        file_conn.backup(memory_keeper)
+    finally:
+        file_conn.close()
+    return publish_memory_generation(memory_keeper)
+
+
+def publish_memory_generation(conn):
+    """
+    Copy the committed database into a new in-memory generation and expose it to the readers of the process.
+    The readers connect to the generation named by published_memory_database, which is never written again.
+
+    :param conn: The long-lived SQLite connection.
+    :return: Name of the published generation.
+    """
+    global published_memory_database
+    name = f"{MEMORY_DATABASE}.gen{time.time_ns()}"
+    # Used by the snapshots, from any thread
+    generation_conn = sqlite3.connect(memory_database_uri(name), uri=True, check_same_thread=False)
+    conn.backup(generation_conn)
+
+    with memory_lock:
+        memory_generations.append(generation_conn)
+        published_memory_database = name
+        # A reader may have read the name of the previous generation just before the switch
+        keep = max(SNAPSHOT_KEEP, 2)
+        old_generations = memory_generations[:-keep]
+        del memory_generations[:-keep]
+    # The memory of a generation is freed when its last reader closes
+    for old_conn in old_generations:
+        old_conn.close()
+    return name
+
+
+def connect_published_memory_database(**kwargs):
+    """ Read-only connection to the last generation published in the memory mode. None if there is none yet """
+    name = published_memory_database
+    if name is None:
+        return None
+    conn = sqlite3.connect(memory_database_uri(name), uri=True, **kwargs)
+    conn.execute('PRAGMA query_only = 1')
+    return conn
+
+
+def snapshot_memory_database(force=False):
+    """
+    Write the last published generation into the database file, every MEMORY_SNAPSHOT_INTERVAL seconds.
+
+    :return: Path of the database file, None if it is not time yet.
+    """
+    global last_memory_snapshot_time
+    if not force and last_memory_snapshot_time is not None and \
+            time.monotonic() - last_memory_snapshot_time < MEMORY_SNAPSHOT_INTERVAL:
+        return None
+    with memory_lock:
+        if not memory_generations:
+            return None
+        backup_database(memory_generations[-1], DATABASE_FILE)
+    last_memory_snapshot_time = time.monotonic()
+    return DATABASE_FILE
+
+
+def publish_database(conn):
+    """ Expose the committed cycle to the readers, depending on PUBLISH_MODE """
+    if PUBLISH_MODE == 'memory':
+        publish_memory_generation(conn)
+        return
+    checkpoint_database(conn)
+    if PUBLISH_MODE == 'snapshot':
+        publish_snapshot(conn)
+    elif os.path.exists(DATABASE_FILE + SNAPSHOT_POINTER_SUFFIX):
+        # Readers go back to the live database
+        os.remove(DATABASE_FILE + SNAPSHOT_POINTER_SUFFIX)
+
+
+def notify_committed_cycle(tick_number):
+    """ Tell the app processes that a new cycle is visible, so they drop the data they cached """
+    if commit_publisher is None:
+        return None
+    return commit_publisher.publish(tick_number)
+
+
+def artifacts_directory():
+    return os.path.join(os.path.dirname(DATABASE_FILE), ARTIFACTS_DIR)
+
+
+def write_file_atomically(file_path, data):
+    """ Write into a temporary file and rename it, so the readers never see a partial file """
+    tmp_file = file_path + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_file, file_path)
+
+
+def remove_artifacts_manifest():
+    if not ARTIFACTS_DIR:
+        return
+    try:
+        os.remove(os.path.join(artifacts_directory(), bet_views.ARTIFACTS_MANIFEST))
+    except FileNotFoundError:
+        pass
+
+
+def materialize_artifacts(conn):
+    """
+    Pre-render the responses of the app requests without params from the committed cycle, plain and gzipped.
+    The files of each cycle have their own version. The manifest listing them is replaced last, so the app
+    switches to a new version at once. The files of the previous version are kept for the readers using them.
+
+    :param conn: The long-lived SQLite connection.
+    :return: Version of the artifacts.
+    """
+    global artifacts_version
+    if not ARTIFACTS_DIR:
+        return None
+
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute('BEGIN')
+    try:
+        bets_list = [bet_columns.decode_bet(dict(row)) for row in cursor.execute('SELECT * FROM quottery_info')]
+        node_info = [dict(row) for row in cursor.execute('SELECT * FROM node_basic_info')]
+        tick_row = cursor.execute('SELECT * FROM tick_info').fetchone()
+    finally:
+        conn.rollback()
+    tick_info = dict(tick_row) if tick_row else {}
+
+    artifacts_dir = artifacts_directory()
+    os.makedirs(artifacts_dir, exist_ok=True)
+    version = time.time_ns()
+    manifest = {
+        'version': version,
+        'tick_number': tick_info.get('tick_number', 0),
+        'page_size': PAGINATION_THRESHOLD,
+        'artifacts': {},
+    }
+    artifacts = bet_views.render_artifacts(bets_list, node_info, tick_info, PAGINATION_THRESHOLD)
+    for key, (body, valid_until) in artifacts.items():
+        data = body.encode()
+        file_name = f"{key}.{version}.json"
+        write_file_atomically(os.path.join(artifacts_dir, file_name), data)
+        write_file_atomically(os.path.join(artifacts_dir, file_name + '.gz'),
+                              gzip.compress(data, compresslevel=ARTIFACTS_GZIP_LEVEL, mtime=0))
+        manifest['artifacts'][key] = {'file': file_name, 'gzip': file_name + '.gz', 'valid_until': valid_until}
+    write_file_atomically(os.path.join(artifacts_dir, bet_views.ARTIFACTS_MANIFEST), json.dumps(manifest).encode())
+
+    previous_version = artifacts_version
+    artifacts_version = version
+    kept_versions = {str(version), str(previous_version)}
+    for name in os.listdir(artifacts_dir):
+        parts = name.split('.')
+        if len(parts) >= 3 and parts[0] in bet_views.ARTIFACT_KEYS and parts[1] not in kept_versions:
+            try:
+                os.remove(os.path.join(artifacts_dir, name))
+            except OSError as e:
+                logger.warning(f"Error removing old artifact {name}: {e}")
+    return version
+
+
+def write_updater_stats(conn, cycle):
+    """
+    Append the measures of a cycle to the updater_stats table, keeping the last METRICS_HISTORY cycles.
+
+    :param conn: The long-lived SQLite connection.
+    :param cycle: The finished CycleMetrics.
+    """
+    stats = cycle.to_dict()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('''
+            INSERT INTO updater_stats (
+                cycle_time,
+                tick_number,
+                chain_tick,
+                tick_lag,
+                duration,
+                phases,
+                rpc_count,
+                rpc_errors,
+                bytes_received,
+                rows_inserted,
+                rows_updated,
+                rows_skipped,
+                rpc_stats)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+            stats['cycle_time'],
+            stats['tick_number'],
+            stats['chain_tick'],
+            stats['tick_lag'],
+            stats['duration'],
+            json.dumps(stats['phases']),
+            stats['rpc_count'],
+            stats['rpc_errors'],
+            stats['bytes_received'],
+            stats['rows_inserted'],
+            stats['rows_updated'],
+            stats['rows_skipped'],
+            json.dumps(stats['rpc_stats'])
+        ))
+        cursor.execute('DELETE FROM updater_stats WHERE cycle_id <= (SELECT MAX(cycle_id) FROM updater_stats) - ?',
+                       (METRICS_HISTORY,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def record_cycle_metrics(cycle):
+    """ Close the measures of a cycle, then log them and expose them on the metrics port and stats table """
+    cycle.finish(qt.get_latency_stats(reset=True))
+    metrics_registry.record(cycle)
+
+    phases = ', '.join(f"{phase} {duration * 1000:.0f}ms" for phase, duration in cycle.phases.items() if duration)
+    logger.info(f"Cycle took {cycle.duration * 1000:.0f}ms ({phases}). "
+                f"Rows: {cycle.rows_inserted} inserted, {cycle.rows_updated} updated, {cycle.rows_skipped} skipped. "
+                f"Tick lag: {cycle.tick_lag}")
+    # Report the latency of the node requests made during this cycle
+    for request_name, stats in cycle.rpc_stats.items():
+        logger.info(f"RPC {request_name}: {stats['count']} calls, {stats['errors']} failed, "
+                    f"avg {stats['avg'] * 1000:.1f}ms, max {stats['max'] * 1000:.1f}ms, {stats['bytes']} bytes")
+
+    try:
+        write_updater_stats(get_db_connection(), cycle)
+    except sqlite3.Error as e:
+        logger.warning(f"Error writing updater stats: {e}")
+
+
+def run_update_cycle(tick_number, full_reconcile):
+    """
+    Refresh the scheduled bets from node and write them into the database.
+
+    :param tick_number: Current tick of the node.
+    :param full_reconcile: Start refetching all the option details regardless of their slot count, over this cycle
+                           and the next ones.
+    """
+    cycle = updater_metrics.CycleMetrics()
+    cycle.chain_tick = tick_number
+    try:
+        update_cycle_with_metrics(tick_number, full_reconcile, cycle)
+    finally:
+        record_cycle_metrics(cycle)
+
+
+def update_cycle_with_metrics(tick_number, full_reconcile, cycle):
+    """ Body of run_update_cycle, measuring each phase into the CycleMetrics cycle """
+    global last_archive_time
+    budget = CycleBudget(CYCLE_TIME_BUDGET, CYCLE_RPC_BUDGET)
+    fetched_bet_payloads.clear()
+
+    logger.info("Requesting data from node.")
+    with cycle.phase('active_list'):
+        sts, active_bet_ids = get_active_bets_from_node()
+    budget.spend()
+    if sts:
+        logger.warning('[WARNING] Active bets from node are not available! Using the local database')
+        return
+
+    if full_reconcile:
+        start_option_reconcile(active_bet_ids)
+    scheduled_bet_ids = schedule_bets(active_bet_ids)
+    logger.info(f"Server responds {len(active_bet_ids)} bets. Refreshing {len(scheduled_bet_ids)} of them")
+    try:
+        if PIPELINE_FETCHERS > 0:
+            all_bets, fetched_slot_states = update_cycle_pipelined(tick_number, cycle, budget, active_bet_ids,
+                                                                   scheduled_bet_ids)
+        else:
+            all_bets, fetched_slot_states = update_cycle_sequential(tick_number, cycle, budget, active_bet_ids,
+                                                                    scheduled_bet_ids)
+    except sqlite3.Error:
+        # Start over with a fresh connection on the next cycle
+        close_db_connection()
+        raise
+
+    update_bet_schedule(all_bets, active_bet_ids)
+    # The written option details are now up to date with these slot counts
+    option_slot_states.update(fetched_slot_states)
+    reconcile_pending.difference_update(fetched_slot_states)
+    # Forget the slot counts of the bets that are not active anymore
+    active_bet_ids = set(active_bet_ids)
+    for state_key in list(option_slot_states):
+        if state_key[0] not in active_bet_ids:
+            del option_slot_states[state_key]
+    for state_key in list(reconcile_pending):
+        if state_key[0] not in active_bet_ids:
+            reconcile_pending.discard(state_key)
+
+    try:
+        save_rpc_cache(cycle, all_bets, fetched_slot_states, active_bet_ids)
+    except sqlite3.Error as e:
+        logger.warning(f"Error saving the RPC cache: {e}")
+
+    # Periodically move the settled bets out of the hot tables
+    if last_archive_time is None or time.monotonic() - last_archive_time >= ARCHIVE_INTERVAL:
+        last_archive_time = time.monotonic()
+        with cycle.phase('archive'):
+            archived_count = archive_settled_bets(get_db_connection(), active_bet_ids)
+            compacted_count = compact_change_log(get_db_connection())
+        if archived_count:
+            logger.info(f"Archived {archived_count} settled bets")
+        if compacted_count:
+            logger.info(f"Compacted {compacted_count} entries of the change log")
+
+    # Once the node enters a new epoch, the bets archived during the previous one move into their shard
+    with cycle.phase('archive'):
+        shard_file = seal_epoch(get_db_connection(), *node_epoch)
+    if shard_file:
+        logger.info(f"Moved the bets archived during the previous epoch into {shard_file}")
+
+    try:
+        with cycle.phase('publish'):
+            publish_database(get_db_connection())
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"Error publishing database: {e}")
+
+    try:
+        notify_committed_cycle(tick_number)
+    except OSError as e:
+        logger.warning(f"Error notifying the committed cycle: {e}")
+
+    try:
+        with cycle.phase('materialize'):
+            materialize_artifacts(get_db_connection())
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"Error writing the pre-rendered responses: {e}")
+
+    try:
+        with cycle.phase('backup'):
+            backup_file = backup_periodically(get_db_connection())
+        if backup_file:
+            logger.info(f"Backed up database into {backup_file}")
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"Error backing up database: {e}")
+
+    if PUBLISH_MODE == 'memory':
+        try:
+            with cycle.phase('backup'):
+                snapshot_memory_database()
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Error writing the in-memory database into {DATABASE_FILE}: {e}")
+
+    # Append the identities computed during this cycle to the persisted cache
+    qt.save_identity_cache()
+
+
+def update_cycle_sequential(tick_number, cycle, budget, active_bet_ids, scheduled_bet_ids):
+    """
+    Fetch, decode and write the cycle one stage after the other.
+
+    :return: Dictionary of the fetched bets and the slot counts the written option details are up to date with.
+    """
+    with cycle.phase('bet_info'):
+        all_bets, complete = fetch_scheduled_bets_from_node(scheduled_bet_ids, budget)
+
+    with cycle.phase('basic_info'):
+        sts, qt_basic_info = get_qtry_basic_info_from_node()
+    budget.spend()
+    if not qt_basic_info:
+        logger.warning('[WARNING] Basic info from node is empty!')
+
+    # Everything is fetched and computed in memory before touching the database
+    with cycle.phase('option_details'):
+        bet_rows = [make_quottery_info_row(active_bet) for active_bet in all_bets.values()]
+        option_rows, fetched_slot_states, skipped_options = fetch_bet_options_detail(all_bets, budget)
+    # The active bets left out by the scheduler are skipped as well
+    cycle.rows_skipped = len(active_bet_ids) - len(all_bets) + skipped_options
+
+    # Only report the tick number if all the scheduled bets are up to date with it
+    if not complete:
+        tick_number = 0
+
+    with cycle.phase('db_write'):
+        cycle.rows_inserted, cycle.rows_updated, cycle.tick_number = write_cycle_to_database(
+            get_db_connection(), tick_number, qt_basic_info, bet_rows, option_rows, active_bet_ids,
+            change_tick=cycle.chain_tick)
+    return all_bets, fetched_slot_states
+
+
+def update_cycle_pipelined(tick_number, cycle, budget, active_bet_ids, scheduled_bet_ids):
+    """
+    Fetch, decode and write the cycle with run_pipeline, then commit it.
+
+    :return: Dictionary of the fetched bets and the slot counts the written option details are up to date with.
+    """
+    with cycle.phase('basic_info'):
+        sts, qt_basic_info = get_qtry_basic_info_from_node()
+    budget.spend()
+    if not qt_basic_info:
+        logger.warning('[WARNING] Basic info from node is empty!')
+
+    writer = CycleWriter(get_db_connection(), change_tick=cycle.chain_tick)
+    try:
+        with cycle.phase('pipeline'):
+            all_bets, complete, fetched_slot_states, skipped_options = run_pipeline(
+                scheduled_bet_ids, budget, writer)
+        # The active bets left out by the scheduler are skipped as well
+        cycle.rows_skipped = len(active_bet_ids) - len(all_bets) + skipped_options
+
+        # Only report the tick number if all the scheduled bets are up to date with it
+        if not complete:
+            tick_number = 0
+
+        with cycle.phase('db_write'):
+            cycle.rows_inserted, cycle.rows_updated, cycle.tick_number = writer.finish(
+                tick_number, qt_basic_info, active_bet_ids)
+    except Exception:
+        writer.abort()
+        raise
+    return all_bets, fetched_slot_states
+
+
+def update_database_with_bets():
+    """
+    Fetch all bet data related from node and update the database when the tick of the node advances, until
+    updater_stop is set. Must be called after start_updater.
+    """
+    global rpc_payload_cache
+    # SQLite objects can only be used by the thread creating them: the connection and the RPC cache are opened
+    # here, in the thread of the loop. The node info was reset by init_db
+    notify_committed_cycle(get_db_connection().execute('SELECT tick_number FROM tick_info').fetchone()[0])
+    if RPC_CACHE_FILE:
+        rpc_payload_cache = rpc_cache.RpcCache(RPC_CACHE_FILE)
+
+    # Resuming from the cache, the first full reconcile comes after OPTION_DETAIL_RECONCILE_INTERVAL cycles
+    update_cycle = 0
+    try:
+        if load_rpc_cache():
+            update_cycle = 1
+            logger.info(f"Resumed {len(bet_schedule)} bets from the RPC cache")
+    except sqlite3.Error as e:
+        logger.warning(f"Error loading the RPC cache: {e}")
+    last_tick_number = 0
+    last_cycle_time = None
+    while not updater_stop.is_set():
+        poll_time = time.monotonic()
+        sts, tick_number = get_tick_number_from_node()
+
+        # Start a cycle when the tick advances. If the tick is not available,
+        # fall back to a cycle every UPDATE_INTERVAL
+        if last_cycle_time is None:
+            start_cycle = True
+        elif sts:
+            start_cycle = poll_time - last_cycle_time >= UPDATE_INTERVAL
+        else:
+            start_cycle = tick_number > last_tick_number or poll_time - last_cycle_time >= MAX_IDLE_INTERVAL
+
+        if start_cycle:
+            # Periodically refetch all option details, regardless of the slot counts, over the next cycles
+            full_reconcile = update_cycle % OPTION_DETAIL_RECONCILE_INTERVAL == 0
+            update_cycle += 1
+            last_cycle_time = poll_time
+            last_tick_number = max(last_tick_number, tick_number)
+            try:
+                # Only the calling thread is profiled. PIPELINE_FETCHERS=0 runs the whole cycle in it
+                with profiling.profile_block('cycle', str(tick_number), profiling.PROFILE_SLOW_CYCLE,
+                                            1.0 if profiling.PROFILE_CYCLES else 0.0):
+                    run_update_cycle(tick_number, full_reconcile)
+            except Exception as e:
+               logger.warning(f"Error updating database: {e}")
+
+        # Wait before polling the tick again
+        updater_stop.wait(max(0.0, TICK_POLL_INTERVAL - (time.monotonic() - poll_time)))
+    close_db_connection()
+    if rpc_payload_cache is not None:
+        rpc_payload_cache.close()
+        rpc_payload_cache = None
+
+def read_environment():
+    """ Read the parameters from the environment variables """
+    global DEBUG_MODE, NODE_IP, DATABASE_PATH, RPC_CONNECT_TIMEOUT, RPC_READ_TIMEOUT, RPC_MAX_RETRIES, RPC_TRANSPORT, \
+        NODE_PORT, OPTION_DETAIL_RECONCILE_INTERVAL, TICK_POLL_INTERVAL, MAX_IDLE_INTERVAL, CYCLE_TIME_BUDGET, \
+        CYCLE_RPC_BUDGET, URGENT_WINDOW, RECENT_ACTIVITY_WINDOW, DORMANT_REFRESH_INTERVAL, ARCHIVE_INTERVAL, \
+        PUBLISH_MODE, SNAPSHOT_KEEP, ARCHIVE_GRACE_PERIOD, CHANGE_LOG_KEEP, PIPELINE_FETCHERS, PIPELINE_QUEUE_SIZE, \
+        PIPELINE_BATCH_SIZE, SHARD_DIR, BACKUP_DIR, BACKUP_INTERVAL, BACKUP_KEEP, ARTIFACTS_DIR, PAGINATION_THRESHOLD, \
+        METRICS_PORT, IDENTITY_CACHE_SIZE, IDENTITY_CACHE_FILE, RPC_CACHE_FILE, NOTIFY_DIR, METRICS_HISTORY
     if os.getenv('DEBUG_MODE'):
         DEBUG_MODE = os.getenv('DEBUG_MODE')
 
@@ -638,12 +2412,109 @@ if __name__ == '__main__':
     if os.getenv('DATABASE_PATH'):
         DATABASE_PATH = os.getenv('DATABASE_PATH')
 
+    RPC_CONNECT_TIMEOUT = float(os.getenv('RPC_CONNECT_TIMEOUT', RPC_CONNECT_TIMEOUT))
+    RPC_READ_TIMEOUT = float(os.getenv('RPC_READ_TIMEOUT', RPC_READ_TIMEOUT))
+    RPC_MAX_RETRIES = int(os.getenv('RPC_MAX_RETRIES', RPC_MAX_RETRIES))
+    RPC_TRANSPORT = os.getenv('RPC_TRANSPORT', RPC_TRANSPORT)
+    NODE_PORT = int(os.getenv('NODE_PORT', NODE_PORT))
+    OPTION_DETAIL_RECONCILE_INTERVAL = int(os.getenv('OPTION_DETAIL_RECONCILE_INTERVAL',
+                                                     OPTION_DETAIL_RECONCILE_INTERVAL))
+    TICK_POLL_INTERVAL = float(os.getenv('TICK_POLL_INTERVAL', TICK_POLL_INTERVAL))
+    MAX_IDLE_INTERVAL = float(os.getenv('MAX_IDLE_INTERVAL', MAX_IDLE_INTERVAL))
+    CYCLE_TIME_BUDGET = float(os.getenv('CYCLE_TIME_BUDGET', CYCLE_TIME_BUDGET))
+    CYCLE_RPC_BUDGET = int(os.getenv('CYCLE_RPC_BUDGET', CYCLE_RPC_BUDGET))
+    URGENT_WINDOW = float(os.getenv('URGENT_WINDOW', URGENT_WINDOW))
+    RECENT_ACTIVITY_WINDOW = float(os.getenv('RECENT_ACTIVITY_WINDOW', RECENT_ACTIVITY_WINDOW))
+    DORMANT_REFRESH_INTERVAL = float(os.getenv('DORMANT_REFRESH_INTERVAL', DORMANT_REFRESH_INTERVAL))
+    ARCHIVE_INTERVAL = float(os.getenv('ARCHIVE_INTERVAL', ARCHIVE_INTERVAL))
+    PUBLISH_MODE = os.getenv('PUBLISH_MODE', PUBLISH_MODE)
+    SNAPSHOT_KEEP = int(os.getenv('SNAPSHOT_KEEP', SNAPSHOT_KEEP))
+    ARCHIVE_GRACE_PERIOD = float(os.getenv('ARCHIVE_GRACE_PERIOD', ARCHIVE_GRACE_PERIOD))
+    SHARD_DIR = os.getenv('SHARD_DIR', SHARD_DIR)
+    CHANGE_LOG_KEEP = int(os.getenv('CHANGE_LOG_KEEP', CHANGE_LOG_KEEP))
+    PIPELINE_FETCHERS = int(os.getenv('PIPELINE_FETCHERS', PIPELINE_FETCHERS))
+    PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', PIPELINE_QUEUE_SIZE))
+    PIPELINE_BATCH_SIZE = int(os.getenv('PIPELINE_BATCH_SIZE', PIPELINE_BATCH_SIZE))
+    BACKUP_DIR = os.getenv('BACKUP_DIR', BACKUP_DIR)
+    BACKUP_INTERVAL = float(os.getenv('BACKUP_INTERVAL', BACKUP_INTERVAL))
+    BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', BACKUP_KEEP))
+    ARTIFACTS_DIR = os.getenv('ARTIFACTS_DIR', ARTIFACTS_DIR)
+    PAGINATION_THRESHOLD = int(os.getenv('PAGINATION_THRESHOLD', PAGINATION_THRESHOLD))
+    METRICS_PORT = int(os.getenv('METRICS_PORT', METRICS_PORT))
+    IDENTITY_CACHE_SIZE = int(os.getenv('IDENTITY_CACHE_SIZE', IDENTITY_CACHE_SIZE))
+    IDENTITY_CACHE_FILE = os.getenv('IDENTITY_CACHE_FILE', IDENTITY_CACHE_FILE)
+    RPC_CACHE_FILE = os.getenv('RPC_CACHE_FILE', RPC_CACHE_FILE)
+    NOTIFY_DIR = os.getenv('NOTIFY_DIR', NOTIFY_DIR)
+    METRICS_HISTORY = int(os.getenv('METRICS_HISTORY', METRICS_HISTORY))
+
+
+def start_updater(subscribers=()):
+    """
+    Open what the update loop needs: the node wrapper, the database, the publisher and the metrics server.
+    The SQLite connections are opened by update_database_with_bets, in the thread of the loop.
+
+    :param subscribers: notifications.Subscriber of the same process, notified of each committed cycle.
+    """
+    global qt, commit_publisher
+    qt = quottery_rpc_wrapper.QuotteryRpcWrapper(NODE_IP, QUOTTERY_LIBS, 'DB_UPDATER',
+                                                 connectTimeout=RPC_CONNECT_TIMEOUT,
+                                                 readTimeout=RPC_READ_TIMEOUT,
+                                                 maxRetries=RPC_MAX_RETRIES,
+                                                 identityCacheSize=IDENTITY_CACHE_SIZE,
+                                                 identityCacheFile=IDENTITY_CACHE_FILE or None,
+                                                 transport=RPC_TRANSPORT,
+                                                 nodePort=NODE_PORT,
+                                                 maxConcurrentCalls=max(1, 2 * PIPELINE_FETCHERS))
+
+    init_db()
+    if PUBLISH_MODE == 'memory':
+        load_memory_database()
+    commit_publisher = notifications.Publisher(DATABASE_FILE, NOTIFY_DIR, subscribers)
+    logger.info(f"- Notifications: {NOTIFY_DIR or notifications.version_file_of(DATABASE_FILE)}")
+    if RPC_CACHE_FILE:
+        logger.info(f"- RPC cache: {RPC_CACHE_FILE}")
+    if METRICS_PORT:
+        updater_metrics.start_metrics_server(metrics_registry, METRICS_PORT)
+        logger.info(f"- Metrics: http://127.0.0.1:{METRICS_PORT}/metrics")
+
+
+def start_embedded(subscribers=()):
+    """
+    Run the update loop in a background thread of the calling process, the Flask app in its embedded mode.
+    The loop writes into a shared in-memory database, published to the readers of the process after each cycle with
+    connect_published_memory_database, and written into the database file every MEMORY_SNAPSHOT_INTERVAL seconds
+    and at exit.
+
+    :param subscribers: notifications.Subscriber of the process, notified of each committed cycle.
+    :return: The thread of the update loop.
+    """
+    global DATABASE_FILE, PUBLISH_MODE, ARTIFACTS_DIR, MEMORY_SNAPSHOT_INTERVAL
+    read_environment()
+    MEMORY_SNAPSHOT_INTERVAL = float(os.getenv('MEMORY_SNAPSHOT_INTERVAL', MEMORY_SNAPSHOT_INTERVAL))
+    DATABASE_FILE = os.path.join(DATABASE_PATH, DATABASE_FILE)
+    PUBLISH_MODE = 'memory'
+    # The readers are in the process. Pre-rendering the responses would only cost time
+    ARTIFACTS_DIR = ''
+    if not os.path.isfile(QUOTTERY_LIBS):
+        raise FileNotFoundError(f"quottery_cpp_wrapper path NOT FOUND: {QUOTTERY_LIBS}")
+
+    start_updater(subscribers)
+    atexit.register(snapshot_memory_database, True)
+    thread = Thread(target=update_database_with_bets, daemon=True, name='db-updater')
+    thread.start()
+    logger.info(f"Embedded updater started. Snapshots into {DATABASE_FILE} every {MEMORY_SNAPSHOT_INTERVAL}s")
+    return thread
+
+
+if __name__ == '__main__':
+    read_environment()
 
     # Create the parser
     parser = argparse.ArgumentParser(description='Database update for qtry.')
 
     # Arguments
-    parser.add_argument('-nodeip', type=str, help='Address of http endpoint')
+    parser.add_argument('-nodeip', type=str, help='Address of http endpoint. Comma separated for several endpoints')
+    parser.add_argument('-nodeport', type=int, help='TCP port of the node, for the native transport')
     parser.add_argument('-dbpath', type=str, help='Directory contain the database file')
 
     # Execute the parse_args() method
@@ -652,21 +2523,36 @@ if __name__ == '__main__':
     # Access the arguments and overwrite them
     if args.nodeip:
         NODE_IP = args.nodeip
+    if args.nodeport:
+        NODE_PORT = args.nodeport
     if args.dbpath:
         DATABASE_PATH = args.dbpath
     DATABASE_FILE = os.path.join(DATABASE_PATH, DATABASE_FILE)
 
+    if RPC_TRANSPORT not in (quottery_rpc_wrapper.TRANSPORT_HTTP, quottery_rpc_wrapper.TRANSPORT_NATIVE):
+        logger.error(f"Unknown transport {RPC_TRANSPORT}. Use http or native")
+        sys.exit(1)
+
+    if PUBLISH_MODE not in ('wal', 'snapshot'):
+        logger.error(f"Unknown publish mode {PUBLISH_MODE}. Use wal or snapshot")
+        sys.exit(1)
+
     # Print the configuration to verify
     logger.info("Launch the database update with configurations")
     logger.info(f"- Address: {NODE_IP}")
+    logger.info(f"- Transport: {RPC_TRANSPORT}")
     logger.info(f"- Database file: {DATABASE_FILE}")
     logger.info(f"- Qtry path: {QUOTTERY_LIBS}")
+    logger.info(f"- RPC timeouts: connect {RPC_CONNECT_TIMEOUT}s, read {RPC_READ_TIMEOUT}s, retries {RPC_MAX_RETRIES}")
+    logger.info(f"- Option detail reconcile interval: {OPTION_DETAIL_RECONCILE_INTERVAL} cycles")
+    logger.info(f"- Publish mode: {PUBLISH_MODE}")
+    logger.info(f"- Cycle budget: {CYCLE_TIME_BUDGET}s, {CYCLE_RPC_BUDGET} requests")
+    logger.info(f"- Epoch shards: {SHARD_DIR or 'disabled'}")
 
     # Check if the qtry wrapper exists and init the qtry wrapper
     if not os.path.isfile(QUOTTERY_LIBS):
         logger.info(f"quottery_cpp_wrapper path NOT FOUND: {QUOTTERY_LIBS}. Exiting.")
         sys.exit(1)
-    qt = quottery_rpc_wrapper.QuotteryRpcWrapper(NODE_IP, QUOTTERY_LIBS, 'DB_UPDATER')
-
-    init_db()
+    profiling.configure()
+    start_updater()
     update_database_with_bets()
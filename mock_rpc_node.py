@@ -0,0 +1,583 @@
+import sys
+import json
+import time
+import base64
+import random
+import struct
+import ctypes
+import logging
+import argparse
+import threading
+import socketserver
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import qtry_utils
+import quottery_rpc_wrapper
+from quottery_rpc_wrapper import (API_PATH, TICK_INFO_PATH, QTRY_CONTRACT_INDEX, QTRY_GET_BASIC_INFO,
+                                  QTRY_GET_BET_INFO, QTRY_GET_BET_OPTION_DETAIL, QTRY_GET_ACTIVE_BET,
+                                  QTRY_GET_BET_BY_CREATOR, QTRY_GET_STRING, TICK_INFO_STRING)
+
+log_format = '[%(name)s][%(asctime)s] %(message)s'
+# Configure the logging module to use the custom format
+logging.basicConfig(level=logging.INFO, format=log_format)
+logger = logging.getLogger('MOCK_RPC_NODE')
+
+# Init default parameters
+MOCK_PORT = 8080
+NUMBER_OF_BETS = 100
+NUMBER_OF_OPTIONS = 4
+NUMBER_OF_BETTORS = 50  # per option
+NUMBER_OF_USERS = 500  # distinct bettors shared by all the bets
+TICKS_PER_SECOND = 0.5
+JOINS_PER_TICK = 5
+LATENCY = 0.0  # seconds
+LATENCY_JITTER = 0.0  # seconds
+ERROR_RATE = 0.0  # probability of answering a server error
+
+MAX_OPTIONS = 8
+MAX_ORACLE_PROVIDERS = 8
+MAX_BETTORS_PER_OPTION = 1024
+MAX_ACTIVE_BETS = 1024
+
+# Messages of the node TCP protocol used by the quottery_cpp library
+HEADER_SIZE = 8  # 3 bytes size of the whole message, 1 byte type, 4 bytes dejavu
+REQUEST_CURRENT_TICK_INFO = 27
+RESPOND_CURRENT_TICK_INFO = 28
+REQUEST_CONTRACT_FUNCTION = 42
+RESPOND_CONTRACT_FUNCTION = 43
+
+
+class SyntheticQuottery:
+    """Generates the state of a Quottery contract and encodes it as the node does"""
+
+    def __init__(self, numberOfBets=NUMBER_OF_BETS, numberOfOptions=NUMBER_OF_OPTIONS,
+                 numberOfBettors=NUMBER_OF_BETTORS, numberOfUsers=NUMBER_OF_USERS,
+                 ticksPerSecond=TICKS_PER_SECOND, joinsPerTick=JOINS_PER_TICK, seed=0):
+        """
+        Args:
+            numberOfBets (int): Number of active bets
+            numberOfOptions (int): Number of options of each bet, at most 8
+            numberOfBettors (int): Number of slots initially taken on each option, at most 1024
+            numberOfUsers (int): Number of distinct bettors. The same users join several options
+            ticksPerSecond (float): Speed of the simulated chain
+            joinsPerTick (int): Number of slots joined on random options at each tick
+            seed (int): Seed of the generator, the same seed generates the same data
+        """
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.ticksPerSecond = ticksPerSecond
+        self.joinsPerTick = joinsPerTick
+        self.startTime = time.monotonic()
+        self.initialTick = 15000000
+        self.lastTick = self.initialTick
+        self.epoch = 130
+
+        self.users = [self.random_pubkey() for _ in range(numberOfUsers)]
+        self.operator = self.random_pubkey()
+        self.bets = {}
+        for bet_id in range(1, min(numberOfBets, MAX_ACTIVE_BETS) + 1):
+            self.bets[bet_id] = self.make_bet(bet_id, min(numberOfOptions, MAX_OPTIONS),
+                                              min(numberOfBettors, MAX_BETTORS_PER_OPTION))
+
+    def random_pubkey(self):
+        return bytes(self.random.getrandbits(8) for _ in range(32))
+
+    def make_bet(self, bet_id, number_of_options, number_of_bettors):
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        close_datetime = now + timedelta(hours=self.random.randint(1, 72))
+        return {
+            'creator': self.random.choice(self.users),
+            'bet_desc': f"Synthetic bet {bet_id}",
+            'option_desc': [f"Option {op_id}" for op_id in range(number_of_options)],
+            'oracle_ids': [self.random_pubkey() for _ in range(self.random.randint(1, 3))],
+            'open_datetime': now - timedelta(days=1),
+            'close_datetime': close_datetime,
+            'end_datetime': close_datetime + timedelta(hours=self.random.randint(1, 24)),
+            'min_bet_amount': 10000,
+            'max_slot_per_option': MAX_BETTORS_PER_OPTION,
+            'bettors': [[self.random.choice(self.users) for _ in range(number_of_bettors)]
+                        for _ in range(number_of_options)],
+        }
+
+    def current_tick(self):
+        return self.initialTick + int((time.monotonic() - self.startTime) * self.ticksPerSecond)
+
+    def advance(self):
+        """Simulates the users joining the bets for each tick elapsed since the last call"""
+        with self.lock:
+            tick = self.current_tick()
+            for _ in range(self.lastTick, tick):
+                for _ in range(self.joinsPerTick):
+                    if not self.bets:
+                        break
+                    bet = self.bets[self.random.choice(list(self.bets))]
+                    option = self.random.choice(bet['bettors'])
+                    if len(option) < bet['max_slot_per_option']:
+                        option.append(self.random.choice(self.users))
+            self.lastTick = max(self.lastTick, tick)
+            return self.lastTick
+
+    @staticmethod
+    def pack_datetime(value):
+        return qtry_utils.pack_date(value.year % 100, value.month, value.day,
+                                    value.hour, value.minute, value.second)
+
+    def tick_info(self):
+        tick = self.advance()
+        return {
+            'tickInfo': {
+                'tick': tick,
+                'duration': int(1 / self.ticksPerSecond) if self.ticksPerSecond else 0,
+                'epoch': self.epoch,
+                'initialTick': self.initialTick,
+            }
+        }
+
+    def basic_info_output(self):
+        output = qtry_utils.QtryBasicInfoOutput()
+        output.feePerSlotPerHour = 420
+        output.gameOperatorFee = 50
+        output.shareholderFee = 1000
+        output.minBetSlotAmount = 10000
+        output.burnFee = 200
+        output.nIssuedBet = len(self.bets)
+        ctypes.memmove(output.gameOperator, self.operator, 32)
+        return bytes(output)
+
+    def active_bet_output(self):
+        bet_ids = sorted(self.bets)
+        data = len(bet_ids).to_bytes(4, byteorder='little')
+        data += b''.join(bet_id.to_bytes(4, byteorder='little') for bet_id in bet_ids)
+        return data.ljust(4 + 4 * MAX_ACTIVE_BETS, b'\x00')
+
+    def bet_info_output(self, bet_id):
+        output = qtry_utils.BetInfoOutput()
+        bet = self.bets.get(bet_id)
+        if bet is None:
+            return bytes(output)
+
+        output.betId = bet_id
+        output.nOption = len(bet['option_desc'])
+        ctypes.memmove(output.creator, bet['creator'], 32)
+        bet_desc = bet['bet_desc'].encode('utf-8')[:32]
+        ctypes.memmove(output.betDesc, bet_desc, len(bet_desc))
+        for op_id, desc in enumerate(bet['option_desc']):
+            desc = desc.encode('utf-8')[:32]
+            ctypes.memmove(ctypes.addressof(output.optionDesc) + 32 * op_id, desc, len(desc))
+        for i, oracle_id in enumerate(bet['oracle_ids']):
+            ctypes.memmove(ctypes.addressof(output.oracleProviderId) + 32 * i, oracle_id, 32)
+            output.oracleFees[i] = 50
+        output.openDateTime = self.pack_datetime(bet['open_datetime'])
+        output.closeDateTime = self.pack_datetime(bet['close_datetime'])
+        output.endDateTime = self.pack_datetime(bet['end_datetime'])
+        output.minBetAmount = bet['min_bet_amount']
+        output.maxBetSlotPerOption = bet['max_slot_per_option']
+        for op_id, bettors in enumerate(bet['bettors']):
+            output.currentBetState[op_id] = len(bettors)
+        for i in range(MAX_ORACLE_PROVIDERS):
+            output.betResultWonOption[i] = -1
+            output.betResultOPId[i] = -1
+        return bytes(output)
+
+    def bet_option_detail_output(self, bet_id, option_id):
+        bet = self.bets.get(bet_id)
+        if bet is None or option_id >= len(bet['bettors']):
+            return bytes(32 * MAX_BETTORS_PER_OPTION)
+        return b''.join(bet['bettors'][option_id]).ljust(32 * MAX_BETTORS_PER_OPTION, b'\x00')
+
+    def bet_by_creator_output(self, creator):
+        bet_ids = sorted(bet_id for bet_id, bet in self.bets.items() if bet['creator'] == creator)
+        data = len(bet_ids).to_bytes(4, byteorder='little')
+        data += b''.join(bet_id.to_bytes(4, byteorder='little') for bet_id in bet_ids)
+        return data.ljust(4 + 4 * MAX_ACTIVE_BETS, b'\x00')
+
+    def query(self, inputType, requestData):
+        """Answers a querySmartContract request
+
+        Args:
+            inputType (int): The QTRY_GET_* function
+            requestData (bytes): The decoded input of the function
+
+        Returns:
+            bytes: the output of the function. None if the function is unknown
+        """
+        self.advance()
+        with self.lock:
+            if inputType == QTRY_GET_BASIC_INFO:
+                return self.basic_info_output()
+            if inputType == QTRY_GET_ACTIVE_BET:
+                return self.active_bet_output()
+            if inputType == QTRY_GET_BET_INFO:
+                return self.bet_info_output(int.from_bytes(requestData[:4], byteorder='little'))
+            if inputType == QTRY_GET_BET_OPTION_DETAIL:
+                return self.bet_option_detail_output(int.from_bytes(requestData[:4], byteorder='little'),
+                                                     int.from_bytes(requestData[4:8], byteorder='little'))
+            if inputType == QTRY_GET_BET_BY_CREATOR:
+                return self.bet_by_creator_output(bytes(requestData[:32]))
+        return None
+
+
+class CaptureStore:
+    """Records the responses of a real endpoint into a JSON lines file and replays them"""
+
+    def __init__(self, captureFile):
+        self.captureFile = captureFile
+        self.lock = threading.Lock()
+        self.responses = {}
+        self.replayIndex = {}
+
+    @staticmethod
+    def make_key(path, json_data):
+        if json_data is None:
+            return path
+        return f"{path}:{json_data.get('contractIndex')}:{json_data.get('inputType')}:{json_data.get('requestData')}"
+
+    def load(self):
+        with open(self.captureFile) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                capture = json.loads(line)
+                key = self.make_key(capture['path'], capture.get('request'))
+                self.responses.setdefault(key, []).append(capture['response'])
+        logger.info(f"Loaded {sum(len(v) for v in self.responses.values())} captures from {self.captureFile}")
+
+    def record(self, path, json_data, response):
+        with self.lock:
+            with open(self.captureFile, 'a') as f:
+                f.write(json.dumps({'path': path, 'request': json_data, 'response': response}) + '\n')
+
+    def replay(self, path, json_data):
+        """Gets the recorded responses of a request in turn. None if it was never recorded"""
+        key = self.make_key(path, json_data)
+        with self.lock:
+            responses = self.responses.get(key)
+            if not responses:
+                return None
+            index = self.replayIndex.get(key, 0)
+            self.replayIndex[key] = index + 1
+            return responses[index % len(responses)]
+
+
+class MockRpcHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately. Avoid the delayed ACK stall on keep-alive connections
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        if not length:
+            return None
+        return json.loads(self.rfile.read(length))
+
+    def handle_request(self, json_data):
+        node = self.server.node
+        path = self.path.split('?')[0]
+        request_name = TICK_INFO_STRING if path == TICK_INFO_PATH else \
+            QTRY_GET_STRING.get((json_data or {}).get('inputType'), 'Unknown')
+        node.count_request(request_name)
+
+        # Simulated network latency and failures
+        if node.latency or node.latencyJitter:
+            time.sleep(node.latency + random.uniform(0, node.latencyJitter))
+        if node.errorRate and random.random() < node.errorRate:
+            self.send_json(500, {'code': 13, 'message': 'simulated error'})
+            return
+
+        if node.captures is not None and node.upstream is None:
+            response = node.captures.replay(path, json_data)
+            if response is None:
+                self.send_json(404, {'code': 5, 'message': 'not recorded'})
+            else:
+                self.send_json(200, response)
+            return
+
+        if node.upstream is not None:
+            try:
+                upstream_response = requests.request(self.command, node.upstream + path, json=json_data,
+                                                     headers=quottery_rpc_wrapper.MESSAGE_HEADERS, timeout=30)
+                response = upstream_response.json()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                self.send_json(502, {'code': 14, 'message': str(e)})
+                return
+            if upstream_response.ok and node.captures is not None:
+                node.captures.record(path, json_data, response)
+            self.send_json(upstream_response.status_code, response)
+            return
+
+        if path == TICK_INFO_PATH:
+            self.send_json(200, node.quottery.tick_info())
+            return
+
+        if path != API_PATH or json_data is None or json_data.get('contractIndex') != QTRY_CONTRACT_INDEX:
+            self.send_json(404, {'code': 5, 'message': 'not found'})
+            return
+
+        request_data = base64.b64decode(json_data.get('requestData') or '')
+        output = node.quottery.query(json_data.get('inputType'), request_data)
+        if output is None:
+            self.send_json(400, {'code': 3, 'message': 'unknown input type'})
+            return
+        node.count_bytes(len(output))
+        self.send_json(200, {'responseData': base64.b64encode(output).decode('ascii')})
+
+    def do_GET(self):
+        self.handle_request(None)
+
+    def do_POST(self):
+        try:
+            json_data = self.read_json()
+        except ValueError:
+            self.send_json(400, {'code': 3, 'message': 'invalid json'})
+            return
+        self.handle_request(json_data)
+
+
+class MockRpcNode:
+    """Local stand-in for the Qubic RPC endpoint, serving /v1/querySmartContract and /v1/tick-info"""
+
+    def __init__(self, quottery=None, host='127.0.0.1', port=0, latency=LATENCY, latencyJitter=LATENCY_JITTER,
+                 errorRate=ERROR_RATE, captureFile=None, upstream=None):
+        """
+        Args:
+            quottery (SyntheticQuottery, optional): The generated contract state. Default one is created if empty
+            host (str, optional): The address to listen to
+            port (int, optional): The port to listen to. 0 picks a free port
+            latency (float, optional): Seconds added to each response
+            latencyJitter (float, optional): Maximum random seconds added on top of the latency
+            errorRate (float, optional): Probability of answering a server error
+            captureFile (str, optional): Replay the responses of this file, or record into it if upstream is set
+            upstream (str, optional): Forward the requests to this real endpoint
+        """
+        self.quottery = quottery if quottery is not None else SyntheticQuottery()
+        self.latency = latency
+        self.latencyJitter = latencyJitter
+        self.errorRate = errorRate
+        self.upstream = upstream
+        self.captures = None
+        if captureFile:
+            self.captures = CaptureStore(captureFile)
+            if upstream is None:
+                self.captures.load()
+
+        self.statsLock = threading.Lock()
+        self.requestCounts = {}
+        self.bytesSent = 0
+
+        self.server = ThreadingHTTPServer((host, port), MockRpcHandler)
+        self.server.daemon_threads = True
+        self.server.node = self
+        self.thread = None
+
+    @property
+    def address(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count_request(self, requestName):
+        with self.statsLock:
+            self.requestCounts[requestName] = self.requestCounts.get(requestName, 0) + 1
+
+    def count_bytes(self, size):
+        with self.statsLock:
+            self.bytesSent += size
+
+    def get_stats(self, reset=False):
+        """Gets the number of requests served per request name and the bytes of contract output sent"""
+        with self.statsLock:
+            stats = {'requests': dict(self.requestCounts), 'bytes': self.bytesSent}
+            if reset:
+                self.requestCounts.clear()
+                self.bytesSent = 0
+        return stats
+
+    def start(self):
+        """Serves in a background thread"""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+
+class MockTcpHandler(socketserver.StreamRequestHandler):
+    """Answers the messages of a persistent connection until the client closes it"""
+
+    def setup(self):
+        super().setup()
+        self.server.node.count_connection()
+
+    def send_message(self, message_type, dejavu, payload):
+        header = (HEADER_SIZE + len(payload)).to_bytes(3, byteorder='little') + bytes([message_type]) + dejavu
+        self.wfile.write(header + payload)
+        self.wfile.flush()
+
+    def handle(self):
+        node = self.server.node
+        while True:
+            header = self.rfile.read(HEADER_SIZE)
+            if len(header) < HEADER_SIZE:
+                return
+            size = int.from_bytes(header[:3], byteorder='little')
+            message_type, dejavu = header[3], header[4:8]
+            payload = self.rfile.read(size - HEADER_SIZE)
+
+            if message_type == REQUEST_CONTRACT_FUNCTION:
+                contract_index = int.from_bytes(payload[:4], byteorder='little')
+                input_type = int.from_bytes(payload[4:6], byteorder='little')
+                input_size = int.from_bytes(payload[6:8], byteorder='little')
+                node.count_request(QTRY_GET_STRING.get(input_type, 'Unknown'))
+            elif message_type == REQUEST_CURRENT_TICK_INFO:
+                node.count_request(TICK_INFO_STRING)
+            else:
+                # The node ignores the messages it does not serve
+                continue
+
+            # Simulated network latency and failures. A failure drops the connection
+            if node.latency:
+                time.sleep(node.latency)
+            if node.errorRate and random.random() < node.errorRate:
+                return
+
+            if message_type == REQUEST_CURRENT_TICK_INFO:
+                tick_info = node.quottery.tick_info()['tickInfo']
+                # CurrentTickInfo: tickDuration, epoch, tick, numberOfAlignedVotes, numberOfMisalignedVotes, initialTick
+                output = struct.pack('<HHIHHI', tick_info['duration'], tick_info['epoch'], tick_info['tick'],
+                                     0, 0, tick_info['initialTick'])
+                self.send_message(RESPOND_CURRENT_TICK_INFO, dejavu, output)
+                continue
+
+            output = None
+            if contract_index == QTRY_CONTRACT_INDEX:
+                output = node.quottery.query(input_type, payload[8:8 + input_size])
+            output = output or b''
+            node.count_bytes(len(output))
+            self.send_message(RESPOND_CONTRACT_FUNCTION, dejavu, output)
+
+
+class MockTcpNode:
+    """Local stand-in for the TCP protocol of a Qubic node, for the native transport of QuotteryRpcWrapper"""
+
+    def __init__(self, quottery=None, host='127.0.0.1', port=0, latency=LATENCY, errorRate=ERROR_RATE):
+        """
+        Args:
+            quottery (SyntheticQuottery, optional): The generated contract state. Default one is created if empty
+            host (str, optional): The address to listen to
+            port (int, optional): The port to listen to. 0 picks a free port
+            latency (float, optional): Seconds added to each response
+            errorRate (float, optional): Probability of dropping the connection instead of answering
+        """
+        self.quottery = quottery if quottery is not None else SyntheticQuottery()
+        self.latency = latency
+        self.errorRate = errorRate
+
+        self.statsLock = threading.Lock()
+        self.requestCounts = {}
+        self.bytesSent = 0
+        self.connections = 0
+
+        self.server = socketserver.ThreadingTCPServer((host, port), MockTcpHandler)
+        self.server.daemon_threads = True
+        self.server.node = self
+        self.thread = None
+
+    @property
+    def address(self):
+        host, port = self.server.server_address[:2]
+        return f"{host}:{port}"
+
+    def count_connection(self):
+        with self.statsLock:
+            self.connections += 1
+
+    def count_request(self, requestName):
+        with self.statsLock:
+            self.requestCounts[requestName] = self.requestCounts.get(requestName, 0) + 1
+
+    def count_bytes(self, size):
+        with self.statsLock:
+            self.bytesSent += size
+
+    def get_stats(self, reset=False):
+        """Gets the number of requests served per request name, the bytes of contract output sent
+        and the number of connections opened"""
+        with self.statsLock:
+            stats = {'requests': dict(self.requestCounts), 'bytes': self.bytesSent, 'connections': self.connections}
+            if reset:
+                self.requestCounts.clear()
+                self.bytesSent = 0
+                self.connections = 0
+        return stats
+
+    def start(self):
+        """Serves in a background thread"""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local mock of the Qubic RPC endpoint for qtry.')
+    parser.add_argument('-host', type=str, default='127.0.0.1', help='Address to listen to')
+    parser.add_argument('-port', type=int, default=MOCK_PORT, help='Port to listen to')
+    parser.add_argument('-bets', type=int, default=NUMBER_OF_BETS, help='Number of active bets')
+    parser.add_argument('-options', type=int, default=NUMBER_OF_OPTIONS, help='Number of options per bet')
+    parser.add_argument('-bettors', type=int, default=NUMBER_OF_BETTORS, help='Number of slots taken per option')
+    parser.add_argument('-users', type=int, default=NUMBER_OF_USERS, help='Number of distinct bettors')
+    parser.add_argument('-tps', type=float, default=TICKS_PER_SECOND, help='Ticks per second')
+    parser.add_argument('-joins', type=int, default=JOINS_PER_TICK, help='Slots joined per tick')
+    parser.add_argument('-latency', type=float, default=LATENCY, help='Seconds added to each response')
+    parser.add_argument('-jitter', type=float, default=LATENCY_JITTER, help='Maximum random extra latency')
+    parser.add_argument('-errors', type=float, default=ERROR_RATE, help='Probability of a server error')
+    parser.add_argument('-seed', type=int, default=0, help='Seed of the synthetic data')
+    parser.add_argument('-record', type=str, help='Forward to -upstream and record the responses into this file')
+    parser.add_argument('-replay', type=str, help='Replay the responses recorded in this file')
+    parser.add_argument('-upstream', type=str, help='Real endpoint used for recording, e.g. https://rpc.qubic.org')
+    parser.add_argument('-tcpport', type=int, help='Also serve the node TCP protocol on this port')
+
+    args = parser.parse_args()
+
+    if args.record and not args.upstream:
+        logger.error("Recording needs an -upstream endpoint")
+        sys.exit(1)
+
+    node = MockRpcNode(
+        quottery=SyntheticQuottery(args.bets, args.options, args.bettors, args.users, args.tps, args.joins, args.seed),
+        host=args.host, port=args.port, latency=args.latency, latencyJitter=args.jitter, errorRate=args.errors,
+        captureFile=args.record or args.replay, upstream=args.upstream if args.record else None)
+
+    logger.info(f"Serving mock RPC node at {node.address}")
+    if args.tcpport is not None:
+        tcp_node = MockTcpNode(quottery=node.quottery, host=args.host, port=args.tcpport, latency=args.latency,
+                               errorRate=args.errors).start()
+        logger.info(f"Serving mock TCP node at {tcp_node.address}")
+    try:
+        node.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        node.server.server_close()
@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import glob
+import socket
+import logging
+import threading
+
+logger = logging.getLogger('NOTIFICATIONS')
+
+# Notifications of the cycles committed by the updater. The updater replaces the version file next to the database,
+# then sends the same message to the datagram socket of each subscribed process found in NOTIFY_DIR
+VERSION_SUFFIX = '.version'
+SOCKET_SUFFIX = '.sock'
+MESSAGE_SIZE = 256
+NOTIFY_CHECK_INTERVAL = 5.0  # seconds. Subscribers also check the version file, in case a message was lost
+
+
+def version_file_of(database_file):
+    return database_file + VERSION_SUFFIX
+
+
+def encode_message(version, tick_number):
+    return json.dumps({'version': version, 'tick_number': tick_number}).encode()
+
+
+def decode_message(data):
+    """ (version, tick number) of a message. None if it is not readable """
+    try:
+        message = json.loads(data)
+        return message['version'], message['tick_number']
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+class Publisher:
+    """ Updater side: announce each committed cycle to the subscribers """
+
+    def __init__(self, database_file, notify_dir='', subscribers=()):
+        """
+        :param database_file: The database file. The version file is written next to it.
+        :param notify_dir: Directory of the subscriber sockets. Disabled if empty.
+        :param subscribers: Subscribers of the same process, updated directly.
+        """
+        self.version_file = version_file_of(database_file)
+        self.notify_dir = notify_dir
+        self.subscribers = list(subscribers)
+        self.sock = None
+        if notify_dir:
+            os.makedirs(notify_dir, exist_ok=True)
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.sock.setblocking(False)
+
+    def publish(self, tick_number):
+        """
+        Announce a committed cycle. Must be called once the cycle is visible to the readers.
+
+        :return: The version of the cycle.
+        """
+        version = time.time_ns()
+        message = encode_message(version, tick_number)
+        temp_file = self.version_file + '.tmp'
+        with open(temp_file, 'wb') as f:
+            f.write(message)
+        os.replace(temp_file, self.version_file)
+        for subscriber in self.subscribers:
+            subscriber.update(version, tick_number)
+
+        if self.sock is not None:
+            for socket_file in glob.glob(os.path.join(self.notify_dir, '*' + SOCKET_SUFFIX)):
+                try:
+                    self.sock.sendto(message, socket_file)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # The subscriber is gone without removing its socket
+                    try:
+                        os.remove(socket_file)
+                    except OSError:
+                        pass
+                except OSError as e:
+                    # The queue of a slow subscriber is full. It will find the version file on its next check
+                    logger.warning(f"Error notifying {socket_file}: {e}")
+        return version
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+
+
+class Subscriber:
+    """
+    API side: track the last version committed by the updater. Without a socket, or if it can not be bound
+    (read-only directory), the version file is checked instead, with a stat only.
+    """
+
+    def __init__(self, database_file=None, notify_dir='', on_change=None):
+        """
+        :param database_file: The database file of the updater. None if the updater runs in the same process and
+                              updates the subscriber directly.
+        :param notify_dir: Directory of the subscriber sockets, writable by this process. Disabled if empty.
+        :param on_change: Called with (version, tick number) when a new version is seen.
+        """
+        self.version_file = version_file_of(database_file) if database_file else None
+        self.on_change = on_change
+        self.lock = threading.Lock()
+        self.version = None
+        self.tick_number = None
+        self.version_stat = None
+        self.last_check = 0.0
+        self.sock = None
+        self.socket_file = None
+        if notify_dir:
+            self.listen(notify_dir)
+        self.check_version_file()
+
+    def listen(self, notify_dir):
+        socket_file = os.path.join(notify_dir, f"app-{os.getpid()}{SOCKET_SUFFIX}")
+        try:
+            os.makedirs(notify_dir, exist_ok=True)
+            if os.path.exists(socket_file):
+                os.remove(socket_file)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(socket_file)
+        except OSError as e:
+            logger.warning(f"Can not listen to the notifications in {notify_dir}, checking the version file: {e}")
+            return
+        self.sock = sock
+        self.socket_file = socket_file
+        threading.Thread(target=self.receive, daemon=True, name='notifications').start()
+
+    def receive(self):
+        while True:
+            try:
+                data = self.sock.recv(MESSAGE_SIZE)
+            except OSError:
+                return
+            message = decode_message(data)
+            if message is not None:
+                self.update(*message)
+
+    def update(self, version, tick_number):
+        with self.lock:
+            if version == self.version:
+                return
+            self.version = version
+            self.tick_number = tick_number
+        if self.on_change is not None:
+            self.on_change(version, tick_number)
+
+    def check_version_file(self):
+        if self.version_file is None:
+            return
+        try:
+            stat = os.stat(self.version_file)
+        except OSError:
+            return
+        stat_key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if stat_key == self.version_stat:
+            return
+        try:
+            with open(self.version_file, 'rb') as f:
+                message = decode_message(f.read())
+        except OSError:
+            return
+        self.version_stat = stat_key
+        if message is not None:
+            self.update(*message)
+
+    def current_version(self):
+        """ Last committed version known. None if the updater has not announced any """
+        now = time.monotonic()
+        if self.sock is None or now - self.last_check >= NOTIFY_CHECK_INTERVAL:
+            self.last_check = now
+            self.check_version_file()
+        return self.version
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+            try:
+                os.remove(self.socket_file)
+            except OSError:
+                pass
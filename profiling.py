@@ -0,0 +1,197 @@
+import os
+import time
+import random
+import signal
+import logging
+import sqlite3
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+logger = logging.getLogger('PROFILING')
+slow_query_logger = logging.getLogger('SLOW_SQL')
+
+# Profiling hooks of the app and the updater. Everything is disabled by default and configured with the
+# environment variables of the same name, read by configure()
+PROFILE_DIR = ''  # directory of the profiles, snapshots and slow query log. Disabled if empty
+PROFILE_SAMPLE_RATE = 0.1  # fraction of the requests profiled
+PROFILE_SLOW_REQUEST = 0.5  # seconds. Profiled requests faster than this are not written
+PROFILE_SLOW_CYCLE = 0.0  # seconds. Cycles faster than this are not written. 0 writes all of them
+PROFILE_CYCLES = False  # profile the updater cycles
+PROFILE_KEEP = 50  # number of files of each kind kept
+SLOW_QUERY_THRESHOLD = 0.0  # seconds. Disabled if 0
+SLOW_QUERY_LOG_SIZE = 10 * 1024 * 1024  # bytes of the slow query log before it rotates
+TRACEMALLOC_FRAMES = 0  # frames kept per allocation. Disabled if 0. A snapshot is written on SIGUSR1
+
+
+def configure():
+    """ Read the profiling settings from the environment and start the enabled hooks """
+    global PROFILE_DIR, PROFILE_SAMPLE_RATE, PROFILE_SLOW_REQUEST, PROFILE_SLOW_CYCLE, PROFILE_CYCLES, PROFILE_KEEP, \
+        SLOW_QUERY_THRESHOLD, TRACEMALLOC_FRAMES
+    PROFILE_DIR = os.getenv('PROFILE_DIR', PROFILE_DIR)
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', PROFILE_SAMPLE_RATE))
+    PROFILE_SLOW_REQUEST = float(os.getenv('PROFILE_SLOW_REQUEST', PROFILE_SLOW_REQUEST))
+    PROFILE_SLOW_CYCLE = float(os.getenv('PROFILE_SLOW_CYCLE', PROFILE_SLOW_CYCLE))
+    PROFILE_CYCLES = os.getenv('PROFILE_CYCLES', '1' if PROFILE_CYCLES else '').lower() in ('1', 'true', 'yes')
+    PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', PROFILE_KEEP))
+    SLOW_QUERY_THRESHOLD = float(os.getenv('SLOW_QUERY_THRESHOLD', SLOW_QUERY_THRESHOLD))
+    TRACEMALLOC_FRAMES = int(os.getenv('TRACEMALLOC_FRAMES', TRACEMALLOC_FRAMES))
+
+    if not PROFILE_DIR:
+        return False
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+
+    if SLOW_QUERY_THRESHOLD > 0:
+        handler = RotatingFileHandler(os.path.join(PROFILE_DIR, 'slow_queries.log'),
+                                      maxBytes=SLOW_QUERY_LOG_SIZE, backupCount=PROFILE_KEEP)
+        handler.setFormatter(logging.Formatter('[%(asctime)s] %(message)s'))
+        slow_query_logger.addHandler(handler)
+        slow_query_logger.propagate = False
+
+    if TRACEMALLOC_FRAMES > 0:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        # Signal handlers can only be set from the main thread
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: write_tracemalloc_snapshot())
+
+    logger.info(f"Profiling into {PROFILE_DIR}: requests {PROFILE_SAMPLE_RATE * 100:g}% above {PROFILE_SLOW_REQUEST}s, "
+                f"cycles {'on' if PROFILE_CYCLES else 'off'}, slow queries above {SLOW_QUERY_THRESHOLD or '-'}s, "
+                f"tracemalloc {TRACEMALLOC_FRAMES or 'off'}")
+    return True
+
+
+def rotate(prefix):
+    """ Remove the oldest files of a kind, keeping PROFILE_KEEP of them. The timestamps sort in time order """
+    names = sorted(name for name in os.listdir(PROFILE_DIR) if name.startswith(prefix + '_'))
+    for name in names[:-PROFILE_KEEP]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, name))
+        except OSError as e:
+            logger.warning(f"Error removing old profile {name}: {e}")
+
+
+def output_file(prefix, name, extension):
+    timestamp = time.strftime('%Y%m%d%H%M%S') + f"{time.time() % 1:.6f}"[1:]
+    return os.path.join(PROFILE_DIR, f"{prefix}_{timestamp}_{name}.{extension}")
+
+
+def start_profile(sample_rate=1.0):
+    """ Start profiling the calling thread, for a sample of the calls. None if not sampled or disabled """
+    if not PROFILE_DIR or random.random() >= sample_rate:
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is running. Only one can run at a time since Python 3.12
+        return None
+    return profiler
+
+
+def stop_profile(profiler, prefix, name, duration, threshold):
+    """
+    Stop a profiler started with start_profile, and write its stats if the profiled code was slow.
+
+    :return: Path of the written profile, loadable with pstats or snakeviz. None if it is not written.
+    """
+    if profiler is None:
+        return None
+    profiler.disable()
+    if duration < threshold:
+        return None
+    profile_file = output_file(prefix, name, 'prof')
+    try:
+        profiler.dump_stats(profile_file)
+        rotate(prefix)
+    except OSError as e:
+        logger.warning(f"Error writing profile {profile_file}: {e}")
+        return None
+    return profile_file
+
+
+@contextmanager
+def profile_block(prefix, name, threshold, sample_rate=1.0):
+    """ Profile the block in the calling thread and write the stats if it lasts more than threshold seconds """
+    profiler = start_profile(sample_rate)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stop_profile(profiler, prefix, name, time.perf_counter() - start, threshold)
+
+
+def write_tracemalloc_snapshot():
+    """ Write the allocations traced so far. The file is loadable with tracemalloc.Snapshot.load """
+    if not tracemalloc.is_tracing():
+        return None
+    snapshot = tracemalloc.take_snapshot()
+    snapshot_file = output_file('tracemalloc', str(os.getpid()), 'snapshot')
+    snapshot.dump(snapshot_file)
+    rotate('tracemalloc')
+    current, peak = tracemalloc.get_traced_memory()
+    logger.info(f"Wrote tracemalloc snapshot {snapshot_file}. Traced {current} bytes, peak {peak} bytes")
+    return snapshot_file
+
+
+def log_slow_query(cursor, sql, parameters, duration):
+    """ Log a statement slower than SLOW_QUERY_THRESHOLD, with its query plan """
+    plan = ''
+    if parameters is not None and sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'WITH')):
+        try:
+            plan_cursor = cursor.connection.cursor(sqlite3.Cursor)
+            plan_rows = plan_cursor.execute('EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+            plan = ' | '.join(str(row[3]) for row in plan_rows)
+        except sqlite3.Error as e:
+            plan = f"unavailable: {e}"
+    statement = ' '.join(sql.split())
+    slow_query_logger.warning(f"{duration * 1000:.1f}ms {statement} PLAN: {plan or '-'}")
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """ Cursor timing its statements. The time to fetch the rows of a SELECT is counted with fetchall """
+
+    last_sql = ''
+    last_parameters = None
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.last_sql = sql
+            self.last_parameters = parameters
+            duration = time.perf_counter() - start
+            if duration >= SLOW_QUERY_THRESHOLD:
+                log_slow_query(self, sql, parameters, duration)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            duration = time.perf_counter() - start
+            if duration >= SLOW_QUERY_THRESHOLD:
+                # The plan needs a single row of parameters
+                log_slow_query(self, sql, None, duration)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            duration = time.perf_counter() - start
+            if duration >= SLOW_QUERY_THRESHOLD:
+                log_slow_query(self, self.last_sql, self.last_parameters, duration)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+
+def connection_factory():
+    """ Connection class to pass to sqlite3.connect. It only times the statements when the slow query log is on """
+    if PROFILE_DIR and SLOW_QUERY_THRESHOLD > 0:
+        return ProfiledConnection
+    return sqlite3.Connection
@@ -1,5 +1,7 @@
 import ctypes
 
+import numpy as np
+
 class QtryBasicInfoOutput(ctypes.Structure):
     """Wrapper struct for accessing QtryBasicInfoOutput in quottery_cpp library"""
     _fields_ = [
@@ -65,6 +67,23 @@ class BetInfoOutput(ctypes.Structure):
         ('betResultOPId', ctypes.c_int8 * 8)
     ]
 
+# NumPy view of BetInfoOutput, used to decode many bets at once. Same layout as the ctypes struct
+BET_INFO_DTYPE = np.dtype([
+    ('betId', '<u4'),
+    ('nOption', '<u4'),
+    ('creator', 'u1', 32),
+    ('betDesc', 'u1', 32),
+    ('optionDesc', 'u1', (8, 32)),
+    ('oracleProviderId', 'u1', (8, 32)),
+    ('oracleFees', '<u4', 8),
+    ('dateTimes', '<u4', 3),  # openDateTime, closeDateTime, endDateTime
+    ('minBetAmount', '<u8'),
+    ('maxBetSlotPerOption', '<u4'),
+    ('currentBetState', '<u4', 8),
+    ('betResultWonOption', 'i1', 8),
+    ('betResultOPId', 'i1', 8),
+], align=True)
+
 class QtryBasicInfoOutput(ctypes.Structure):
     """Wrapper struct for accessing QtryBasicInfoOutput in quottery_cpp library"""
     _fields_ = [
@@ -92,6 +111,52 @@ class QtryBetOptionDetail(ctypes.Structure):
         ('bettor', ctypes.c_uint8 * 32 * 1024)
     ]
 
+class NativeBetInfoOutput(ctypes.Structure):
+    """Wrapper struct for BetInfoOutput of quottery_wrapper.h. The dates are already unpacked by the library"""
+    _fields_ = [
+        ('betId', ctypes.c_uint32),
+        ('nOption', ctypes.c_uint32),
+        ('creator', ctypes.c_uint8 * 32),
+        ('betDesc', ctypes.c_uint8 * 32),
+        ('optionDesc', ctypes.c_uint8 * 256),
+        ('oracleProviderId', ctypes.c_uint8 * 256),
+        ('oracleFees', ctypes.c_uint32 * 8),
+
+        # [YY, MM, DD, HH, MM, SS]
+        ('openDateTime', ctypes.c_uint8 * 6),
+        ('closeDateTime', ctypes.c_uint8 * 6),
+        ('endDateTime', ctypes.c_uint8 * 6),
+
+        ('minBetAmount', ctypes.c_uint64),
+        ('maxBetSlotPerOption', ctypes.c_uint32),
+        ('currentBetState', ctypes.c_uint32 * 8),
+
+        ('betResultWonOption', ctypes.c_int8 * 8),
+        ('betResultOPId', ctypes.c_int8 * 8)
+    ]
+
+class NativeBetOptionDetail(ctypes.Structure):
+    """Wrapper struct for QuotteryBetOptionDetail of quottery_wrapper.h. Distinct bettors and their slots"""
+    _fields_ = [
+        ('bettor', ctypes.c_uint8 * 32 * 1024),
+        ('bettorAmountOfSlots', ctypes.c_uint32 * 1024)
+    ]
+
+# Convert a NativeBetInfoOutput into the BetInfoOutput payload answered by the RPC endpoint
+def native_bet_info_payload(native):
+    output = BetInfoOutput()
+    # Same layout up to the dates
+    ctypes.memmove(ctypes.addressof(output), ctypes.addressof(native), BetInfoOutput.openDateTime.offset)
+    output.openDateTime = pack_date(*native.openDateTime)
+    output.closeDateTime = pack_date(*native.closeDateTime)
+    output.endDateTime = pack_date(*native.endDateTime)
+    output.minBetAmount = native.minBetAmount
+    output.maxBetSlotPerOption = native.maxBetSlotPerOption
+    output.currentBetState[:] = native.currentBetState[:]
+    output.betResultWonOption[:] = native.betResultWonOption[:]
+    output.betResultOPId[:] = native.betResultOPId[:]
+    return bytes(output)
+
 def QTRY_GET_YEAR(data):
     return (data >> 26) + 24
 
@@ -120,4 +185,32 @@ def unpack_date(data):
     YY_MM_DD_HH_MM_SS[4] = QTRY_GET_MINUTE(data)
     YY_MM_DD_HH_MM_SS[5] = QTRY_GET_SECOND(data)
 
-    return YY_MM_DD_HH_MM_SS
\ No newline at end of file
+    return YY_MM_DD_HH_MM_SS
+
+# Pack [YY, MM, DD, HH, MM, SS] into a uint32_t. Inverse of unpack_date
+def pack_date(YY, MM, DD, hh, mm, ss):
+    return ((YY - 24) << 26) | (MM << 22) | (DD << 17) | (hh << 12) | (mm << 6) | ss
+
+# Distinct non-zero 32-byte public keys of a payload and how many times each one appears, in order of first appearance
+def count_public_keys(data):
+    keys = np.frombuffer(data, dtype=np.uint8, count=len(data) // 32 * 32).reshape(-1, 32)
+    keys = keys[keys.any(axis=1)]
+    if not len(keys):
+        return [], []
+
+    # Compare the keys as single 32-byte values
+    rows = np.ascontiguousarray(keys).view(np.dtype((np.void, 32))).ravel()
+    unique_rows, first_index, counts = np.unique(rows, return_index=True, return_counts=True)
+    order = np.argsort(first_index)
+    return [row.tobytes() for row in unique_rows[order]], counts[order].tolist()
+
+# Unpack an array of packed dates into an array of [YY, MM, DD, HH, MM, SS] along a new last axis
+def unpack_dates(data):
+    data = np.asarray(data, dtype=np.uint32)
+    return np.stack([(data >> 26) + 24, (data >> 22) & 0b1111, (data >> 17) & 0b11111,
+                     (data >> 12) & 0b11111, (data >> 6) & 0b111111, data & 0b111111], axis=-1)
+
+# Decode BetInfoOutput payloads into a structured array of BET_INFO_DTYPE
+def decode_bet_infos(payloads):
+    size = BET_INFO_DTYPE.itemsize
+    return np.frombuffer(b''.join(payload[:size] for payload in payloads), dtype=BET_INFO_DTYPE)
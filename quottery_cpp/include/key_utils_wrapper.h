@@ -8,4 +8,8 @@ int getPublicKeyFromIdentityWrapper(const char* identity, uint8_t* publicKey);
 
 int getIdentityFromPublicKeyWrapper(const uint8_t* pubkey, char* identity);
 
+// Convert count public keys, stored contiguously (32 bytes each), into identities.
+// Each identity takes 61 bytes in the output buffer: 60 characters and the string terminator
+int getIdentitiesFromPublicKeysWrapper(const uint8_t* pubkeys, uint32_t count, char* identities);
+
 }
\ No newline at end of file
@@ -14,4 +14,13 @@ int getIdentityFromPublicKeyWrapper(const uint8_t* pubkey, char* identity)
 {
     getIdentityFromPublicKey(pubkey, identity, false);
     return 0;
+}
+
+int getIdentitiesFromPublicKeysWrapper(const uint8_t* pubkeys, uint32_t count, char* identities)
+{
+    for (uint32_t i = 0; i < count; i++)
+    {
+        getIdentityFromPublicKey(pubkeys + 32 * i, identities + 61 * i, false);
+    }
+    return 0;
 }
\ No newline at end of file
@@ -1,15 +1,18 @@
 #include "node_utils_wrapper.h"
 
 #include <nodeUtils.h>
+#include <quottery.h>
+#include <connection.h>
 #include <iostream>
 
 int getTickNumberFromNode(const char* nodeIp, const int nodePort, uint32_t& currentTickNumber)
 {
     currentTickNumber = 0;
+    // Reuse the persistent connection of the quottery calls
     QCPtr qc;
     try
     {
-        qc = make_qc(nodeIp, nodePort);
+        qc = get_qc(nodeIp, nodePort, false);
     }
     catch(const std::exception& e)
     {
@@ -24,8 +27,17 @@ int getTickNumberFromNode(const char* nodeIp, const int nodePort, uint32_t& curr
     catch(const std::exception& e)
     {
         std::cerr << e.what() << '\n';
+        // Reconnect for the next call
+        try
+        {
+            get_qc(nodeIp, nodePort, true);
+        }
+        catch(const std::exception& reset_error)
+        {
+            std::cerr << reset_error.what() << '\n';
+        }
         return 1;
     }
 
     return 0;
-}
\ No newline at end of file
+}
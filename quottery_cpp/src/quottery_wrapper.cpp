@@ -3,6 +3,7 @@
 #include <iostream>
 #include <cstring>
 #include <map>
+#include <vector>
 #include <chrono>
 #include <thread>
 
@@ -206,6 +207,8 @@ int quotteryWrapperBetOptionDetail(
     // Counting the user per options
     std::map<std::string, uint32_t> bettorCount;
     std::map<std::string, uint32_t> bettorIdx;
+    // Bettors in the order of their first slot, as counted by the RPC path
+    std::vector<std::string> bettorOrder;
     char buf[128] = {0};
     for (uint32_t i = 0; i < 1024; i++)
     {
@@ -218,6 +221,7 @@ int quotteryWrapperBetOptionDetail(
             {
                 bettorCount[id] = 1;
                 bettorIdx[id] = i;
+                bettorOrder.push_back(id);
             }
             else
             {
@@ -229,10 +233,10 @@ int quotteryWrapperBetOptionDetail(
     // Convert data for external use
     numberOfUsers = bettorCount.size();
     uint32_t index = 0;
-    for (auto& iter : bettorCount)
+    for (auto& id : bettorOrder)
     {
-        result.bettorAmountOfSlots[index] = iter.second;
-        uint32_t user_index = bettorIdx[iter.first];
+        result.bettorAmountOfSlots[index] = bettorCount[id];
+        uint32_t user_index = bettorIdx[id];
         std::copy(betOptionDetail.bettor + user_index * 32, betOptionDetail.bettor + user_index * 32 + 32, result.bettor + 32 * index);
         index++;
     }
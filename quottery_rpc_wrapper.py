@@ -1,9 +1,16 @@
-from collections import defaultdict
+from collections import defaultdict, deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import logging
+import os
+import random
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 import time
 import ctypes
+import struct
 import base64
+from urllib.parse import urlsplit
 import qtry_utils
 
 # Define the rpc Quottery struct wrapper
@@ -29,6 +36,36 @@ QTRY_GET_STRING = {
     QTRY_GET_ACTIVE_BET : "GetActiveBet",
     QTRY_GET_BET_BY_CREATOR : "GetBetByCreator"
 }
+TICK_INFO_STRING = "TickInfo"
+
+# Default parameters of the http session
+RPC_CONNECT_TIMEOUT = 3.05  # seconds
+RPC_READ_TIMEOUT = 10  # seconds
+RPC_MAX_RETRIES = 3
+RPC_BACKOFF_BASE = 0.2  # seconds
+RPC_BACKOFF_MAX = 5  # seconds
+RPC_POOL_SIZE = 10
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Endpoint selection when several RPC endpoints are given
+RPC_EWMA_ALPHA = 0.2  # weight of the last call in the latency and error rate averages
+RPC_ERROR_PENALTY = 10  # an endpoint failing all its calls scores as 10 times slower
+RPC_SPREAD_FACTOR = 2  # bulk calls are spread over the endpoints scoring within this factor of the best one
+RPC_HEDGE_MIN_SAMPLES = 20  # calls needed before hedging on the p95 latency of an endpoint
+RPC_LATENCY_WINDOW = 200  # number of recent latencies kept per endpoint for the p95
+RPC_CIRCUIT_FAILURES = 5  # consecutive failures opening the circuit of an endpoint
+RPC_CIRCUIT_COOLDOWN = 30  # seconds before a single trial call is let through an open circuit
+# Cache of the identities computed from public keys
+# Transports to the node
+TRANSPORT_HTTP = 'http'  # JSON RPC endpoint
+TRANSPORT_NATIVE = 'native'  # node TCP protocol, through the quottery_cpp library
+NODE_PORT = 21841  # TCP port of the node, used by the native transport
+MAX_ACTIVE_BETS = 1024
+NATIVE_NO_INFO = 2  # WrapperStatus::NO_INFO of the quottery_cpp library
+
+PUBLIC_KEY_SIZE = 32
+IDENTITY_LENGTH = 60
+IDENTITY_CACHE_SIZE = 65536  # number of identities kept in memory
 
 def makeJsonData(contractIndex, inputType, inputSize, requestData):
     return {
@@ -38,13 +75,86 @@ def makeJsonData(contractIndex, inputType, inputSize, requestData):
         'requestData': requestData
     }
 
+class RpcEndpoint:
+    """Health of one RPC endpoint: averaged latency and error rate, recent latencies and circuit breaker"""
+    def __init__(self, address):
+        self.address = address
+        self.ewmaLatency = None
+        self.ewmaErrorRate = 0.0
+        self.latencies = deque(maxlen=RPC_LATENCY_WINDOW)
+        self.consecutiveFailures = 0
+        self.circuitOpenUntil = 0.0
+        self.trialInFlight = False
+        self.count = 0
+        self.errors = 0
+
+    def record_success(self, latency):
+        self.count += 1
+        self.latencies.append(latency)
+        if self.ewmaLatency is None:
+            self.ewmaLatency = latency
+        else:
+            self.ewmaLatency += RPC_EWMA_ALPHA * (latency - self.ewmaLatency)
+        self.ewmaErrorRate -= RPC_EWMA_ALPHA * self.ewmaErrorRate
+        self.consecutiveFailures = 0
+        self.circuitOpenUntil = 0.0
+        self.trialInFlight = False
+
+    def record_failure(self):
+        self.count += 1
+        self.errors += 1
+        self.ewmaErrorRate += RPC_EWMA_ALPHA * (1.0 - self.ewmaErrorRate)
+        self.consecutiveFailures += 1
+        self.trialInFlight = False
+        if self.consecutiveFailures >= RPC_CIRCUIT_FAILURES:
+            self.circuitOpenUntil = time.monotonic() + RPC_CIRCUIT_COOLDOWN
+
+    def available(self, now):
+        """Closed circuit, or open circuit whose cooldown is over and without a trial call running"""
+        if self.circuitOpenUntil == 0.0:
+            return True
+        return now >= self.circuitOpenUntil and not self.trialInFlight
+
+    def score(self):
+        """Expected cost of a call, lower is healthier. Endpoints never called score as the fastest"""
+        latency = self.ewmaLatency if self.ewmaLatency is not None else 0.0
+        return latency * (1.0 + RPC_ERROR_PENALTY * self.ewmaErrorRate)
+
+    def p95_latency(self):
+        """95th percentile of the recent latencies. None until enough calls are recorded"""
+        if len(self.latencies) < RPC_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
 class QuotteryRpcWrapper:
     """Class allow requesting data from http endpoint"""
-    def __init__(self, address, libFile, logName=''):
+    def __init__(self, address, libFile, logName='',
+                 connectTimeout=RPC_CONNECT_TIMEOUT,
+                 readTimeout=RPC_READ_TIMEOUT,
+                 maxRetries=RPC_MAX_RETRIES,
+                 identityCacheSize=IDENTITY_CACHE_SIZE,
+                 identityCacheFile=None,
+                 transport=TRANSPORT_HTTP,
+                 nodePort=NODE_PORT,
+                 maxConcurrentCalls=RPC_POOL_SIZE):
         """
         Args:
-            apiUri (str): The full path to quottery http endpoint
+            address (str or list): The http endpoint, a list of endpoints or a comma separated string of endpoints.
+                With several endpoints, each call goes to the healthiest one, slow calls are hedged on a second one
+                and failing endpoints are put aside for a while
+            libFile (str): The path to the quottery_cpp library
             logName (str, optional): The name of the logging, default is empty
+            connectTimeout (float, optional): Seconds to wait for the connection to the endpoint
+            readTimeout (float, optional): Seconds to wait for the endpoint to respond
+            maxRetries (int, optional): Number of retries on server errors and connection errors
+            identityCacheSize (int, optional): Number of identities kept in the public key to identity cache
+            identityCacheFile (str, optional): File persisting the identity cache between runs
+            transport (str, optional): TRANSPORT_HTTP, or TRANSPORT_NATIVE to talk to the node of the first address
+                directly over its TCP protocol
+            nodePort (int, optional): The TCP port of the node if the address does not have one. Native transport only
+            maxConcurrentCalls (int, optional): Number of threads calling the wrapper at once. Sizes the connection
+                pool and the hedge executor
         """
 
         log_format = '[%(name)s][%(asctime)s] %(message)s'
@@ -67,28 +177,514 @@ class QuotteryRpcWrapper:
             ctypes.POINTER(ctypes.c_uint8), ctypes.c_char_p]
         self.quottery_cpp_func.getIdentityFromPublicKeyWrapper.restype = ctypes.c_int
 
+        # Key utils functions: Identities from contiguous Pubkeys. Missing in the older libraries
+        self.batchIdentityFunc = getattr(self.quottery_cpp_func, 'getIdentitiesFromPublicKeysWrapper', None)
+        if self.batchIdentityFunc is not None:
+            self.batchIdentityFunc.argtypes = [ctypes.c_char_p, ctypes.c_uint32, ctypes.c_char_p]
+            self.batchIdentityFunc.restype = ctypes.c_int
+
+        # Identities of the recently seen public keys, least recently used first
+        self.identityLock = threading.RLock()
+        self.identityCache = OrderedDict()
+        self.identityCacheSize = identityCacheSize
+        self.identityCacheFile = identityCacheFile
+        self.unsavedIdentities = []
+        if identityCacheFile:
+            self.load_identity_cache()
+
         # Constant parameters
-        self.httpEndPoint = address
+        if isinstance(address, str):
+            address = address.split(',')
+        self.endpoints = [RpcEndpoint(endpoint.strip().rstrip('/')) for endpoint in address if endpoint.strip()]
+        if not self.endpoints:
+            raise ValueError('At least one RPC endpoint is required')
+        self.httpEndPoint = self.endpoints[0].address
         self.apiUri = self.httpEndPoint + API_PATH
         self.tickInfoUri = self.httpEndPoint + TICK_INFO_PATH
         self.scheduleTickOffset = 5
         self.maxNumberOfOracleProvides = 8
         self.maxIdsPerOption = 1024
 
-    def get_qtry_response(self, json_data):
+        # A hedged call runs in the executor and may start a second call, while the calls that are not hedged
+        # run in the calling threads
+        hedgeWorkers = 2 * maxConcurrentCalls if len(self.endpoints) > 1 else 0
+
+        # Shared keep-alive session. All requests reuse the pooled connections to the endpoint. The pool holds a
+        # connection for each thread that can send a request at once, so none is discarded after its request
+        self.session = requests.Session()
+        self.session.headers.update(MESSAGE_HEADERS)
+        adapter = HTTPAdapter(pool_connections=len(self.endpoints), pool_maxsize=maxConcurrentCalls + hedgeWorkers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.timeout = (connectTimeout, readTimeout)
+        self.maxRetries = maxRetries
+
+        # Endpoint health is updated by the hedged calls running in the executor
+        self.endpointLock = threading.Lock()
+        self.spreadCounter = 0
+        self.hedgeExecutor = None
+        if hedgeWorkers:
+            self.hedgeExecutor = ThreadPoolExecutor(max_workers=hedgeWorkers,
+                                                    thread_name_prefix='qtry-rpc-hedge')
+
+        # Latency of the calls, grouped by request name. Calls can come from several threads
+        self.statsLock = threading.Lock()
+        self.latencyStats = defaultdict(lambda: {
+            'count': 0, 'errors': 0, 'total': 0.0, 'max': 0.0, 'last': 0.0,
+            'buckets': [0] * (len(LATENCY_BUCKETS) + 1), 'bytes': 0, 'decode': 0.0})
+
+        self.transport = transport
+        if transport == TRANSPORT_NATIVE:
+            self.init_native(nodePort)
+        elif transport != TRANSPORT_HTTP:
+            raise ValueError(f'Unknown transport {transport}')
+
+    def init_native(self, nodePort):
+        """Binds the node functions of the quottery_cpp library. The library keeps one persistent
+        connection to the node, so the calls are serialized
+
+        Args:
+            nodePort (int): The TCP port of the node if the address does not have one
+        """
+        if len(self.endpoints) > 1:
+            self.logger.warning('The native transport only uses the first endpoint %s', self.httpEndPoint)
+        address = self.httpEndPoint if '//' in self.httpEndPoint else '//' + self.httpEndPoint
+        node = urlsplit(address)
+        self.nodeIp = node.hostname.encode('utf-8')
+        self.nodePort = node.port or nodePort
+        self.nativeLock = threading.Lock()
+
+        lib = self.quottery_cpp_func
+        lib.quotteryWrapperGetBasicInfo.argtypes = [
+            ctypes.c_char_p, ctypes.c_int, ctypes.POINTER(qtry_utils.QtryBasicInfoOutput)]
+        lib.quotteryWrapperGetBasicInfo.restype = ctypes.c_int
+
+        lib.quotteryWrapperGetActiveBet.argtypes = [
+            ctypes.c_char_p, ctypes.c_int, ctypes.POINTER(ctypes.c_uint32), ctypes.POINTER(ctypes.c_uint32)]
+        lib.quotteryWrapperGetActiveBet.restype = ctypes.c_int
+
+        lib.quotteryWrapperGetBetInfo.argtypes = [
+            ctypes.c_char_p, ctypes.c_int, ctypes.c_int, ctypes.POINTER(qtry_utils.NativeBetInfoOutput)]
+        lib.quotteryWrapperGetBetInfo.restype = ctypes.c_int
+
+        lib.quotteryWrapperBetOptionDetail.argtypes = [
+            ctypes.c_char_p, ctypes.c_int, ctypes.c_uint32, ctypes.c_uint32,
+            ctypes.POINTER(ctypes.c_uint32), ctypes.POINTER(qtry_utils.NativeBetOptionDetail)]
+        lib.quotteryWrapperBetOptionDetail.restype = ctypes.c_int
+
+        lib.getTickNumberFromNode.argtypes = [ctypes.c_char_p, ctypes.c_int, ctypes.POINTER(ctypes.c_uint32)]
+        lib.getTickNumberFromNode.restype = ctypes.c_int
+
+    def record_latency(self, requestName, latency, failed=False, size=0):
+        """Records the latency of a call into the latency statistics
+
+        Args:
+            requestName (str): The name of the request
+            latency (float): The duration of the call in seconds
+            failed (bool, optional): The call did not get a valid response
+            size (int, optional): Number of bytes received
+        """
+        # The last bucket counts the calls slower than all the bounds
+        bucket = 0
+        while bucket < len(LATENCY_BUCKETS) and latency > LATENCY_BUCKETS[bucket]:
+            bucket += 1
+        with self.statsLock:
+            stats = self.latencyStats[requestName]
+            stats['count'] += 1
+            stats['total'] += latency
+            stats['max'] = max(stats['max'], latency)
+            stats['last'] = latency
+            stats['bytes'] += size
+            stats['buckets'][bucket] += 1
+            if failed:
+                stats['errors'] += 1
+
+    def record_decode(self, requestName, duration):
+        """Records the time spent decoding a response, separately from the network latency
+
+        Args:
+            requestName (str): The name of the request
+            duration (float): The duration of the decoding in seconds
+        """
+        with self.statsLock:
+            self.latencyStats[requestName]['decode'] += duration
+
+    def compute_identities(self, publicKeys):
+        """Converts public keys into identities with the quottery_cpp library, in one call when supported
+
+        Args:
+            publicKeys (list): 32-byte public keys
+
+        Returns:
+            list: the identities, in the same order
+        """
+        if self.batchIdentityFunc is not None:
+            identity_stride = IDENTITY_LENGTH + 1
+            identities_buffer = ctypes.create_string_buffer(identity_stride * len(publicKeys))
+            self.batchIdentityFunc(b''.join(publicKeys), len(publicKeys), identities_buffer)
+            raw = identities_buffer.raw
+            return [raw[i * identity_stride:i * identity_stride + IDENTITY_LENGTH].decode('utf-8')
+                    for i in range(len(publicKeys))]
+
+        identities = []
+        identity_buffer = ctypes.create_string_buffer(IDENTITY_LENGTH + 1)
+        for public_key in publicKeys:
+            self.quottery_cpp_func.getIdentityFromPublicKeyWrapper(
+                (ctypes.c_uint8 * PUBLIC_KEY_SIZE).from_buffer_copy(public_key), identity_buffer)
+            identities.append(identity_buffer.value.decode('utf-8'))
+        return identities
+
+    def get_identities(self, publicKeys):
+        """Gets the identities of public keys, from the cache or computed in a single batch
+
+        Args:
+            publicKeys (list): 32-byte public keys, as bytes
+
+        Returns:
+            list: the identities, in the same order
+        """
+        with self.identityLock:
+            cache = self.identityCache
+            missing = []
+            for public_key in publicKeys:
+                if public_key in cache:
+                    cache.move_to_end(public_key)
+                else:
+                    missing.append(public_key)
+
+            if missing:
+                missing = list(dict.fromkeys(missing))
+                for public_key, identity in zip(missing, self.compute_identities(missing)):
+                    cache[public_key] = identity
+                    if self.identityCacheFile:
+                        self.unsavedIdentities.append((public_key, identity))
+                while len(cache) > self.identityCacheSize:
+                    cache.popitem(last=False)
+
+            return [cache[public_key] if public_key in cache else self.compute_identities([public_key])[0]
+                    for public_key in publicKeys]
+
+    def get_identity(self, publicKey):
+        """Gets the identity of a 32-byte public key, through the cache"""
+        return self.get_identities([bytes(publicKey)])[0]
+
+    def load_identity_cache(self):
+        """Loads the identities persisted in identityCacheFile. Entries are a public key followed by its identity"""
+        entry_size = PUBLIC_KEY_SIZE + IDENTITY_LENGTH
         try:
-            response = requests.post(
-                self.apiUri, headers = MESSAGE_HEADERS, json = json_data)
+            with open(self.identityCacheFile, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            self.logger.warning('[WARNING] Failed to load identity cache %s: %s', self.identityCacheFile, e)
+            return
+
+        entry_count = len(data) // entry_size
+        for i in range(entry_count):
+            entry = data[i * entry_size:(i + 1) * entry_size]
+            self.identityCache[entry[:PUBLIC_KEY_SIZE]] = entry[PUBLIC_KEY_SIZE:].decode('utf-8')
+            self.identityCache.move_to_end(entry[:PUBLIC_KEY_SIZE])
+        while len(self.identityCache) > self.identityCacheSize:
+            self.identityCache.popitem(last=False)
+
+        # Compact the file once the appended entries outgrow the cache
+        if entry_count > 2 * max(len(self.identityCache), 1) or len(data) % entry_size:
+            self.unsavedIdentities = list(self.identityCache.items())
+            self.save_identity_cache(rewrite=True)
+        self.logger.info('Loaded %d identities from %s', len(self.identityCache), self.identityCacheFile)
+
+    def save_identity_cache(self, rewrite=False):
+        """Appends the identities computed since the last save to identityCacheFile
+
+        Args:
+            rewrite (bool, optional): Replace the file with the unsaved identities instead of appending them
+        """
+        if not self.identityCacheFile or not (self.unsavedIdentities or rewrite):
+            return
+        with self.identityLock:
+            data = b''.join(public_key + identity.encode('utf-8')
+                            for public_key, identity in self.unsavedIdentities)
+            try:
+                if rewrite:
+                    tmp_file = self.identityCacheFile + '.tmp'
+                    with open(tmp_file, 'wb') as f:
+                        f.write(data)
+                    os.replace(tmp_file, self.identityCacheFile)
+                else:
+                    with open(self.identityCacheFile, 'ab') as f:
+                        f.write(data)
+                self.unsavedIdentities = []
+            except OSError as e:
+                self.logger.warning('[WARNING] Failed to save identity cache %s: %s', self.identityCacheFile, e)
+
+    def get_endpoint_stats(self):
+        """Gets the health of each RPC endpoint
+
+        Returns:
+            dict: endpoint address to averaged latency, error rate, p95 latency, call and error counts,
+                and whether its circuit is open
+        """
+        now = time.monotonic()
+        with self.endpointLock:
+            return {endpoint.address: {
+                'latency': endpoint.ewmaLatency,
+                'error_rate': endpoint.ewmaErrorRate,
+                'p95': endpoint.p95_latency(),
+                'count': endpoint.count,
+                'errors': endpoint.errors,
+                'circuit_open': endpoint.circuitOpenUntil > now,
+            } for endpoint in self.endpoints}
+
+    def select_endpoints(self, spread=False, exclude=()):
+        """Selects the endpoints to call, the healthiest first
+
+        Args:
+            spread (bool, optional): Rotate the first endpoint over all the healthy ones, for bulk calls
+            exclude (tuple, optional): Endpoints that already failed this call. Only used if nothing else is left
+
+        Returns:
+            list: the available endpoints ordered by preference. The first one is marked as a trial call
+                if its circuit is open
+        """
+        now = time.monotonic()
+        with self.endpointLock:
+            candidates = [endpoint for endpoint in self.endpoints if endpoint.available(now)]
+            if not candidates:
+                # Every circuit is open. Use the endpoint closest to the end of its cooldown
+                candidates = [min(self.endpoints, key=lambda endpoint: endpoint.circuitOpenUntil)]
+            preferred = [endpoint for endpoint in candidates if endpoint not in exclude]
+            if preferred:
+                candidates = preferred
+            candidates.sort(key=lambda endpoint: endpoint.score())
+
+            if spread and len(candidates) > 1:
+                best_score = candidates[0].score()
+                healthy = [endpoint for endpoint in candidates
+                           if endpoint.score() <= best_score * RPC_SPREAD_FACTOR]
+                self.spreadCounter += 1
+                first = healthy[self.spreadCounter % len(healthy)]
+                candidates.remove(first)
+                candidates.insert(0, first)
+
+            if candidates[0].circuitOpenUntil:
+                candidates[0].trialInFlight = True
+            return candidates
+
+    def call_endpoint(self, endpoint, method, path, json_data):
+        """Sends one request to one endpoint and updates its health
+
+        Returns:
+            tuple: the parsed json response (None if failed), the number of bytes received,
+                whether the failure can be retried and the error
+        """
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, endpoint.address + path, json=json_data, timeout=self.timeout)
             response.raise_for_status()  # Raise an error for bad status codes
             result = response.json()  # Parse the JSON response
-            return result
-        except requests.exceptions.RequestException as e:
-            print("An error occurred:", e)
-            debug_request = 'Unknown'
-            if json_data['inputType'] in QTRY_GET_STRING:
-                debug_request =  QTRY_GET_STRING[json_data['inputType']]
-            self.logger.warning('[WARNING] Failed to get qtry respond for %s. Retry later.', debug_request)
+            with self.endpointLock:
+                endpoint.record_success(time.perf_counter() - start)
+            return result, len(response.content), False, None
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            retry, error = True, e
+        except requests.exceptions.HTTPError as e:
+            retry = e.response is not None and e.response.status_code >= 500
+            error = e
+        except (requests.exceptions.RequestException, ValueError) as e:
+            retry, error = False, e
+        with self.endpointLock:
+            endpoint.record_failure()
+        return None, 0, retry, error
+
+    def call_hedged(self, endpoints, method, path, json_data):
+        """Calls the first endpoint. If it has not answered after its p95 latency,
+        sends the same request to the second endpoint and keeps the first valid response
+
+        Returns:
+            tuple: same as call_endpoint, and the endpoints that were called
+        """
+        primary = endpoints[0]
+        with self.endpointLock:
+            hedge_delay = primary.p95_latency()
+        if self.hedgeExecutor is None or len(endpoints) < 2 or hedge_delay is None:
+            return self.call_endpoint(primary, method, path, json_data) + ([primary],)
+
+        pending = {self.hedgeExecutor.submit(self.call_endpoint, primary, method, path, json_data): primary}
+        done, _ = wait(pending, timeout=hedge_delay)
+        if not done:
+            secondary = endpoints[1]
+            pending[self.hedgeExecutor.submit(self.call_endpoint, secondary, method, path, json_data)] = secondary
+            self.logger.debug('Hedging request to %s after %.3fs', secondary.address, hedge_delay)
+
+        called = list(pending.values())
+        outcome = None
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                del pending[future]
+                outcome = future.result()
+                if outcome[0] is not None:
+                    # The slower call keeps running in the background and only updates the health of its endpoint
+                    return outcome + (called,)
+        return outcome + (called,)
+
+    def call_native(self, requestName, responseSize, func, *args):
+        """Calls a node function of the quottery_cpp library with the same retries as send_request.
+        The library resets its connection after a failure
+
+        Args:
+            requestName (str): The name of the request, used for logging and latency statistics
+            responseSize (int): The size of the output struct, counted as bytes received
+            func: The library function. It is called with the node address followed by args
+
+        Returns:
+            int: the status of the library. 0 is success
+        """
+        start = time.perf_counter()
+        for attempt in range(0, self.maxRetries + 1):
+            with self.nativeLock:
+                sts = func(self.nodeIp, self.nodePort, *args)
+            if sts == 0 or sts == NATIVE_NO_INFO:
+                self.record_latency(requestName, time.perf_counter() - start, size=responseSize)
+                return sts
+
+            if attempt == self.maxRetries:
+                break
+            backoff = random.uniform(0, min(RPC_BACKOFF_MAX, RPC_BACKOFF_BASE * (2 ** attempt)))
+            self.logger.info('Request %s failed (status %d). Retry in %.2fs', requestName, sts, backoff)
+            time.sleep(backoff)
+
+        self.record_latency(requestName, time.perf_counter() - start, failed=True)
+        self.logger.warning('[WARNING] Request %s failed: status %d', requestName, sts)
+        return sts
+
+    def query_native(self, inputType, requestData):
+        """Gets the output of a quottery function through the native transport
+
+        Returns:
+            bytes: the output, in the same layout as the RPC endpoint. None if the request failed
+        """
+        lib = self.quottery_cpp_func
+        request_name = QTRY_GET_STRING[inputType]
+        if inputType == QTRY_GET_BASIC_INFO:
+            output = qtry_utils.QtryBasicInfoOutput()
+            if self.call_native(request_name, ctypes.sizeof(output), lib.quotteryWrapperGetBasicInfo,
+                                ctypes.byref(output)):
+                return None
+            return bytes(output)
+
+        if inputType == QTRY_GET_ACTIVE_BET:
+            bet_count = ctypes.c_uint32(0)
+            bet_ids = (ctypes.c_uint32 * MAX_ACTIVE_BETS)()
+            if self.call_native(request_name, ctypes.sizeof(bet_ids), lib.quotteryWrapperGetActiveBet,
+                                ctypes.byref(bet_count), bet_ids):
+                return None
+            return bytes(bet_count) + bytes(bet_ids)
+
+        if inputType == QTRY_GET_BET_INFO:
+            output = qtry_utils.NativeBetInfoOutput()
+            if self.call_native(request_name, ctypes.sizeof(output), lib.quotteryWrapperGetBetInfo,
+                                int.from_bytes(requestData[:4], byteorder='little'), ctypes.byref(output)):
+                return None
+            return qtry_utils.native_bet_info_payload(output)
+
+        raise ValueError(f'Input type {inputType} is not supported by the native transport')
+
+    def query_contract(self, inputType, requestData=b''):
+        """Gets the output of a quottery function through the selected transport
+
+        Args:
+            inputType (int): The QTRY_GET_* function
+            requestData (bytes, optional): The input of the function
+
+        Returns:
+            bytes: the output of the function. None if the request failed
+        """
+        if self.transport == TRANSPORT_NATIVE:
+            return self.query_native(inputType, requestData)
+
+        input_base64 = base64.b64encode(requestData).decode('ascii')
+        json_data = makeJsonData(QTRY_CONTRACT_INDEX, inputType, len(requestData), input_base64)
+        response_data = self.get_qtry_response(json_data)
+        if response_data is None:
             return None
+        return base64.b64decode(response_data['responseData'])
+
+    def get_latency_stats(self, reset=False):
+        """Gets the latency statistics of the calls since the last reset
+
+        Args:
+            reset (bool, optional): Clear the statistics after reading them
+
+        Returns:
+            dict: request name to count, errors, total, average, max and last latency in seconds,
+                latency histogram (counts per LATENCY_BUCKETS bound, then above), bytes received
+                and seconds spent decoding
+        """
+        latency_stats = {}
+        with self.statsLock:
+            for name, stats in self.latencyStats.items():
+                latency_stats[name] = {
+                    'count': stats['count'],
+                    'errors': stats['errors'],
+                    'total': stats['total'],
+                    'avg': stats['total'] / stats['count'] if stats['count'] else 0.0,
+                    'max': stats['max'],
+                    'last': stats['last'],
+                    'buckets': list(stats['buckets']),
+                    'bytes': stats['bytes'],
+                    'decode': stats['decode'],
+                }
+            if reset:
+                self.latencyStats.clear()
+        return latency_stats
+
+    def send_request(self, method, path, requestName, json_data=None, spread=False):
+        """Sends a request through the shared session to the healthiest endpoint. Server errors,
+        connection errors and timeouts are retried on the next endpoint with a jittered exponential backoff
+
+        Args:
+            method (str): The http method
+            path (str): The path of the request on the endpoint
+            requestName (str): The name of the request, used for logging and latency statistics
+            json_data (dict, optional): The json body of the request
+            spread (bool, optional): Spread the request over all the healthy endpoints, for bulk calls
+
+        Returns:
+            dict: The parsed json response. None if the request failed
+        """
+        start = time.perf_counter()
+        failed_endpoints = []
+        for attempt in range(0, self.maxRetries + 1):
+            endpoints = self.select_endpoints(spread=spread, exclude=failed_endpoints)
+            result, size, retry, error, called = self.call_hedged(endpoints, method, path, json_data)
+            if result is not None:
+                self.record_latency(requestName, time.perf_counter() - start, size=size)
+                return result
+            failed_endpoints.extend(called)
+
+            if not retry or attempt == self.maxRetries:
+                break
+            # Full jitter to avoid all the retries hitting the endpoint at the same time
+            backoff = random.uniform(0, min(RPC_BACKOFF_MAX, RPC_BACKOFF_BASE * (2 ** attempt)))
+            self.logger.info('Request %s failed (%s). Retry in %.2fs', requestName, error, backoff)
+            time.sleep(backoff)
+
+        self.record_latency(requestName, time.perf_counter() - start, failed=True)
+        self.logger.warning('[WARNING] Request %s failed: %s', requestName, error)
+        return None
+
+    def get_qtry_response(self, json_data):
+        debug_request = 'Unknown'
+        if json_data['inputType'] in QTRY_GET_STRING:
+            debug_request =  QTRY_GET_STRING[json_data['inputType']]
+        # The per-bet calls are the bulk of a cycle. Spread them over the healthy endpoints
+        spread = json_data['inputType'] in (QTRY_GET_BET_INFO, QTRY_GET_BET_OPTION_DETAIL)
+        result = self.send_request('POST', API_PATH, debug_request, json_data, spread=spread)
+        if result is None:
+            self.logger.warning('[WARNING] Failed to get qtry respond for %s. Retry later.', debug_request)
+        return result
 
     def get_qtry_basic_info(self):
         """Gets the quottery basic information
@@ -97,17 +693,16 @@ class QuotteryRpcWrapper:
             sts (int): status of request. 0 is success, otherwise is failure
             dict: a dictionary that contain information about quottery basic information. If failure, it is empty
         """
-        json_data = makeJsonData(QTRY_CONTRACT_INDEX, QTRY_GET_BASIC_INFO, 0, "")
-        response_data = self.get_qtry_response(json_data)
+        data = self.query_contract(QTRY_GET_BASIC_INFO)
 
         basic_info = {}
         sts = 0
-        if response_data == None :
+        if data is None:
             sts = 1
             self.logger.warning('[WARNING] Failed to get qtry basic info')
             return (sts, basic_info)
 
-        data =  base64.b64decode(response_data['responseData'])
+        decode_start = time.perf_counter()
         qt_basic_info = qtry_utils.QtryBasicInfoOutput.from_buffer_copy(data)
 
         # Fill the data in dictionary
@@ -127,11 +722,9 @@ class QuotteryRpcWrapper:
         basic_info['distributed_amount'] = qt_basic_info.distributedAmount
         basic_info['burned_amount'] = qt_basic_info.burnedAmount
 
-        identity_buffer = ctypes.create_string_buffer(60)
-        self.quottery_cpp_func.getIdentityFromPublicKeyWrapper(
-             qt_basic_info.gameOperator, identity_buffer)
-        basic_info['game_operator'] = identity_buffer.value.decode('utf-8')
+        basic_info['game_operator'] = self.get_identity(qt_basic_info.gameOperator)
 
+        self.record_decode(QTRY_GET_STRING[QTRY_GET_BASIC_INFO], time.perf_counter() - decode_start)
         return sts, basic_info
 
     def get_active_bets(self):
@@ -146,15 +739,14 @@ class QuotteryRpcWrapper:
         """
         active_bets = []
         number_of_active_bets = 0
-        json_data = makeJsonData(QTRY_CONTRACT_INDEX, QTRY_GET_ACTIVE_BET, 0, "")
-        response_data = self.get_qtry_response(json_data)
+        data = self.query_contract(QTRY_GET_ACTIVE_BET)
         sts = 0
-        if response_data == None :
+        if data is None:
             sts = 1
             self.logger.warning('[WARNING] Failed to get active bet')
             return (sts, active_bets)
 
-        data =  base64.b64decode(response_data['responseData'])
+        decode_start = time.perf_counter()
         # Extract the first 4 bytes as number of active bets
         number_of_active_bets = int.from_bytes(data[:4], byteorder='little')
 
@@ -164,8 +756,166 @@ class QuotteryRpcWrapper:
             next_integer = int.from_bytes(next_4_bytes, byteorder='little')
             active_bets.append(next_integer)
 
+        self.record_decode(QTRY_GET_STRING[QTRY_GET_ACTIVE_BET], time.perf_counter() - decode_start)
         return sts, active_bets
 
+    def get_public_key(self, identity):
+        """Converts an identity into its 32-byte public key with the quottery_cpp library
+
+        Args:
+            identity (str): The 60-character identity
+
+        Returns:
+            bytes: the public key. None if the identity is not valid
+        """
+        if not isinstance(identity, str) or len(identity) != IDENTITY_LENGTH \
+                or not identity.isascii() or not identity.isalpha() or not identity.isupper():
+            return None
+        public_key = (ctypes.c_uint8 * PUBLIC_KEY_SIZE)()
+        if self.quottery_cpp_func.getPublicKeyFromIdentityWrapper(identity.encode('utf-8'), public_key):
+            return None
+        # The library does not check the checksum letters of the identity
+        public_key = bytes(public_key)
+        if self.get_identity(public_key) != identity:
+            return None
+        return public_key
+
+    def get_bets_by_creator(self, creator):
+        """Gets the IDs of the bets created by an identity
+
+        Args:
+            creator (str or bytes): The identity of the creator, or its 32-byte public key
+
+        Returns:
+            sts (int): status of request. 0 is success, otherwise is failure
+            list: the IDs of the bets
+        """
+        bet_ids = []
+        public_key = creator if isinstance(creator, bytes) else self.get_public_key(creator)
+        if public_key is None or len(public_key) != PUBLIC_KEY_SIZE:
+            self.logger.warning('[WARNING] Invalid creator %s', creator)
+            return (1, bet_ids)
+        if self.transport == TRANSPORT_NATIVE:
+            self.logger.warning('[WARNING] %s is not supported by the native transport',
+                                QTRY_GET_STRING[QTRY_GET_BET_BY_CREATOR])
+            return (1, bet_ids)
+
+        data = self.query_contract(QTRY_GET_BET_BY_CREATOR, public_key)
+        if data is None or len(data) < 4:
+            self.logger.warning('[WARNING] Failed to get the bets of creator %s', creator)
+            return (1, bet_ids)
+
+        decode_start = time.perf_counter()
+        # The first 4 bytes are the number of bets, followed by their IDs
+        number_of_bets = min(int.from_bytes(data[:4], byteorder='little'), (len(data) - 4) // 4)
+        bet_ids = list(struct.unpack_from(f'<{number_of_bets}I', data, 4))
+
+        self.record_decode(QTRY_GET_STRING[QTRY_GET_BET_BY_CREATOR], time.perf_counter() - decode_start)
+        return (0, bet_ids)
+
+    def get_bet_info_payload(self, betId):
+        """Gets the raw BetInfoOutput payload of a specific bet, to be decoded with decode_bet_infos
+
+        Args:
+            betId (int): The ID of the bet
+
+        Returns:
+            sts (int): status of request. 0 is success, otherwise is failure
+            bytes: the payload. If failure, it is empty
+        """
+        data = self.query_contract(QTRY_GET_BET_INFO, betId.to_bytes(4, byteorder='little', signed=False))
+        if data is None:
+            self.logger.warning('WARNING] Failed to get info of bet ID %d', betId)
+            return (1, b'')
+
+        if len(data) < qtry_utils.BET_INFO_DTYPE.itemsize:
+            self.logger.warning('WARNING] Truncated info of bet ID %d: %d bytes', betId, len(data))
+            return (1, b'')
+        return (0, data)
+
+    def decode_bet_infos(self, betIds, payloads):
+        """Decodes many BetInfoOutput payloads at once
+
+        Args:
+            betIds (list): The IDs of the bets
+            payloads (list): Their payloads, from get_bet_info_payload
+
+        Returns:
+            list: a dictionary that contain information about each bet, in the same order
+        """
+        decode_start = time.perf_counter()
+        records = qtry_utils.decode_bet_infos(payloads)
+        if not len(records):
+            return []
+
+        # Dates of all the bets as [YY, MM, DD, HH, MM, SS]
+        date_times = qtry_utils.unpack_dates(records['dateTimes']).tolist()
+        # Oracle providers are the non zero public keys
+        oracle_masks = records['oracleProviderId'].any(axis=2).tolist()
+
+        # Creators and oracle providers of all the bets are converted in one batch
+        public_keys = []
+        for record, oracle_mask in zip(records, oracle_masks):
+            public_keys.append(record['creator'].tobytes())
+            oracle_keys = record['oracleProviderId']
+            public_keys.extend(oracle_keys[i].tobytes() for i in range(self.maxNumberOfOracleProvides)
+                               if oracle_mask[i])
+        identities = iter(self.get_identities(public_keys))
+
+        n_options = records['nOption'].tolist()
+        bet_descs = records['betDesc']
+        option_descs = records['optionDesc']
+        oracle_fees = records['oracleFees'].tolist()
+        min_bet_amounts = records['minBetAmount'].tolist()
+        max_bet_slots = records['maxBetSlotPerOption'].tolist()
+        current_bet_states = records['currentBetState'].tolist()
+        won_options = records['betResultWonOption'].tolist()
+        op_ids = records['betResultOPId'].tolist()
+
+        bets_info = []
+        for index, betId in enumerate(betIds):
+            bet_info = {}
+            bet_info['bet_id'] = betId
+            # Strip the string terminator
+            bet_info['bet_desc'] = bet_descs[index].tobytes().decode('utf-8').strip('\x00')
+            bet_info['no_options'] = n_options[index]
+            bet_info['creator'] = next(identities)
+
+            # Bet fee
+            # TODO: Correct the naming in core
+            # https://github.com/qubic/core/blob/dkat-quottery-sc/src/contracts/Quottery.h#L524
+            bet_info['amount_per_bet_slot'] = min_bet_amounts[index]
+
+            # Get the options descriton. Each byte is a character and the terminators are dropped
+            bet_info['option_desc'] = [option_desc.tobytes().decode('latin-1').replace('\x00', '')
+                                       for option_desc in option_descs[index]]
+            bet_info['option_desc'] = [s for s in bet_info['option_desc'] if s]
+
+            bet_info['current_bet_state'] = current_bet_states[index][:bet_info['no_options']]
+            bet_info['max_slot_per_option'] = max_bet_slots[index]
+
+            for date_time, name in zip(date_times[index], ('open', 'close', 'end')):
+                bet_info[name + '_date'] = f"{date_time[0]:02}-{date_time[1]:02}-{date_time[2]:02}"
+                bet_info[name + '_time'] = f"{date_time[3]:02}:{date_time[4]:02}:{date_time[5]:02}"
+
+            # Oracle id and fee. Assume they are follow extract order
+            oracle_indexes = [i for i in range(self.maxNumberOfOracleProvides) if oracle_masks[index][i]]
+            bet_info['oracle_id'] = [next(identities) for _ in oracle_indexes]
+            bet_info['oracle_fee'] = [float(oracle_fees[index][i]) / 100 for i in oracle_indexes]
+            # Init the voting of Oracle as invalid
+            bet_info['oracle_vote'] = [-1] * len(oracle_indexes)
+            bet_info['no_ops'] = len(bet_info['oracle_id'])
+
+            # Get the result of the votes
+            for op_vote_option, op_vote_id in zip(won_options[index], op_ids[index]):
+                if op_vote_option >= 0 and op_vote_id >= 0:
+                    bet_info['oracle_vote'][op_vote_id] = op_vote_option
+
+            bets_info.append(bet_info)
+
+        self.record_decode(QTRY_GET_STRING[QTRY_GET_BET_INFO], time.perf_counter() - decode_start)
+        return bets_info
+
     def get_bet_info(self, betId):
         """Gets the information of a specific bet
 
@@ -176,107 +926,10 @@ class QuotteryRpcWrapper:
             sts (int): status of request. 0 is success, otherwise is failure
             dict: a dictionary that contain information about bet information. If failure, it is empty
         """
-        bet_info = {}
-
-        input_base64 = base64.b64encode(betId.to_bytes(4, byteorder='little', signed=False)).decode('ascii')
-        json_data = makeJsonData(QTRY_CONTRACT_INDEX, QTRY_GET_BET_INFO, 4, input_base64)
-        response_data = self.get_qtry_response(json_data)
-        sts = 0
-        if response_data == None :
-            sts = 1
-            self.logger.warning('WARNING] Failed to get info of bet ID %d', betId)
-            return (sts, bet_info)
-
-        data =  base64.b64decode(response_data['responseData'])
-        qt_output_result = qtry_utils.BetInfoOutput.from_buffer_copy(data)
-
-        bet_info['bet_id'] = betId
-        # Strip the string terminator
-        bet_info['bet_desc'] = bytes(
-            qt_output_result.betDesc).decode('utf-8').strip('\x00')
-        bet_info['no_options'] = qt_output_result.nOption
-
-        identity_buffer = ctypes.create_string_buffer(60)
-        self.quottery_cpp_func.getIdentityFromPublicKeyWrapper(
-            qt_output_result.creator, identity_buffer)
-        bet_info['creator'] = identity_buffer.value.decode('utf-8')
-
-        # Bet fee
-        # TODO: Correct the naming in core
-        # https://github.com/qubic/core/blob/dkat-quottery-sc/src/contracts/Quottery.h#L524
-        bet_info['amount_per_bet_slot'] = qt_output_result.minBetAmount
-
-        # Get the options descriton
-        bet_info['option_desc'] = [''.join(chr(
-            qt_output_result.optionDesc[i + j]).strip('\x00') for j in range(32)) for i in range(0, 256, 32)]
-        bet_info['option_desc'] = [s for s in bet_info['option_desc'] if s]
-
-        bet_info['current_bet_state'] = []
-        for i in range(0, bet_info['no_options']):
-            bet_info['current_bet_state'].append(qt_output_result.currentBetState[i])
-
-        bet_info['max_slot_per_option'] = qt_output_result.maxBetSlotPerOption
-
-        openDateTime = qtry_utils.unpack_date(qt_output_result.openDateTime)
-        bet_info['open_date'] = f"{openDateTime[0]:02}" + '-' + \
-            f"{openDateTime[1]:02}" + \
-            '-' + f"{openDateTime[2]:02}"
-        bet_info['open_time'] = f"{openDateTime[3]:02}" + ':' + \
-            f"{openDateTime[4]:02}" + \
-            ':' + f"{openDateTime[5]:02}"
-
-        closeDateTime = qtry_utils.unpack_date(qt_output_result.closeDateTime)
-        bet_info['close_date'] = f"{closeDateTime[0]:02}" + '-' + \
-            f"{closeDateTime[1]:02}" + \
-            '-' + f"{closeDateTime[2]:02}"
-        bet_info['close_time'] = f"{closeDateTime[3]:02}" + ':' + \
-            f"{closeDateTime[4]:02}" + \
-            ':' + f"{closeDateTime[5]:02}"
-
-        endDateTime = qtry_utils.unpack_date(qt_output_result.endDateTime)
-        bet_info['end_date'] = f"{endDateTime[0]:02}" + '-' + \
-            f"{endDateTime[1]:02}" + \
-            '-' + f"{endDateTime[2]:02}"
-        bet_info['end_time'] = f"{endDateTime[3]:02}" + ':' + \
-            f"{endDateTime[4]:02}" + \
-            ':' + f"{endDateTime[5]:02}"
-
-
-        # Oracle id and fee. Assume they are follow extract order
-        bet_info['oracle_id'] = []
-        bet_info['oracle_fee'] = []
-        bet_info['oracle_vote'] = []
-        for i in range(0, self.maxNumberOfOracleProvides):
-            # Pack the oracle ID
-            offset = 32 * i
-            oracle_id_public_key = ctypes.cast(ctypes.addressof(
-                qt_output_result.oracleProviderId) + offset, ctypes.POINTER(ctypes.c_uint8))
-            all_zeros = all(value == 0 for value in oracle_id_public_key[:32])
-            # Only add if public key is not fully zeros
-            if not all_zeros:
-                # Append the oracle ID
-                identity_buffer = ctypes.create_string_buffer(60)
-                self.quottery_cpp_func.getIdentityFromPublicKeyWrapper(
-                    oracle_id_public_key, identity_buffer)
-                bet_info['oracle_id'].append(identity_buffer.value.decode('utf-8'))
-
-                # Append the oracle ID
-                oracle_fee = ctypes.cast(ctypes.addressof(
-                    qt_output_result.oracleFees) + i * 4, ctypes.POINTER(ctypes.c_uint32))
-                bet_info['oracle_fee'].append(float(oracle_fee[0]) / 100)
-
-                # Init the voting of Oracle as invalid
-                bet_info['oracle_vote'].append(-1)
-        bet_info['no_ops'] = len(bet_info['oracle_id'])
-
-        # Get the result of the votes
-        for i in range(0, self.maxNumberOfOracleProvides):
-            op_vote_option = qt_output_result.betResultWonOption[i]
-            op_vote_id = qt_output_result.betResultOPId[i]
-            if op_vote_option >= 0 and op_vote_id >= 0:
-                bet_info['oracle_vote'][op_vote_id] = op_vote_option
-
-        return (0, bet_info)
+        sts, data = self.get_bet_info_payload(betId)
+        if sts:
+            return (sts, {})
+        return (0, self.decode_bet_infos([betId], [data])[0])
 
     def get_all_bets(self):
         """Gets the information of all bet that respond from node
@@ -321,29 +974,7 @@ class QuotteryRpcWrapper:
                 continue
 
             # Get the result bet and also set the current date
-            number_of_oracle_operators = bet_info['no_ops']
-            required_votes = number_of_oracle_operators * 2 /  3
-            op_voted_count = 0
-            dominated_votes = 0
-            vote_count = defaultdict(int)
-            op_vote_options = bet_info['oracle_vote']
-            for i in range(0, number_of_oracle_operators):
-                if op_vote_options[i] > -1:
-                    vote_count[op_vote_options[i]] += 1
-                    op_voted_count += 1
-            # Decide the win option
-            ## Find the key with the max value
-            if op_voted_count > 0:
-                key_with_max_votes = max(vote_count, key=vote_count.get)
-                dominated_votes = vote_count[key_with_max_votes]
-
-            ## Check the win condition. This check is replicating the decision in node
-            ## If the dominated votes are satisfied the win conditions (>= 2/3 total of OPs)
-            if dominated_votes >= required_votes:
-                bet_info['result'] = key_with_max_votes
-            else:
-                # The result is considered invalid
-                bet_info['result'] = -1
+            self.decide_bet_result(bet_info)
 
             # Append the active bets
             activeBets[bet_info['bet_id']] = bet_info
@@ -354,16 +985,78 @@ class QuotteryRpcWrapper:
         tick_number = 0
         if bet_info_count == bets_count:
             # Get current tick number
-            try:
-                response = requests.get(self.tickInfoUri)
-                response.raise_for_status()  # Raise an error for bad status codes
-                result = response.json()  # Parse the JSON response
-                tick_number = result['tickInfo']['tick']
-            except requests.exceptions.RequestException as e:
+            tick_sts, tick_info = self.get_tick_info()
+            if tick_sts:
                 self.logger.warning('Get current tick number failed!')
+            else:
+                tick_number = tick_info['tick']
 
         return (sts, activeBets, tick_number)
 
+    def decide_bet_result(self, bet_info):
+        """Decides the result of a bet from the votes of its oracle providers and stores it in bet_info['result']
+
+        Args:
+            bet_info (dict): The bet information returned by get_bet_info
+
+        Returns:
+            int: the won option, -1 if the votes have not decided a result yet
+        """
+        number_of_oracle_operators = bet_info['no_ops']
+        required_votes = number_of_oracle_operators * 2 /  3
+        op_voted_count = 0
+        dominated_votes = 0
+        vote_count = defaultdict(int)
+        op_vote_options = bet_info['oracle_vote']
+        for i in range(0, number_of_oracle_operators):
+            if op_vote_options[i] > -1:
+                vote_count[op_vote_options[i]] += 1
+                op_voted_count += 1
+        # Decide the win option
+        ## Find the key with the max value
+        if op_voted_count > 0:
+            key_with_max_votes = max(vote_count, key=vote_count.get)
+            dominated_votes = vote_count[key_with_max_votes]
+
+        ## Check the win condition. This check is replicating the decision in node
+        ## If the dominated votes are satisfied the win conditions (>= 2/3 total of OPs)
+        if dominated_votes >= required_votes:
+            bet_info['result'] = key_with_max_votes
+        else:
+            # The result is considered invalid
+            bet_info['result'] = -1
+
+        return bet_info['result']
+
+    def get_tick_info(self):
+        """Gets the current tick information of the endpoint. This is a cheap call, suitable for polling
+
+        Returns:
+            sts (int): status of request. 0 is success, otherwise is failure
+            dict: a dictionary that contain the tick, epoch and tick duration. If failure, it is empty
+        """
+        if self.transport == TRANSPORT_NATIVE:
+            return self.get_native_tick_info()
+
+        tick_info = {}
+        result = self.send_request('GET', TICK_INFO_PATH, TICK_INFO_STRING)
+        if result is None or 'tickInfo' not in result:
+            return (1, tick_info)
+
+        tick_info['tick'] = result['tickInfo'].get('tick', 0)
+        tick_info['epoch'] = result['tickInfo'].get('epoch', 0)
+        tick_info['duration'] = result['tickInfo'].get('duration', 0)
+        tick_info['initial_tick'] = result['tickInfo'].get('initialTick', 0)
+        return (0, tick_info)
+
+    def get_native_tick_info(self):
+        """Gets the current tick through the native transport. The node protocol call only gives the tick"""
+        tick_number = ctypes.c_uint32(0)
+        if self.call_native(TICK_INFO_STRING, ctypes.sizeof(tick_number),
+                            self.quottery_cpp_func.getTickNumberFromNode, ctypes.byref(tick_number)):
+            return (1, {})
+        return (0, {'tick': tick_number.value, 'epoch': 0, 'duration': 0, 'initial_tick': 0})
+
     def get_bet_option_detail(self, betID, betOption):
         """Gets the detail of a specific bet and bet option
 
@@ -376,42 +1069,57 @@ class QuotteryRpcWrapper:
             dict: a dictionary that contain user id and the number of slots of this bet option. If failure, it is empty
         """
 
+        if self.transport == TRANSPORT_NATIVE:
+            return self.get_native_bet_option_detail(betID, betOption)
+
         # Return users detail dictionary
         bet_option_detail = {}
 
         request_data = [betID, betOption]
         bytes_data = b''.join(value.to_bytes(4, byteorder='little', signed=False) for value in request_data)
-        input_base64 = base64.b64encode(bytes_data).decode('ascii')
-        json_data = makeJsonData(QTRY_CONTRACT_INDEX, QTRY_GET_BET_OPTION_DETAIL, 8, input_base64)
-        response_data = self.get_qtry_response(json_data)
+        data = self.query_contract(QTRY_GET_BET_OPTION_DETAIL, bytes_data)
         sts = 0
-        if response_data == None :
+        if data is None:
             sts = 1
             return (sts, bet_option_detail)
 
-        data =  base64.b64decode(response_data['responseData'])
-        all_zeros = all(value == 0 for value in data)
+        decode_start = time.perf_counter()
+        # Count the slots of each public key, then convert each distinct key once
+        public_keys, slot_counts = qtry_utils.count_public_keys(data)
         # The bet does not have any infomation yet
-        if all_zeros:
+        if not public_keys:
             sts = 1
             return (sts, bet_option_detail)
 
-        for i in range(0, len(data), 32):
-            pubkey = data[i:i + 32]
-            all_zeros = all(value == 0 for value in pubkey)
-            # Only compute id if public key is not fully zeros
-            if all_zeros:
-                continue
-
-            # Append the oracle ID
-            oracle_id_public_key = ctypes.cast(pubkey, ctypes.POINTER(ctypes.c_uint8))
-            identity_buffer = ctypes.create_string_buffer(60)
-            self.quottery_cpp_func.getIdentityFromPublicKeyWrapper(
-                oracle_id_public_key, identity_buffer)
-            user_id = identity_buffer.value.decode('utf-8')
-            if user_id in bet_option_detail:
-                bet_option_detail[user_id] += 1
-            else:
-                bet_option_detail[user_id] = 1
+        user_ids = self.get_identities(public_keys)
+        for user_id, slot_count in zip(user_ids, slot_counts):
+            bet_option_detail[user_id] = slot_count
 
+        self.record_decode(QTRY_GET_STRING[QTRY_GET_BET_OPTION_DETAIL], time.perf_counter() - decode_start)
         return (sts, bet_option_detail)
+
+    def get_native_bet_option_detail(self, betID, betOption):
+        """Gets the detail of a bet option through the native transport. The library already counts the slots
+        of each bettor, so only the distinct public keys are received. They are in the order of their first slot,
+        as with the HTTP transport, so the stored details do not depend on the transport
+        """
+        bet_option_detail = {}
+        number_of_users = ctypes.c_uint32(0)
+        output = qtry_utils.NativeBetOptionDetail()
+        sts = self.call_native(QTRY_GET_STRING[QTRY_GET_BET_OPTION_DETAIL], ctypes.sizeof(output),
+                               self.quottery_cpp_func.quotteryWrapperBetOptionDetail,
+                               betID, betOption, ctypes.byref(number_of_users), ctypes.byref(output))
+        # The bet does not have any infomation yet
+        if sts or not number_of_users.value:
+            return (1, bet_option_detail)
+
+        decode_start = time.perf_counter()
+        count = number_of_users.value
+        bettors = bytes(output.bettor)
+        public_keys = [bettors[PUBLIC_KEY_SIZE * i: PUBLIC_KEY_SIZE * (i + 1)] for i in range(count)]
+        user_ids = self.get_identities(public_keys)
+        for user_id, slot_count in zip(user_ids, output.bettorAmountOfSlots[:count]):
+            bet_option_detail[user_id] = slot_count
+
+        self.record_decode(QTRY_GET_STRING[QTRY_GET_BET_OPTION_DETAIL], time.perf_counter() - decode_start)
+        return (0, bet_option_detail)
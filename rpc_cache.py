@@ -0,0 +1,71 @@
+import sqlite3
+import struct
+
+
+def request_key(*values):
+    """ Request data of a contract function taking uint32 values, as sent to the node """
+    return struct.pack(f'<{len(values)}I', *values)
+
+
+def parse_request_key(request_data):
+    return struct.unpack(f'<{len(request_data) // 4}I', request_data)
+
+
+class RpcCache:
+    """
+    Node responses persisted between runs of the updater, keyed by (input type, request data).
+    Each entry keeps the tick and the time it was fetched at, and a change signal: a cheap value that changes
+    whenever the response does, like the slot count of an option for its detail.
+    """
+
+    def __init__(self, cache_file):
+        self.conn = sqlite3.connect(cache_file)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS rpc_payloads (
+                input_type INTEGER NOT NULL,
+                request_data BLOB NOT NULL,
+                bet_id INTEGER NOT NULL,
+                tick_number INTEGER NOT NULL,
+                fetch_time REAL NOT NULL,
+                signal INTEGER,
+                payload BLOB,
+                PRIMARY KEY (input_type, request_data)
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS rpc_payloads_bet_id ON rpc_payloads (bet_id)')
+        self.conn.commit()
+
+    def load(self, input_type, max_tick):
+        """
+        Get the cached responses of a contract function.
+
+        :param input_type: Input type of the function.
+        :param max_tick: Entries fetched after this tick are ignored.
+        :return: List of (request data, bet ID, tick number, fetch time, signal, payload).
+        """
+        return self.conn.execute('''
+            SELECT request_data, bet_id, tick_number, fetch_time, signal, payload FROM rpc_payloads
+            WHERE input_type = ? AND tick_number <= ?
+            ORDER BY bet_id''', (input_type, max_tick)).fetchall()
+
+    def update(self, entries, bet_ids):
+        """
+        Store new responses and forget the ones of the other bets, in a single transaction.
+
+        :param entries: List of (input type, request data, bet ID, tick number, fetch time, signal, payload).
+        :param bet_ids: IDs of the bets to keep.
+        """
+        bet_ids = set(bet_ids)
+        with self.conn:
+            self.conn.executemany('''
+                INSERT OR REPLACE INTO rpc_payloads (
+                    input_type, request_data, bet_id, tick_number, fetch_time, signal, payload)
+                VALUES (?, ?, ?, ?, ?, ?, ?)''', entries)
+            cached_bet_ids = [row[0] for row in self.conn.execute('SELECT DISTINCT bet_id FROM rpc_payloads')]
+            self.conn.executemany('DELETE FROM rpc_payloads WHERE bet_id = ?',
+                                  [(bet_id,) for bet_id in cached_bet_ids if bet_id not in bet_ids])
+
+    def close(self):
+        self.conn.close()
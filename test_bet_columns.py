@@ -0,0 +1,63 @@
+import json
+import unittest
+
+import bet_columns
+
+IDENTITIES = ['A' * 60, 'BCDEFGHIJKLMNOPQRSTUVWXYZ' * 2 + 'ABCDEFGHIJ', 'Z' * 60]
+
+
+def legacy_betting_odds(current_bet_state):
+    """ Betting odds as stored in the JSON texts of the version 2.x """
+    total_selections = sum(current_bet_state)
+    if total_selections == 0:
+        betting_odds = [1] * len(current_bet_state)
+    else:
+        betting_odds = [total_selections / selection if selection > 0 else total_selections
+                        for selection in current_bet_state]
+    return '[' + ','.join(f'"{e}"' for e in betting_odds) + ']'
+
+
+class TestBetColumns(unittest.TestCase):
+
+    def round_trip(self, current_bet_state, oracle_id, oracle_fee, oracle_vote):
+        columns = ('current_bet_state', 'oracle_id', 'oracle_fee', 'oracle_vote', 'current_num_selection',
+                   'betting_odds')
+        values = bet_columns.encode_bet_row_values(current_bet_state, oracle_id, oracle_fee, oracle_vote)
+        for value in values:
+            self.assertIsInstance(value, bytes)
+        bet = bet_columns.decode_bet(dict(zip(columns, values)))
+        self.assertEqual(bet, {
+            'current_bet_state': json.dumps(current_bet_state),
+            'oracle_id': json.dumps(oracle_id),
+            'oracle_fee': json.dumps(oracle_fee),
+            'oracle_vote': json.dumps(oracle_vote),
+            'current_num_selection': json.dumps(current_bet_state),
+            'betting_odds': legacy_betting_odds(current_bet_state),
+        })
+
+    def test_round_trip(self):
+        self.round_trip([7, 5, 5, 5], IDENTITIES[:2], [0.5, 0.5], [-1, -1])
+        self.round_trip([1, 2], IDENTITIES[:1], [1 / 3], [1])
+
+    def test_empty_arrays(self):
+        self.round_trip([], [], [], [])
+
+    def test_zero_selection_odds(self):
+        # Without any selection, every option has odds 1. An option without selection has the integer pool
+        self.round_trip([0, 0, 0], IDENTITIES[:1], [0.0], [0])
+        self.round_trip([4, 0, 2], IDENTITIES[:1], [0.25], [2])
+        self.assertEqual(bet_columns.betting_odds_text(bet_columns.pack_uint32s([4, 0, 2])), '["1.5","6","3.0"]')
+
+    def test_oracle_id_concatenation(self):
+        packed = bet_columns.pack_identities(IDENTITIES)
+        self.assertEqual(packed, ''.join(IDENTITIES).encode('ascii'))
+        self.assertEqual(json.loads(bet_columns.identities_text(packed)), IDENTITIES)
+
+    def test_text_columns_are_kept(self):
+        # Rows of a database not migrated yet are served as they are stored
+        bet = {'current_bet_state': '[1, 2]', 'betting_odds': '["3.0","1.5"]', 'oracle_id': '[]'}
+        self.assertEqual(bet_columns.decode_bet(dict(bet)), bet)
+
+
+if __name__ == '__main__':
+    unittest.main()
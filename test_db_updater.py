@@ -0,0 +1,541 @@
+import os
+import json
+import ctypes
+import time
+import sqlite3
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import app
+import db_updater
+import test_bet_columns
+import mock_rpc_node
+import notifications
+import quottery_rpc_wrapper
+
+# The updater decodes the node responses with the quottery_cpp library
+QUOTTERY_LIBS = os.getenv('QUOTTERY_LIBS', db_updater.QUOTTERY_LIBS)
+
+# Module state of the updater, restored after each test
+UPDATER_STATE = ('qt', 'db_conn', 'rpc_payload_cache', 'node_epoch', 'last_archive_time', 'last_backup_time',
+                 'artifacts_version', 'commit_publisher', 'memory_keeper', 'published_memory_database',
+                 'last_memory_snapshot_time')
+
+
+@unittest.skipUnless(os.path.isfile(QUOTTERY_LIBS), f"quottery_cpp library not found: {QUOTTERY_LIBS}")
+class UpdaterTestCase(unittest.TestCase):
+    """ Runs the updater against a mock node, on a database in a temporary directory """
+
+    number_of_bets = 6
+
+    def setUp(self):
+        self.saved_state = {name: value for name, value in vars(db_updater).items()
+                            if name.isupper() or name in UPDATER_STATE}
+        self.database_dir = tempfile.mkdtemp()
+        self.quottery = mock_rpc_node.SyntheticQuottery(numberOfBets=self.number_of_bets, numberOfOptions=3,
+                                                        numberOfBettors=4, ticksPerSecond=0)
+        self.node = mock_rpc_node.MockRpcNode(quottery=self.quottery).start()
+
+        db_updater.DATABASE_FILE = os.path.join(self.database_dir, 'database.db')
+        db_updater.NODE_IP = self.node.address
+        db_updater.QUOTTERY_LIBS = QUOTTERY_LIBS
+        db_updater.ARTIFACTS_DIR = ''
+        db_updater.updater_stop.clear()
+
+    def tearDown(self):
+        db_updater.updater_stop.set()
+        db_updater.close_db_connection()
+        if db_updater.rpc_payload_cache is not None:
+            db_updater.rpc_payload_cache.close()
+        with db_updater.memory_lock:
+            for generation_conn in db_updater.memory_generations:
+                generation_conn.close()
+            db_updater.memory_generations.clear()
+        if db_updater.memory_keeper is not None:
+            db_updater.memory_keeper.close()
+        for state in (db_updater.bet_schedule, db_updater.option_slot_states, db_updater.fetched_bet_payloads,
+                      db_updater.reconcile_pending):
+            state.clear()
+        vars(db_updater).update(self.saved_state)
+        self.node.stop()
+        shutil.rmtree(self.database_dir)
+
+    def start_updater(self, address=None, transport=quottery_rpc_wrapper.TRANSPORT_HTTP):
+        db_updater.qt = quottery_rpc_wrapper.QuotteryRpcWrapper(address or self.node.address, QUOTTERY_LIBS,
+                                                                'TEST_UPDATER', transport=transport)
+        db_updater.init_db()
+
+    def new_database(self, name):
+        """ Start over on a new database, as after a restart without cache """
+        db_updater.close_db_connection()
+        for state in (db_updater.bet_schedule, db_updater.option_slot_states, db_updater.fetched_bet_payloads,
+                      db_updater.reconcile_pending):
+            state.clear()
+        db_updater.DATABASE_FILE = os.path.join(self.database_dir, name)
+
+    def run_cycle(self, full_reconcile=True):
+        db_updater.get_tick_number_from_node()
+        db_updater.run_update_cycle(self.quottery.current_tick(), full_reconcile)
+
+    def query(self, sql, params=()):
+        return db_updater.get_db_connection().execute(sql, params).fetchall()
+
+
+def app_client(test_case, database_file):
+    """ Test client of the Flask app reading database_file, configured back after the test """
+    saved = {name: getattr(app, name) for name in ('DATABASE_FILE', 'ARTIFACTS_DIR', 'EMBEDDED_MODE',
+                                                   'commit_subscriber')}
+    test_case.addCleanup(vars(app).update, saved)
+    app.DATABASE_FILE = database_file
+    app.ARTIFACTS_DIR = ''
+    app.EMBEDDED_MODE = False
+    app.commit_subscriber = None
+    return app.app.test_client()
+
+
+class TestEmbeddedMode(UpdaterTestCase):
+
+    def test_cycle_committed_by_the_updater_thread(self):
+        subscriber = notifications.Subscriber(on_change=mock.Mock())
+        environment = {'DATABASE_PATH': self.database_dir, 'NODE_IP': self.node.address,
+                       'RPC_CACHE_FILE': os.path.join(self.database_dir, 'rpc_cache.db'),
+                       'MEMORY_SNAPSHOT_INTERVAL': '3600'}
+        db_updater.DATABASE_FILE = 'database.db'
+        with mock.patch.dict(os.environ, environment):
+            thread = db_updater.start_embedded([subscriber])
+
+        # The first notification is sent at start, the next ones by the committed cycles
+        for _ in range(100):
+            if subscriber.tick_number:
+                break
+            thread.join(0.1)
+        db_updater.updater_stop.set()
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(subscriber.tick_number, self.quottery.current_tick())
+
+        conn = db_updater.connect_published_memory_database()
+        try:
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM quottery_info').fetchone()[0], self.number_of_bets)
+        finally:
+            conn.close()
+        # The cache was saved by the thread of the loop
+        cache = db_updater.rpc_cache.RpcCache(environment['RPC_CACHE_FILE'])
+        try:
+            self.assertEqual(len(cache.load(quottery_rpc_wrapper.QTRY_GET_BET_INFO, subscriber.tick_number)),
+                             self.number_of_bets)
+        finally:
+            cache.close()
+        self.assertEqual(db_updater.snapshot_memory_database(force=True), db_updater.DATABASE_FILE)
+
+
+class TestPipeline(UpdaterTestCase):
+
+    number_of_bets = 20
+
+    def run_cycles(self, pipeline_fetchers):
+        """ Two cycles on a new database, the second one after a bettor joined. Returns the written rows """
+        self.new_database(f'pipeline_{pipeline_fetchers}.db')
+        db_updater.PIPELINE_FETCHERS = pipeline_fetchers
+        self.start_updater()
+        self.run_cycle()
+        bettors = self.quottery.bets[2]['bettors'][1]
+        bettors.append(bettors[0])
+        try:
+            self.run_cycle()
+        finally:
+            bettors.pop()
+        return (self.query('SELECT * FROM quottery_info ORDER BY bet_id'),
+                self.query('SELECT * FROM bet_options_detail ORDER BY bet_id, option_id'))
+
+    def test_pipelined_rows_are_the_sequential_ones(self):
+        # Small batches and chunks, so the rows are written and read back in several of them
+        db_updater.PIPELINE_BATCH_SIZE = 4
+        db_updater.OPTION_QUERY_CHUNK = 3
+        bet_rows, option_rows = self.run_cycles(0)
+        self.assertEqual(len(bet_rows), self.number_of_bets)
+        self.assertEqual(len(option_rows), self.number_of_bets * 3)
+        self.assertEqual(self.run_cycles(3), (bet_rows, option_rows))
+
+    def test_transaction_begins_with_the_first_batch(self):
+        self.start_updater()
+        writer = db_updater.CycleWriter(db_updater.get_db_connection())
+        # Nothing fetched yet: the database is not locked
+        other_conn = sqlite3.connect(db_updater.DATABASE_FILE, timeout=0)
+        try:
+            other_conn.execute('BEGIN IMMEDIATE')
+            other_conn.rollback()
+            writer.write_options([(1, 0, '[]')])
+            with self.assertRaises(sqlite3.OperationalError):
+                other_conn.execute('BEGIN IMMEDIATE')
+        finally:
+            writer.abort()
+            other_conn.close()
+
+
+class TestRpcCache(UpdaterTestCase):
+
+    def setUp(self):
+        super().setUp()
+        db_updater.PIPELINE_FETCHERS = 0
+        self.cache_file = os.path.join(self.database_dir, 'rpc_cache.db')
+        self.start_updater()
+        db_updater.rpc_payload_cache = db_updater.rpc_cache.RpcCache(self.cache_file)
+
+    def restart(self, database_file=None):
+        """ Forget the state of the updater and load it back from the cache """
+        db_updater.close_db_connection()
+        db_updater.rpc_payload_cache.close()
+        for state in (db_updater.bet_schedule, db_updater.option_slot_states, db_updater.fetched_bet_payloads,
+                      db_updater.reconcile_pending):
+            state.clear()
+        if database_file:
+            shutil.copy(database_file, db_updater.DATABASE_FILE)
+        db_updater.rpc_payload_cache = db_updater.rpc_cache.RpcCache(self.cache_file)
+        return db_updater.load_rpc_cache()
+
+    def test_incomplete_cycle_is_resumed(self):
+        self.run_cycle()
+        committed_tick = self.query('SELECT tick_number FROM tick_info')[0][0]
+        slot_count = db_updater.bet_schedule[1]['bet_info']['current_bet_state'][0]
+        # Bettors join, then the cycle only refreshes the first bets before running out of budget
+        self.quottery.bets[1]['bettors'][0].append(self.quottery.users[0])
+        self.quottery.initialTick += 10
+        self.quottery.advance()
+        db_updater.CYCLE_RPC_BUDGET = 4
+        self.run_cycle(full_reconcile=False)
+        self.assertEqual(self.query('SELECT tick_number FROM tick_info'), [(committed_tick,)])
+
+        self.assertTrue(self.restart())
+        self.assertEqual(sorted(db_updater.bet_schedule), list(range(1, self.number_of_bets + 1)))
+        # The bet refreshed by the incomplete cycle resumes from its last payload
+        self.assertGreater(len(self.quottery.bets[1]['bettors'][0]), slot_count)
+        self.assertEqual(db_updater.bet_schedule[1]['bet_info']['current_bet_state'][0],
+                         len(self.quottery.bets[1]['bettors'][0]))
+        self.assertEqual(len(db_updater.option_slot_states), self.number_of_bets * 3)
+
+    def test_restored_database_ignores_newer_entries(self):
+        self.run_cycle()
+        backup_file = os.path.join(self.database_dir, 'backup.db')
+        db_updater.get_db_connection().execute('VACUUM INTO ?', (backup_file,))
+        self.quottery.initialTick += 10
+        self.run_cycle()
+
+        self.assertFalse(self.restart(backup_file))
+        self.assertEqual(db_updater.bet_schedule, {})
+        self.assertEqual(db_updater.option_slot_states, {})
+
+
+@unittest.skipUnless(os.path.isfile(QUOTTERY_LIBS) and
+                     hasattr(ctypes.CDLL(QUOTTERY_LIBS), 'quotteryWrapperBetOptionDetail'),
+                     "quottery_cpp library without the native transport")
+class TestTransports(UpdaterTestCase):
+
+    def test_same_rows_with_both_transports(self):
+        tcp_node = mock_rpc_node.MockTcpNode(quottery=self.quottery).start()
+        self.addCleanup(tcp_node.stop)
+        rows = {}
+        for transport, address in ((quottery_rpc_wrapper.TRANSPORT_HTTP, self.node.address),
+                                   (quottery_rpc_wrapper.TRANSPORT_NATIVE, tcp_node.address)):
+            self.new_database(f'{transport}.db')
+            self.start_updater(address, transport)
+            self.run_cycle()
+            rows[transport] = self.query('SELECT * FROM bet_options_detail ORDER BY bet_id, option_id')
+
+        # The bettors are in the order of their first slot, whatever the transport
+        self.assertEqual(rows[quottery_rpc_wrapper.TRANSPORT_NATIVE], rows[quottery_rpc_wrapper.TRANSPORT_HTTP])
+        bettors = [list(json.loads(user_slots)) for _, _, user_slots in rows[quottery_rpc_wrapper.TRANSPORT_HTTP]]
+        self.assertTrue(any(user_ids != sorted(user_ids) for user_ids in bettors))
+
+
+class TestOptionReconcile(UpdaterTestCase):
+
+    def test_reconcile_carries_over_the_cycles(self):
+        db_updater.PIPELINE_FETCHERS = 0
+        self.start_updater()
+        self.run_cycle()
+        option_rows = self.query('SELECT * FROM bet_options_detail ORDER BY bet_id, option_id')
+        # The details drifted without any change of the slot counts
+        conn = db_updater.get_db_connection()
+        conn.execute("UPDATE bet_options_detail SET user_slots = '[]'")
+        conn.commit()
+
+        # No bet is due for a refresh: the reconcile schedules them, within a budget of a few options per cycle
+        db_updater.RECENT_ACTIVITY_WINDOW = -1
+        db_updater.DORMANT_REFRESH_INTERVAL = 3600
+        db_updater.CYCLE_RPC_BUDGET = 12
+        self.run_cycle()
+        self.assertTrue(db_updater.reconcile_pending)
+        for _ in range(20):
+            if not db_updater.reconcile_pending:
+                break
+            self.run_cycle(full_reconcile=False)
+        self.assertEqual(db_updater.reconcile_pending, set())
+        self.assertEqual(self.query('SELECT * FROM bet_options_detail ORDER BY bet_id, option_id'), option_rows)
+
+        # Nothing is refetched once reconciled
+        changes = self.query('SELECT COUNT(*) FROM bet_changes')
+        self.run_cycle(full_reconcile=False)
+        self.assertEqual(self.query('SELECT COUNT(*) FROM bet_changes'), changes)
+
+
+class TestEpochShards(UpdaterTestCase):
+
+    def setUp(self):
+        super().setUp()
+        db_updater.SHARD_DIR = 'shards'
+        db_updater.ARCHIVE_GRACE_PERIOD = -1e12
+        self.start_updater()
+        self.run_cycle()
+
+    def archive(self, bet_ids):
+        """ Settle bets on node, then archive them """
+        conn = db_updater.get_db_connection()
+        conn.executemany('UPDATE quottery_info SET status = 0 WHERE bet_id = ?', [(bet_id,) for bet_id in bet_ids])
+        conn.commit()
+        for bet_id in bet_ids:
+            del self.quottery.bets[bet_id]
+        self.assertEqual(db_updater.archive_settled_bets(conn, list(self.quottery.bets)), len(bet_ids))
+
+    def enter_epoch(self, epoch, initial_tick):
+        self.quottery.epoch = epoch
+        self.quottery.initialTick = self.quottery.lastTick = initial_tick
+        # No archival stage in the cycle
+        db_updater.last_archive_time = time.monotonic()
+        self.run_cycle()
+
+    def bet_ids(self, client, params):
+        response = client.get(f'/get_all_bets?include_archived=1&page_size=1000&{params}')
+        self.assertEqual(response.status_code, 200)
+        return [bet['bet_id'] for bet in response.get_json()['bet_list']]
+
+    def test_seal_and_route(self):
+        self.assertEqual(self.query('SELECT epoch, initial_tick FROM tick_info'), [(130, 15000000)])
+        self.archive([1, 2])
+        # Archived before the ticks were recorded, as the bets migrated from the version 3.0
+        conn = db_updater.get_db_connection()
+        conn.execute('DELETE FROM archive_ticks WHERE bet_id = 1')
+        conn.commit()
+        self.enter_epoch(131, 15100000)
+
+        self.assertEqual(self.query('SELECT * FROM epoch_shards'),
+                         [(130, 0, 15099999, os.path.join('shards', 'epoch_130.db'), 2)])
+        self.assertEqual(self.query('SELECT epoch, initial_tick FROM tick_info'), [(131, 15100000)])
+        for table in ('quottery_info_archive', 'bet_options_detail_archive', 'archive_ticks'):
+            self.assertEqual(self.query(f'SELECT COUNT(*) FROM {table}'), [(0,)])
+        shard_file = os.path.join(self.database_dir, 'shards', 'epoch_130.db')
+        shard_stat = os.stat(shard_file)
+
+        self.archive([3])
+        self.enter_epoch(132, 15200000)
+        self.assertEqual(self.query('SELECT epoch, first_tick, last_tick, bet_count FROM epoch_shards'),
+                         [(130, 0, 15099999, 2), (131, 15100000, 15199999, 1)])
+        # A registered shard is never written again
+        self.assertEqual(os.stat(shard_file).st_mtime_ns, shard_stat.st_mtime_ns)
+        self.archive([4])
+
+        client = app_client(self, db_updater.DATABASE_FILE)
+        self.assertEqual(self.bet_ids(client, ''), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(self.bet_ids(client, 'epoch=130'), [1, 2, 5, 6])
+        self.assertEqual(self.bet_ids(client, 'epoch=132'), [4, 5, 6])
+        self.assertEqual(self.bet_ids(client, 'from_tick=15100000&to_tick=15150000'), [3, 5, 6])
+        # The range of the first shard covers the bets archived before the ticks were recorded
+        self.assertEqual(self.bet_ids(client, 'to_tick=100'), [1, 2, 5, 6])
+        self.assertEqual(client.get('/get_all_bets?include_archived=1&epoch=last').status_code, 400)
+
+        options = client.get('/get_bet_options_detail?include_archived=1&page_size=1000&epoch=131').get_json()
+        self.assertEqual(sorted({option['bet_id'] for option in options['bet_options_detail']['bet_list']}), [3, 5, 6])
+        creator = client.get(f"/get_bets_by_creator/{self.query('SELECT creator FROM quottery_info').pop()[0]}")
+        self.assertEqual(creator.status_code, 200)
+
+    def test_epoch_without_archived_bets(self):
+        self.enter_epoch(131, 15100000)
+        self.assertEqual(self.query('SELECT epoch, initial_tick FROM tick_info'), [(131, 15100000)])
+        self.assertEqual(self.query('SELECT * FROM epoch_shards'), [])
+        self.assertFalse(os.path.exists(os.path.join(self.database_dir, 'shards', 'epoch_130.db')))
+
+
+def legacy_bet_row(bet_id, current_bet_state, oracle_id, oracle_fee, oracle_vote, result=-1, end_date='68-12-31'):
+    """ quottery_info row as written by the version 2.x, with the arrays as JSON texts """
+    return (bet_id, len(current_bet_state), test_bet_columns.IDENTITIES[bet_id % 2], f"Bet {bet_id}",
+            json.dumps([f"Option {option_id}" for option_id in range(len(current_bet_state))]),
+            json.dumps(current_bet_state), 1024, 10000.0, '24-01-01', end_date, end_date, '00:00:00', '12:00:00',
+            '18:00:00', result, len(oracle_id), json.dumps(oracle_id), json.dumps(oracle_fee), json.dumps(oracle_vote),
+            0 if result >= 0 else 1, json.dumps(current_bet_state),
+            str(db_updater.compute_current_total_qus(current_bet_state, 10000.0)),
+            test_bet_columns.legacy_betting_odds(current_bet_state))
+
+
+class TestSchemaMigration(unittest.TestCase):
+
+    def setUp(self):
+        self.saved_database_file = db_updater.DATABASE_FILE
+        self.database_dir = tempfile.mkdtemp()
+        db_updater.DATABASE_FILE = os.path.join(self.database_dir, 'database.db')
+
+    def tearDown(self):
+        db_updater.DATABASE_FILE = self.saved_database_file
+        shutil.rmtree(self.database_dir)
+
+    def make_legacy_database(self):
+        """ Database of the version 2.4. The declared column types do not matter: they do not convert BLOBs """
+        db_updater.init_db()
+        conn = sqlite3.connect(db_updater.DATABASE_FILE)
+        conn.execute("UPDATE version SET version_info = '2.4'")
+        conn.execute('DROP TABLE epoch_shards')
+        conn.execute('DROP TABLE archive_ticks')
+        identities = test_bet_columns.IDENTITIES
+        hot_rows = [
+            legacy_bet_row(1, [7, 5, 5, 5], identities[:2], [0.5, 0.5], [-1, -1]),
+            legacy_bet_row(2, [0, 0, 0], identities[:1], [1 / 3], [0]),
+            legacy_bet_row(3, [4, 0, 2], identities, [0.25, 0.5, 0.75], [2, -1, 0], result=0, end_date='24-01-02'),
+        ]
+        archived_rows = [
+            legacy_bet_row(4, [], [], [], [], result=1, end_date='24-01-02'),
+            legacy_bet_row(5, [1, 2], identities[1:2], [0.1], [1], result=1, end_date='24-01-02'),
+        ]
+        placeholders = ', '.join('?' * len(hot_rows[0]))
+        conn.executemany(f'INSERT INTO quottery_info VALUES ({placeholders})', hot_rows)
+        conn.executemany(f'INSERT INTO quottery_info_archive VALUES ({placeholders})', archived_rows)
+        conn.executemany('INSERT INTO bet_options_detail VALUES (?, ?, ?)',
+                         [(1, 0, json.dumps([identities[0]])), (3, 1, '[]')])
+        conn.execute("INSERT INTO node_basic_info (ip, port, num_issued_bet) VALUES ('http://node', 0, 5)")
+        conn.commit()
+        conn.close()
+
+    def test_failed_vacuum_is_retried(self):
+        db_updater.init_db()
+        # Migrated to 2.2, but the full vacuum did not complete
+        conn = sqlite3.connect(db_updater.DATABASE_FILE, isolation_level=None)
+        conn.execute('PRAGMA auto_vacuum = NONE')
+        conn.execute('VACUUM')
+        self.assertEqual(conn.execute('PRAGMA auto_vacuum').fetchone(), (0,))
+        conn.close()
+
+        db_updater.init_db()
+        conn = sqlite3.connect(db_updater.DATABASE_FILE)
+        self.assertEqual(conn.execute('PRAGMA auto_vacuum').fetchone(), (2,))
+        conn.close()
+
+    def test_api_bodies_are_unchanged(self):
+        self.make_legacy_database()
+        client = app_client(self, db_updater.DATABASE_FILE)
+        urls = ['/get_all_bets', '/get_active_bets', '/get_locked_bets', '/get_inactive_bets',
+                '/get_all_bets?include_archived=1', '/get_inactive_bets?include_archived=1',
+                '/get_bet_options_detail?include_archived=1',
+                f"/get_bets_by_creator/{test_bet_columns.IDENTITIES[1]}?include_archived=1"]
+        before = {url: client.get(url).data for url in urls}
+
+        db_updater.update_db()
+
+        conn = sqlite3.connect(db_updater.DATABASE_FILE)
+        self.assertEqual(conn.execute('SELECT version_info FROM version').fetchone()[0], db_updater.DB_VERSION)
+        self.assertEqual({row[0] for row in conn.execute(
+            'SELECT typeof(current_bet_state) FROM quottery_info UNION SELECT typeof(betting_odds) '
+            'FROM quottery_info_archive')}, {'blob'})
+        conn.close()
+        for url in urls:
+            self.assertEqual(client.get(url).data, before[url], url)
+
+
+def bet_info(bet_id, current_bet_state, result=-1, oracle_vote=(-1,)):
+    """ Bet as decoded from node """
+    return {'bet_id': bet_id, 'no_options': len(current_bet_state), 'creator': test_bet_columns.IDENTITIES[0],
+            'bet_desc': f"Bet {bet_id}", 'option_desc': [f"Option {option_id}" for option_id in range(2)],
+            'current_bet_state': list(current_bet_state), 'max_slot_per_option': 1024, 'amount_per_bet_slot': 10000,
+            'open_date': '24-01-01', 'close_date': '68-12-31', 'end_date': '68-12-31', 'open_time': '00:00:00',
+            'close_time': '12:00:00', 'end_time': '18:00:00', 'result': result, 'no_ops': 1,
+            'oracle_id': test_bet_columns.IDENTITIES[1:2], 'oracle_fee': [0.5], 'oracle_vote': list(oracle_vote)}
+
+
+class TestChangeLog(unittest.TestCase):
+
+    def setUp(self):
+        self.saved_state = {name: getattr(db_updater, name) for name in ('DATABASE_FILE', 'CHANGE_LOG_KEEP')}
+        self.database_dir = tempfile.mkdtemp()
+        db_updater.DATABASE_FILE = os.path.join(self.database_dir, 'database.db')
+        db_updater.init_db()
+        self.conn = sqlite3.connect(db_updater.DATABASE_FILE)
+
+        identities = test_bet_columns.IDENTITIES
+        self.write_cycle(100, [bet_info(1, [1, 2]), bet_info(2, [0, 0])],
+                         [(1, 0, json.dumps(identities[:1])), (1, 1, '[]')], [1, 2])
+        # Bet 2 and the option (1, 1) did not change
+        self.write_cycle(110, [bet_info(1, [2, 2]), bet_info(2, [0, 0])],
+                         [(1, 0, json.dumps(identities[:2])), (1, 1, '[]')], [1, 2])
+        # The oracle voted on bet 1, and bet 2 left the active bets without being fetched again
+        self.write_cycle(120, [bet_info(1, [2, 2], oracle_vote=[0])], [], [1])
+        self.write_cycle(130, [bet_info(1, [3, 2], oracle_vote=[0])], [], [1])
+
+    def tearDown(self):
+        self.conn.close()
+        vars(db_updater).update(self.saved_state)
+        shutil.rmtree(self.database_dir)
+
+    def write_cycle(self, tick_number, bets_info, option_rows, active_bet_ids):
+        bet_rows = [db_updater.make_quottery_info_row(bet) for bet in bets_info]
+        db_updater.write_cycle_to_database(self.conn, tick_number, {}, bet_rows, option_rows, active_bet_ids)
+
+    def logged_changes(self):
+        return self.conn.execute('SELECT seq, tick_number, bet_id, option_id, change_type FROM bet_changes').fetchall()
+
+    def test_only_changed_rows_are_logged(self):
+        self.assertEqual(self.logged_changes(), [
+            (1, 100, 1, None, db_updater.CHANGE_NEW_BET),
+            (2, 100, 2, None, db_updater.CHANGE_NEW_BET),
+            (3, 100, 1, 0, db_updater.CHANGE_OPTION_BETTORS),
+            (4, 100, 1, 1, db_updater.CHANGE_OPTION_BETTORS),
+            (5, 110, 1, None, db_updater.CHANGE_BET_STATE),
+            (6, 110, 1, 0, db_updater.CHANGE_OPTION_BETTORS),
+            (7, 120, 1, None, db_updater.CHANGE_ORACLE_VOTE),
+            (8, 120, 2, None, db_updater.CHANGE_STATUS),
+            (9, 130, 1, None, db_updater.CHANGE_BET_STATE),
+        ])
+        payloads = [json.loads(row[0]) for row in self.conn.execute('SELECT payload FROM bet_changes ORDER BY seq')]
+        # The payloads hold the columns as served by the API
+        self.assertEqual(payloads[0]['current_bet_state'], '[1, 2]')
+        self.assertEqual(payloads[4], {'current_bet_state': '[2, 2]', 'betting_odds': '["2.0","2.0"]',
+                                       'current_total_qus': 40000.0})
+        self.assertEqual(payloads[6], {'oracle_vote': '[0]'})
+        self.assertEqual(payloads[7], {'status': 0, 'result': -1})
+
+    def test_compaction(self):
+        # The 5 last entries are kept, even if superseded
+        db_updater.CHANGE_LOG_KEEP = 5
+        self.assertEqual(db_updater.compact_change_log(self.conn), 1)
+        self.assertEqual([row[0] for row in self.logged_changes()], [1, 2, 4, 5, 6, 7, 8, 9])
+        # The new bets are never removed, and the last entry of each kind stays
+        db_updater.CHANGE_LOG_KEEP = 0
+        self.assertEqual(db_updater.compact_change_log(self.conn), 1)
+        self.assertEqual([row[0] for row in self.logged_changes()], [1, 2, 4, 6, 7, 8, 9])
+
+    def test_changes_paging(self):
+        client = app_client(self, db_updater.DATABASE_FILE)
+
+        def get_changes(params):
+            response = client.get(f'/changes?{params}')
+            self.assertEqual(response.status_code, 200)
+            body = response.get_json()
+            return [change['seq'] for change in body['changes']], body['last_sequence'], body['has_more']
+
+        self.assertEqual(get_changes('limit=4'), ([1, 2, 3, 4], 4, True))
+        self.assertEqual(get_changes('since=4&limit=4'), ([5, 6, 7, 8], 8, True))
+        self.assertEqual(get_changes('since=8&limit=4'), ([9], 9, False))
+        self.assertEqual(get_changes('since=9'), ([], 9, False))
+        self.assertEqual(get_changes('since_tick=110'), ([7, 8, 9], 9, False))
+        self.assertEqual(get_changes('since=7&since_tick=100&limit=1'), ([8], 8, True))
+
+        body = client.get('/changes?limit=1').get_json()
+        self.assertEqual(body['latest_sequence'], 9)
+        self.assertEqual(body['changes'][0], {'seq': 1, 'tick_number': 100, 'bet_id': 1, 'option_id': None,
+                                              'change_type': db_updater.CHANGE_NEW_BET,
+                                              'payload': body['changes'][0]['payload']})
+        self.assertEqual(body['changes'][0]['payload']['bet_desc'], 'Bet 1')
+        for params in ('limit=0', 'since=last', 'since_tick=1.5'):
+            self.assertEqual(client.get(f'/changes?{params}').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import os
+import base64
+import ctypes
+import socket
+import tempfile
+import unittest
+
+import requests
+
+import qtry_utils
+import mock_rpc_node
+import quottery_rpc_wrapper
+
+
+def query(node, inputType, requestData=b''):
+    json_data = quottery_rpc_wrapper.makeJsonData(quottery_rpc_wrapper.QTRY_CONTRACT_INDEX, inputType,
+                                                  len(requestData), base64.b64encode(requestData).decode('ascii'))
+    response = requests.post(node.address + quottery_rpc_wrapper.API_PATH, json=json_data)
+    response.raise_for_status()
+    return base64.b64decode(response.json()['responseData'])
+
+
+class TestMockRpcNode(unittest.TestCase):
+
+    def setUp(self):
+        quottery = mock_rpc_node.SyntheticQuottery(numberOfBets=3, numberOfOptions=2, numberOfBettors=5,
+                                                   ticksPerSecond=0)
+        self.node = mock_rpc_node.MockRpcNode(quottery=quottery).start()
+
+    def tearDown(self):
+        self.node.stop()
+
+    def test_get_active_bets(self):
+        data = query(self.node, quottery_rpc_wrapper.QTRY_GET_ACTIVE_BET)
+        self.assertEqual(int.from_bytes(data[:4], byteorder='little'), 3)
+        self.assertEqual([int.from_bytes(data[4 * i: 4 * i + 4], byteorder='little') for i in range(1, 4)],
+                         [1, 2, 3])
+
+    def test_get_bet_info(self):
+        data = query(self.node, quottery_rpc_wrapper.QTRY_GET_BET_INFO, (2).to_bytes(4, byteorder='little'))
+        bet_info = qtry_utils.BetInfoOutput.from_buffer_copy(data)
+        self.assertEqual(bet_info.betId, 2)
+        self.assertEqual(bet_info.nOption, 2)
+        self.assertEqual(list(bet_info.currentBetState)[:2], [5, 5])
+        self.assertEqual(qtry_utils.unpack_date(bet_info.closeDateTime)[1:3],
+                         [self.node.quottery.bets[2]['close_datetime'].month,
+                          self.node.quottery.bets[2]['close_datetime'].day])
+
+    def test_get_bet_option_detail(self):
+        request_data = (1).to_bytes(4, byteorder='little') + (1).to_bytes(4, byteorder='little')
+        data = query(self.node, quottery_rpc_wrapper.QTRY_GET_BET_OPTION_DETAIL, request_data)
+        self.assertEqual(len(data), 32 * 1024)
+        self.assertEqual(data[:32 * 5], b''.join(self.node.quottery.bets[1]['bettors'][1]))
+        self.assertEqual(data[32 * 5:], bytes(32 * (1024 - 5)))
+
+    def test_get_bet_by_creator(self):
+        creator = self.node.quottery.bets[2]['creator']
+        data = query(self.node, quottery_rpc_wrapper.QTRY_GET_BET_BY_CREATOR, creator)
+        bet_ids = [bet_id for bet_id, bet in self.node.quottery.bets.items() if bet['creator'] == creator]
+        self.assertEqual(int.from_bytes(data[:4], byteorder='little'), len(bet_ids))
+        self.assertEqual([int.from_bytes(data[4 * i: 4 * i + 4], byteorder='little')
+                          for i in range(1, len(bet_ids) + 1)], sorted(bet_ids))
+
+    def test_tick_info(self):
+        response = requests.get(self.node.address + quottery_rpc_wrapper.TICK_INFO_PATH)
+        self.assertEqual(response.json()['tickInfo']['tick'], self.node.quottery.initialTick)
+        self.assertEqual(self.node.get_stats()['requests'], {quottery_rpc_wrapper.TICK_INFO_STRING: 1})
+
+    def test_simulated_errors(self):
+        self.node.errorRate = 1.0
+        response = requests.get(self.node.address + quottery_rpc_wrapper.TICK_INFO_PATH)
+        self.assertEqual(response.status_code, 500)
+
+    def test_record_and_replay(self):
+        with tempfile.TemporaryDirectory() as capture_dir:
+            capture_file = os.path.join(capture_dir, 'captures.jsonl')
+            recorder = mock_rpc_node.MockRpcNode(captureFile=capture_file, upstream=self.node.address).start()
+            try:
+                recorded = query(recorder, quottery_rpc_wrapper.QTRY_GET_BET_INFO, (3).to_bytes(4, byteorder='little'))
+            finally:
+                recorder.stop()
+
+            player = mock_rpc_node.MockRpcNode(captureFile=capture_file).start()
+            try:
+                replayed = query(player, quottery_rpc_wrapper.QTRY_GET_BET_INFO, (3).to_bytes(4, byteorder='little'))
+                missing = requests.get(player.address + quottery_rpc_wrapper.TICK_INFO_PATH)
+            finally:
+                player.stop()
+
+        self.assertEqual(recorded, replayed)
+        self.assertEqual(missing.status_code, 404)
+
+
+class TestMockTcpNode(unittest.TestCase):
+
+    def setUp(self):
+        quottery = mock_rpc_node.SyntheticQuottery(numberOfBets=3, numberOfOptions=2, numberOfBettors=5,
+                                                   ticksPerSecond=0)
+        self.node = mock_rpc_node.MockTcpNode(quottery=quottery).start()
+        host, port = self.node.address.split(':')
+        self.connection = socket.create_connection((host, int(port)))
+        self.stream = self.connection.makefile('rb')
+
+    def tearDown(self):
+        self.stream.close()
+        self.connection.close()
+        self.node.stop()
+
+    def exchange(self, messageType, payload=b''):
+        size = mock_rpc_node.HEADER_SIZE + len(payload)
+        self.connection.sendall(size.to_bytes(3, byteorder='little') + bytes([messageType]) + bytes(4) + payload)
+        header = self.stream.read(mock_rpc_node.HEADER_SIZE)
+        return header[3], self.stream.read(int.from_bytes(header[:3], byteorder='little') - len(header))
+
+    def query(self, inputType, requestData=b''):
+        payload = quottery_rpc_wrapper.QTRY_CONTRACT_INDEX.to_bytes(4, byteorder='little') + \
+            inputType.to_bytes(2, byteorder='little') + len(requestData).to_bytes(2, byteorder='little') + requestData
+        return self.exchange(mock_rpc_node.REQUEST_CONTRACT_FUNCTION, payload)
+
+    def test_persistent_connection(self):
+        message_type, data = self.query(quottery_rpc_wrapper.QTRY_GET_ACTIVE_BET)
+        self.assertEqual(message_type, mock_rpc_node.RESPOND_CONTRACT_FUNCTION)
+        self.assertEqual(int.from_bytes(data[:4], byteorder='little'), 3)
+
+        message_type, data = self.query(quottery_rpc_wrapper.QTRY_GET_BET_INFO, (2).to_bytes(4, byteorder='little'))
+        self.assertEqual(qtry_utils.BetInfoOutput.from_buffer_copy(data).betId, 2)
+
+        message_type, data = self.exchange(mock_rpc_node.REQUEST_CURRENT_TICK_INFO)
+        self.assertEqual(message_type, mock_rpc_node.RESPOND_CURRENT_TICK_INFO)
+        self.assertEqual(int.from_bytes(data[4:8], byteorder='little'), self.node.quottery.initialTick)
+
+        stats = self.node.get_stats()
+        self.assertEqual(stats['connections'], 1)
+        self.assertEqual(sum(stats['requests'].values()), 3)
+
+    def test_native_bet_info_payload(self):
+        _, data = self.query(quottery_rpc_wrapper.QTRY_GET_BET_INFO, (1).to_bytes(4, byteorder='little'))
+        bet_info = qtry_utils.BetInfoOutput.from_buffer_copy(data)
+        native = qtry_utils.NativeBetInfoOutput()
+        ctypes.memmove(ctypes.addressof(native), data, qtry_utils.BetInfoOutput.openDateTime.offset)
+        for name in ('openDateTime', 'closeDateTime', 'endDateTime'):
+            getattr(native, name)[:] = qtry_utils.unpack_date(getattr(bet_info, name))
+        for name in ('minBetAmount', 'maxBetSlotPerOption'):
+            setattr(native, name, getattr(bet_info, name))
+        for name in ('currentBetState', 'betResultWonOption', 'betResultOPId'):
+            getattr(native, name)[:] = getattr(bet_info, name)[:]
+        self.assertEqual(qtry_utils.native_bet_info_payload(native), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
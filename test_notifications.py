@@ -0,0 +1,93 @@
+import os
+import time
+import shutil
+import socket
+import tempfile
+import unittest
+from unittest import mock
+
+import app
+import notifications
+
+
+class TestNotifications(unittest.TestCase):
+
+    def setUp(self):
+        self.database_dir = tempfile.mkdtemp()
+        self.database_file = os.path.join(self.database_dir, 'database.db')
+        self.notify_dir = os.path.join(self.database_dir, 'notify')
+
+    def tearDown(self):
+        shutil.rmtree(self.database_dir)
+
+    def subscribe(self, notify_dir, on_change=None):
+        subscriber = notifications.Subscriber(self.database_file, notify_dir, on_change)
+        self.addCleanup(subscriber.close)
+        return subscriber
+
+    def publisher(self, notify_dir):
+        publisher = notifications.Publisher(self.database_file, notify_dir)
+        self.addCleanup(publisher.close)
+        return publisher
+
+    def wait_for_version(self, subscriber, version):
+        for _ in range(100):
+            if subscriber.version == version:
+                return
+            time.sleep(0.01)
+        self.fail(f"Version {version} not received")
+
+    def test_committed_cycle_invalidates_cached_reads(self):
+        saved = {name: getattr(app, name) for name in ('commit_subscriber', 'db_cache_version')}
+        self.addCleanup(vars(app).update, saved)
+        self.addCleanup(app.db_cache.clear)
+        app.db_cache.clear()
+        app.commit_subscriber = self.subscribe(self.notify_dir, app.drop_db_cache)
+        self.assertIsNotNone(app.commit_subscriber.sock)
+        publisher = self.publisher(self.notify_dir)
+
+        self.wait_for_version(app.commit_subscriber, publisher.publish(100))
+        self.assertEqual(app.cached_read('bets', lambda: 'cycle 100'), 'cycle 100')
+        self.assertEqual(app.cached_read('bets', lambda: 'not read'), 'cycle 100')
+
+        # Announced on the socket, not found by a check of the version file
+        with mock.patch.object(notifications, 'NOTIFY_CHECK_INTERVAL', 3600):
+            self.wait_for_version(app.commit_subscriber, publisher.publish(101))
+            self.assertEqual(app.commit_subscriber.tick_number, 101)
+            self.assertEqual(app.cached_read('bets', lambda: 'cycle 101'), 'cycle 101')
+
+    def test_dead_socket_is_removed(self):
+        subscriber = self.subscribe(self.notify_dir)
+        # Bound by a process that exited without removing it
+        dead_socket_file = os.path.join(self.notify_dir, f"app-0{notifications.SOCKET_SUFFIX}")
+        dead_sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        dead_sock.bind(dead_socket_file)
+        dead_sock.close()
+
+        version = self.publisher(self.notify_dir).publish(100)
+        self.assertFalse(os.path.exists(dead_socket_file))
+        self.assertTrue(os.path.exists(subscriber.socket_file))
+        self.wait_for_version(subscriber, version)
+
+    def test_version_file_without_notify_dir(self):
+        publisher = self.publisher('')
+        subscriber = self.subscribe('')
+        self.assertIsNone(subscriber.sock)
+        self.assertIsNone(subscriber.current_version())
+        self.assertEqual(os.listdir(self.database_dir), [])
+
+        version = publisher.publish(100)
+        self.assertEqual(os.listdir(self.database_dir), [os.path.basename(self.database_file) + '.version'])
+        # Checked on each call without a socket
+        self.assertEqual(subscriber.current_version(), version)
+        self.assertEqual(subscriber.tick_number, 100)
+        version = publisher.publish(101)
+        self.assertEqual(subscriber.current_version(), version)
+        self.assertEqual(subscriber.tick_number, 101)
+
+        # A subscriber started after the cycle reads it from the version file
+        self.assertEqual(self.subscribe('').current_version(), version)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,214 @@
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from quottery_rpc_wrapper import LATENCY_BUCKETS
+
+# Phases of an update cycle, in their running order
+CYCLE_PHASES = ('active_list', 'bet_info', 'basic_info', 'option_details', 'pipeline', 'db_write', 'archive', 'publish',
+                'materialize', 'backup')
+# Upper bounds of the cycle duration histogram buckets, in seconds
+CYCLE_DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Number of cycles kept in memory for /metrics.json
+METRICS_HISTORY = 100
+
+
+def bucket_index(value, bounds):
+    """ Index of the histogram bucket of a value. The last bucket counts the values above all the bounds """
+    index = 0
+    while index < len(bounds) and value > bounds[index]:
+        index += 1
+    return index
+
+
+class CycleMetrics:
+    """ Measures of a single update cycle """
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.phases = {phase: 0.0 for phase in CYCLE_PHASES}
+        self.tick_number = 0
+        self.chain_tick = 0
+        self.rows_inserted = 0
+        self.rows_updated = 0
+        self.rows_skipped = 0
+        self.rpc_stats = {}
+
+    @contextmanager
+    def phase(self, name):
+        """ Add the time spent in the block to the duration of a phase """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def finish(self, rpc_stats):
+        """ Stop the cycle clock and attach the RPC statistics of the cycle """
+        self.duration = time.perf_counter() - self.start
+        self.rpc_stats = rpc_stats
+
+    @property
+    def tick_lag(self):
+        """ Number of ticks the database is behind the chain. 0 if one of them is unknown """
+        if not self.chain_tick or not self.tick_number:
+            return 0
+        return max(0, self.chain_tick - self.tick_number)
+
+    def to_dict(self):
+        return {
+            'cycle_time': self.start_time,
+            'tick_number': self.tick_number,
+            'chain_tick': self.chain_tick,
+            'tick_lag': self.tick_lag,
+            'duration': self.duration,
+            'phases': dict(self.phases),
+            'rows_inserted': self.rows_inserted,
+            'rows_updated': self.rows_updated,
+            'rows_skipped': self.rows_skipped,
+            'rpc_count': sum(stats['count'] for stats in self.rpc_stats.values()),
+            'rpc_errors': sum(stats['errors'] for stats in self.rpc_stats.values()),
+            'bytes_received': sum(stats['bytes'] for stats in self.rpc_stats.values()),
+            'rpc_stats': self.rpc_stats,
+        }
+
+
+class MetricsRegistry:
+    """ Recent cycles and cumulative counters of the updater, rendered for the metrics port """
+
+    def __init__(self, history=METRICS_HISTORY):
+        self.lock = threading.Lock()
+        self.cycles = deque(maxlen=history)
+        self.cycle_count = 0
+        self.cycle_duration_sum = 0.0
+        self.cycle_duration_buckets = [0] * (len(CYCLE_DURATION_BUCKETS) + 1)
+        self.phase_sums = {phase: 0.0 for phase in CYCLE_PHASES}
+        self.rows = {'inserted': 0, 'updated': 0, 'skipped': 0}
+        self.rpc = {}
+
+    def record(self, cycle):
+        """ Add a finished cycle to the registry """
+        with self.lock:
+            self.cycles.append(cycle.to_dict())
+            self.cycle_count += 1
+            self.cycle_duration_sum += cycle.duration
+            self.cycle_duration_buckets[bucket_index(cycle.duration, CYCLE_DURATION_BUCKETS)] += 1
+            for phase, duration in cycle.phases.items():
+                self.phase_sums[phase] = self.phase_sums.get(phase, 0.0) + duration
+            self.rows['inserted'] += cycle.rows_inserted
+            self.rows['updated'] += cycle.rows_updated
+            self.rows['skipped'] += cycle.rows_skipped
+            for name, stats in cycle.rpc_stats.items():
+                rpc = self.rpc.setdefault(name, {
+                    'count': 0, 'errors': 0, 'total': 0.0, 'bytes': 0, 'decode': 0.0,
+                    'buckets': [0] * (len(LATENCY_BUCKETS) + 1)})
+                for key in ('count', 'errors', 'total', 'bytes', 'decode'):
+                    rpc[key] += stats[key]
+                rpc['buckets'] = [a + b for a, b in zip(rpc['buckets'], stats['buckets'])]
+
+    def render_json(self):
+        with self.lock:
+            return json.dumps({'cycles': list(self.cycles)})
+
+    def render_prometheus(self):
+        """ Render the counters in the Prometheus text format """
+        with self.lock:
+            lines = []
+            last = self.cycles[-1] if self.cycles else None
+
+            lines.append('# TYPE qtry_updater_cycle_duration_seconds histogram')
+            lines.extend(histogram_lines('qtry_updater_cycle_duration_seconds', '', CYCLE_DURATION_BUCKETS,
+                                         self.cycle_duration_buckets, self.cycle_duration_sum))
+
+            lines.append('# TYPE qtry_updater_phase_seconds_total counter')
+            for phase, duration in self.phase_sums.items():
+                lines.append(f'qtry_updater_phase_seconds_total{{phase="{phase}"}} {duration}')
+
+            lines.append('# TYPE qtry_updater_rows_total counter')
+            for kind, count in self.rows.items():
+                lines.append(f'qtry_updater_rows_total{{kind="{kind}"}} {count}')
+
+            lines.append('# TYPE qtry_updater_rpc_latency_seconds histogram')
+            for name, rpc in self.rpc.items():
+                lines.extend(histogram_lines('qtry_updater_rpc_latency_seconds', f'request="{name}"',
+                                             LATENCY_BUCKETS, rpc['buckets'], rpc['total']))
+            lines.append('# TYPE qtry_updater_rpc_errors_total counter')
+            for name, rpc in self.rpc.items():
+                lines.append(f'qtry_updater_rpc_errors_total{{request="{name}"}} {rpc["errors"]}')
+            lines.append('# TYPE qtry_updater_rpc_received_bytes_total counter')
+            for name, rpc in self.rpc.items():
+                lines.append(f'qtry_updater_rpc_received_bytes_total{{request="{name}"}} {rpc["bytes"]}')
+            lines.append('# TYPE qtry_updater_rpc_decode_seconds_total counter')
+            for name, rpc in self.rpc.items():
+                lines.append(f'qtry_updater_rpc_decode_seconds_total{{request="{name}"}} {rpc["decode"]}')
+
+            if last:
+                lines.append('# TYPE qtry_updater_db_tick gauge')
+                lines.append(f'qtry_updater_db_tick {last["tick_number"]}')
+                lines.append('# TYPE qtry_updater_chain_tick gauge')
+                lines.append(f'qtry_updater_chain_tick {last["chain_tick"]}')
+                lines.append('# TYPE qtry_updater_tick_lag gauge')
+                lines.append(f'qtry_updater_tick_lag {last["tick_lag"]}')
+                lines.append('# TYPE qtry_updater_last_cycle_timestamp_seconds gauge')
+                lines.append(f'qtry_updater_last_cycle_timestamp_seconds {last["cycle_time"]}')
+            return '\n'.join(lines) + '\n'
+
+
+def histogram_lines(metric, labels, bounds, buckets, total):
+    """ Lines of a Prometheus histogram from per-bucket (non cumulative) counts """
+    separator = ',' if labels else ''
+    lines = []
+    cumulative = 0
+    for bound, count in zip(bounds, buckets):
+        cumulative += count
+        lines.append(f'{metric}_bucket{{{labels}{separator}le="{bound}"}} {cumulative}')
+    cumulative += buckets[-1]
+    lines.append(f'{metric}_bucket{{{labels}{separator}le="+Inf"}} {cumulative}')
+    lines.append(f'{metric}_sum{{{labels}}} {total}' if labels else f'{metric}_sum {total}')
+    lines.append(f'{metric}_count{{{labels}}} {cumulative}' if labels else f'{metric}_count {cumulative}')
+    return lines
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = None
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            body = self.registry.render_prometheus().encode()
+            content_type = 'text/plain; version=0.0.4'
+        elif self.path == '/metrics.json':
+            body = self.registry.render_json().encode()
+            content_type = 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are too frequent to be logged
+        pass
+
+
+def start_metrics_server(registry, port, host='127.0.0.1'):
+    """
+    Serve the registry on /metrics (Prometheus text) and /metrics.json in a background thread.
+
+    :param registry: The MetricsRegistry to expose.
+    :param port: Local port of the metrics server.
+    :param host: Interface to listen on. Only local by default.
+    :return: The running server.
+    """
+    handler = type('BoundMetricsHandler', (MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server